@@ -0,0 +1,106 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# BER encoding of SNMPv2c responses out of pre-encoded var-binds
+#
+import weakref
+
+from pyasn1.codec.ber import encoder
+
+SEQUENCE_TAG = b"\x30"
+INTEGER_TAG = b"\x02"
+OCTET_STRING_TAG = b"\x04"
+RESPONSE_PDU_TAG = b"\xa2"
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes((length,))
+
+    octets = length.to_bytes((length.bit_length() + 7) // 8, "big")
+
+    return bytes((0x80 | len(octets),)) + octets
+
+
+def encode_tlv(tag, value):
+    return tag + encode_length(len(value)) + value
+
+
+def encode_integer(value):
+    octets = value.to_bytes(
+        (value + (value < 0)).bit_length() // 8 + 1, "big", signed=True
+    )
+
+    return encode_tlv(INTEGER_TAG, octets)
+
+
+def encode_response(
+    version, community, request_id, error_status, error_index, var_binds
+):
+    """Encode SNMP response message out of encoded var-binds"""
+    pdu = (
+        encode_integer(request_id)
+        + encode_integer(error_status)
+        + encode_integer(error_index)
+        + encode_tlv(SEQUENCE_TAG, b"".join(var_binds))
+    )
+
+    return encode_tlv(
+        SEQUENCE_TAG,
+        encode_integer(version)
+        + encode_tlv(OCTET_STRING_TAG, community)
+        + encode_tlv(RESPONSE_PDU_TAG, pdu),
+    )
+
+
+class VarBindEncoder:
+    """Encode var-binds, reuse encodings while OID and value objects live
+
+    Static records of data files are served by the same OID and value
+    objects over and over again, so they are encoded just once. Values
+    produced by variation modules are new objects each time, their
+    encodings are dropped along with them.
+    """
+
+    def __init__(self):
+        self._encodings = {}
+
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._encodings)
+
+    def encode(self, oid, value):
+        key = id(oid), id(value)
+
+        try:
+            oid_ref, value_ref, encoding = self._encodings[key]
+
+        except KeyError:
+            pass
+
+        else:
+            if oid_ref() is oid and value_ref() is value:
+                self.hits += 1
+                return encoding
+
+        self.misses += 1
+
+        encoding = encode_tlv(SEQUENCE_TAG, encoder.encode(oid) + encoder.encode(value))
+
+        def forget(ref, key=key):
+            entry = self._encodings.get(key)
+
+            if entry and (entry[0] is ref or entry[1] is ref):
+                del self._encodings[key]
+
+        self._encodings[key] = (
+            weakref.ref(oid, forget),
+            weakref.ref(value, forget),
+            encoding,
+        )
+
+        return encoding
@@ -0,0 +1,105 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Least recently used caches
+#
+import collections
+
+
+class LruCache:
+    """Entries of bounded total weight, least recently used get dropped first
+
+    Each entry weighs one unless added with another weight. Hits,
+    misses and evictions are counted, their changes are reported as
+    activity metrics named after `metrics_prefix`.
+    """
+
+    def __init__(self, max_size, metrics_prefix="cache"):
+        self._entries = collections.OrderedDict()
+        self._metrics_prefix = metrics_prefix
+        self._reported = 0, 0, 0
+
+        self.max_size = max_size
+        self.size = 0
+
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def get(self, key):
+        """Return value of entry `key` or `None`, entry gets most recently used"""
+        try:
+            value, _ = self._entries[key]
+
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return value
+
+    def add(self, key, value, weight=1):
+        """Add or replace entry, unless it outweighs the whole cache"""
+        if weight > self.max_size:
+            return
+
+        self.discard(key)
+
+        self._entries[key] = value, weight
+        self.size += weight
+
+        self.evict()
+
+    def evict(self, weight=0):
+        """Drop least recently used entries till `weight` more fits in
+
+        Returns `(key, value)` pairs of dropped entries.
+        """
+        evicted = []
+
+        while self._entries and self.size + weight > self.max_size:
+            key, (value, entry_weight) = self._entries.popitem(last=False)
+
+            self.size -= entry_weight
+            self.evictions += 1
+
+            evicted.append((key, value))
+
+        return evicted
+
+    def discard(self, key):
+        try:
+            _, weight = self._entries.pop(key)
+
+        except KeyError:
+            return
+
+        self.size -= weight
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def metrics(self):
+        """Return counters changes since the last call"""
+        hits, misses, evictions = self._reported
+
+        self._reported = self.hits, self.misses, self.evictions
+
+        return {
+            "%s_hit_count" % self._metrics_prefix: self.hits - hits,
+            "%s_miss_count" % self._metrics_prefix: self.misses - misses,
+            "%s_eviction_count" % self._metrics_prefix: self.evictions - evictions,
+        }
@@ -0,0 +1,194 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# SNMP Simulator data file index builder
+#
+import argparse
+import os
+import sys
+import traceback
+
+from snmpsim import confdir
+from snmpsim import datafile
+from snmpsim import error
+from snmpsim import log
+from snmpsim import utils
+from snmpsim.record.search.database import IndexManifest
+
+DESCRIPTION = (
+    "Build SNMP simulation data file indices in advance. Online "
+    "documentation at https://www.pysnmp.com/snmpsim"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+
+    parser.add_argument("-v", "--version", action="version", version=utils.TITLE)
+
+    parser.add_argument(
+        "--logging-method",
+        type=lambda x: x.split(":"),
+        metavar="=<%s[:args]>]" % "|".join(log.METHODS_MAP),
+        default="stderr",
+        help="Logging method.",
+    )
+
+    parser.add_argument(
+        "--log-level",
+        choices=log.LEVELS_MAP,
+        type=str,
+        default="info",
+        help="Logging level.",
+    )
+
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        action="append",
+        metavar="<DIR>",
+        dest="data_dirs",
+        help="SNMP simulation data recordings directory.",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        metavar="<DIR>",
+        type=str,
+        help="Location for SNMP simulation data file indices to create",
+    )
+
+    parser.add_argument(
+        "--workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=0,
+        help="Number of processes building simulation data files indices, "
+        "0 stands for the number of CPUs",
+    )
+
+    parser.add_argument(
+        "--force-index-rebuild",
+        action="store_true",
+        help="Rebuild simulation data files indices even if they seem up to date",
+    )
+
+    parser.add_argument(
+        "--validate-data",
+        action="store_true",
+        help="Validate simulation data files along with indexing",
+    )
+
+    parser.add_argument(
+        "--validation-report",
+        metavar="<FILE>",
+        type=str,
+        help="Write simulation data validation errors into this file in JSON",
+    )
+
+    args = parser.parse_args()
+
+    if args.cache_dir:
+        confdir.cache = args.cache_dir
+
+    proc_name = os.path.basename(sys.argv[0])
+
+    try:
+        log.set_logger(proc_name, *args.logging_method, force=True)
+
+        if args.log_level:
+            log.set_level(args.log_level)
+
+    except error.SnmpsimError as exc:
+        sys.stderr.write("%s\r\n" % exc)
+        parser.print_usage(sys.stderr)
+        return 1
+
+    if not os.path.exists(confdir.cache):
+        try:
+            os.makedirs(confdir.cache)
+
+        except OSError as exc:
+            log.error(
+                'failed to create cache directory "%s": %s' % (confdir.cache, exc)
+            )
+            return 1
+
+        else:
+            log.info('Cache directory "%s" created' % confdir.cache)
+
+    data_files = {}
+
+    for data_dir in args.data_dirs or confdir.data:
+        log.info('Scanning "%s" directory for data files...' % data_dir)
+
+        if not os.path.exists(data_dir):
+            log.info('Directory "%s" does not exist' % data_dir)
+            continue
+
+        for full_path, text_parser, _ in datafile.get_data_files(data_dir):
+            if full_path not in data_files:
+                data_files[full_path] = datafile.open_data_file(
+                    full_path, text_parser, {}
+                )
+
+    data_files = list(data_files.values())
+
+    try:
+        datafile.index_data_files(data_files, args.workers, args.force_index_rebuild)
+
+        if args.validate_data:
+            datafile.validate_data_files(
+                data_files, args.workers, args.validation_report
+            )
+
+        # overlays get their base data files indexed along
+        for data_file in list(data_files):
+            if data_file.layout == datafile.OverlayDataFile.layout:
+                if data_file.base_data_file not in data_files:
+                    data_files.append(data_file.base_data_file)
+
+        manifest = IndexManifest(confdir.cache).load()
+
+        for data_file in data_files:
+            manifest.add(
+                data_file.served_file, data_file.index_file, data_file.digest()
+            )
+
+        manifest.save()
+
+    except error.SnmpsimError as exc:
+        log.error(str(exc))
+        return 1
+
+    finally:
+        for data_file in data_files:
+            data_file.close()
+
+    log.info(
+        "%d data files indexed into %s, manifest "
+        "updated" % (len(data_files), confdir.cache)
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        rc = main()
+
+    except KeyboardInterrupt:
+        sys.stderr.write("shutting down process...")
+        rc = 0
+
+    except Exception:
+        sys.stderr.write("process terminated: %s" % sys.exc_info()[1])
+
+        for line in traceback.format_exception(*sys.exc_info()):
+            sys.stderr.write(line.replace("\n", ";"))
+        rc = 1
+
+    sys.exit(rc)
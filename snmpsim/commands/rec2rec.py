@@ -8,6 +8,7 @@
 #
 import argparse
 import functools
+import itertools
 import os
 import sys
 import traceback
@@ -26,7 +27,7 @@ from snmpsim.record import mvc
 from snmpsim.record import sap
 from snmpsim.record import snmprec
 from snmpsim.record import walk
-from snmpsim.record.search.file import get_record
+from snmpsim.record.search.file import RecordScanner
 
 
 class SnmprecRecordMixIn:
@@ -55,6 +56,12 @@ class CompressedSnmprecRecord(SnmprecRecordMixIn, snmprec.CompressedSnmprecRecor
     pass
 
 
+class BlockCompressedSnmprecRecord(
+    SnmprecRecordMixIn, snmprec.BlockCompressedSnmprecRecord
+):
+    pass
+
+
 # data file types and parsers
 RECORD_TYPES = {
     dump.DumpRecord.ext: dump.DumpRecord(),
@@ -63,6 +70,7 @@ RECORD_TYPES = {
     walk.WalkRecord.ext: walk.WalkRecord(),
     SnmprecRecord.ext: SnmprecRecord(),
     CompressedSnmprecRecord.ext: CompressedSnmprecRecord(),
+    BlockCompressedSnmprecRecord.ext: BlockCompressedSnmprecRecord(),
 }
 
 DESCRIPTION = (
@@ -248,12 +256,9 @@ def main():
 
         line_no = 0
 
-        while True:
-            line, rec_line_no, _ = get_record(input_file, line_no)
-
-            if not line:
-                break
-
+        for rec_line_no, _, line in itertools.chain.from_iterable(
+            RecordScanner(input_file)
+        ):
             if rec_line_no != line_no + 1:
                 if not args.quiet:
                     sys.stderr.write(
@@ -266,10 +271,10 @@ def main():
                         )
                     )
 
-                line_no = rec_line_no
-
                 lost_comments += 1
 
+            line_no = rec_line_no
+
             backdoor = {}
 
             try:
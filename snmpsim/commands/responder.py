@@ -26,6 +26,8 @@ from pysnmp.entity import config
 from pysnmp.entity import engine
 from pysnmp.entity.rfc3413 import cmdrsp
 from pysnmp.entity.rfc3413 import context
+from pysnmp.proto.api import v2c
+from pysnmp.smi import error as smi_error
 
 from snmpsim import confdir
 from snmpsim import controller
@@ -33,8 +35,10 @@ from snmpsim import daemon
 from snmpsim import datafile
 from snmpsim import endpoints
 from snmpsim import log
+from snmpsim import supervisor
 from snmpsim import utils
 from snmpsim import variation
+from snmpsim.cache import LruCache
 from snmpsim.error import NoDataNotification
 from snmpsim.error import SnmpsimError
 from snmpsim.reporting.manager import ReportingManager
@@ -69,24 +73,30 @@ DESCRIPTION = (
 
 V3_OPTIONS = "SNMPv3 options"
 
+# contexts resolved for request transport, address and context name
+CONTEXT_CACHE_SIZE = 1024
 
-def probe_hash_context(responder, snmp_engine):
-    """v3arch SNMP context name searcher"""
-    execCtx = snmp_engine.observer.getExecutionContext("rfc3412.receiveMessage:request")
 
-    (transport_domain, transport_address, context_engine_id, context_name) = (
-        execCtx["transportDomain"],
-        execCtx["transportAddress"],
-        execCtx["contextEngineId"],
-        execCtx["contextName"].prettyPrint(),
-    )
+class SnmpContext(context.SnmpContext):
+    """SNMP context names table remembering contexts resolved by requests"""
 
-    if context_engine_id == snmp_engine.snmpEngineID:
-        context_engine_id = datafile.SELF_LABEL
+    def __init__(self, snmpEngine, contextEngineId=None):
+        context.SnmpContext.__init__(self, snmpEngine, contextEngineId)
+        self.context_cache = LruCache(CONTEXT_CACHE_SIZE, "context_cache")
 
-    else:
-        context_engine_id = context_engine_id.prettyPrint()
+    def register_context_name(self, contextName, mibInstrum=None):
+        context.SnmpContext.register_context_name(self, contextName, mibInstrum)
+        self.context_cache.clear()
 
+    def unregister_context_name(self, contextName):
+        context.SnmpContext.unregister_context_name(self, contextName)
+        self.context_cache.clear()
+
+
+def _resolve_context(
+    snmp_context, transport_domain, transport_address, context_engine_id, context_name
+):
+    """Return data file context name candidate, context name and MIB instrum"""
     for candidate in datafile.probe_context(
         transport_domain, transport_address, context_engine_id, context_name
     ):
@@ -97,46 +107,94 @@ def probe_hash_context(responder, snmp_engine):
             probed_context_name = candidate
 
         try:
-            mib_instrum = responder.snmpContext.getMibInstrum(probed_context_name)
+            mib_instrum = snmp_context.get_mib_instrum(probed_context_name)
 
         except error.PySnmpError:
             pass
 
         else:
-            log.info(
-                "Using %s selected by candidate %s; transport ID %s, "
-                "source address %s, context engine ID %s, "
-                "community name "
-                '"%s"'
-                % (
-                    mib_instrum,
-                    candidate,
-                    univ.ObjectIdentifier(transport_domain),
-                    transport_address[0],
-                    context_engine_id,
-                    probed_context_name,
-                )
-            )
-            context_name = probed_context_name
-            break
+            return candidate, probed_context_name, mib_instrum
+
+    return None, context_name, snmp_context.get_mib_instrum(context_name)
+
+
+def probe_hash_context(responder, snmp_engine):
+    """v3arch SNMP context name searcher"""
+    execCtx = snmp_engine.observer.get_execution_context(
+        "rfc3412.receiveMessage:request"
+    )
+
+    (transport_domain, transport_address, context_engine_id, context_name) = (
+        execCtx["transportDomain"],
+        execCtx["transportAddress"],
+        execCtx["contextEngineId"],
+        execCtx["contextName"],
+    )
+
+    context_cache = responder.snmpContext.context_cache
+
+    key = (
+        transport_domain,
+        transport_address[0],
+        context_engine_id.asOctets(),
+        context_name.asOctets(),
+    )
+
+    if context_engine_id == snmp_engine.snmpEngineID:
+        context_engine_label = datafile.SELF_LABEL
+
     else:
-        mib_instrum = responder.snmpContext.getMibInstrum(context_name)
-        log.info(
+        context_engine_label = log.Lazy(context_engine_id.prettyPrint)
+
+    resolution = context_cache.get(key)
+
+    if resolution is None:
+        resolution = _resolve_context(
+            responder.snmpContext,
+            transport_domain,
+            transport_address,
+            str(context_engine_label),
+            context_name.prettyPrint(),
+        )
+
+        context_cache.add(key, resolution)
+
+    candidate, context_name, mib_instrum = resolution
+
+    if candidate is None:
+        log.event(
+            "context",
             'Using %s selected by contextName "%s", transport ID %s, '
-            "source address %s"
-            % (
-                mib_instrum,
-                context_name,
-                univ.ObjectIdentifier(transport_domain),
-                transport_address[0],
-            )
+            "source address %s",
+            mib_instrum,
+            context_name,
+            log.Lazy(univ.ObjectIdentifier, transport_domain),
+            transport_address[0],
+        )
+
+    else:
+        log.event(
+            "context",
+            "Using %s selected by candidate %s; transport ID %s, "
+            "source address %s, context engine ID %s, "
+            'community name "%s"',
+            mib_instrum,
+            candidate,
+            log.Lazy(univ.ObjectIdentifier, transport_domain),
+            transport_address[0],
+            context_engine_label,
+            context_name,
         )
 
     if not isinstance(
         mib_instrum,
         (controller.MibInstrumController, controller.DataIndexInstrumController),
     ):
-        log.error("LCD access denied (contextName does not match any data file)")
+        log.event(
+            "failure",
+            "LCD access denied (contextName does not match any data file)",
+            level=log.LOG_ERROR,
+        )
         raise NoDataNotification()
 
     return context_name
@@ -145,81 +203,101 @@ def probe_hash_context(responder, snmp_engine):
 class GetCommandResponder(cmdrsp.GetCommandResponder):
     """v3arch GET command handler"""
 
-    def handleMgmtOperation(
-        self, snmp_engine, state_reference, context_name, pdu, ac_info
+    def handle_management_operation(
+        self, snmp_engine, state_reference, context_name, pdu
     ):
         try:
-            cmdrsp.GetCommandResponder.handleMgmtOperation(
+            cmdrsp.GetCommandResponder.handle_management_operation(
                 self,
                 snmp_engine,
                 state_reference,
                 probe_hash_context(self, snmp_engine),
                 pdu,
-                (None, snmp_engine),  # custom acInfo
             )
 
         except NoDataNotification:
-            self.releaseStateInformation(state_reference)
+            self.release_state_information(state_reference)
 
 
 class SetCommandResponder(cmdrsp.SetCommandResponder):
     """v3arch SET command handler"""
 
-    def handleMgmtOperation(
-        self, snmp_engine, state_reference, context_name, pdu, ac_info
+    def handle_management_operation(
+        self, snmp_engine, state_reference, context_name, pdu
     ):
         try:
-            cmdrsp.SetCommandResponder.handleMgmtOperation(
+            cmdrsp.SetCommandResponder.handle_management_operation(
                 self,
                 snmp_engine,
                 state_reference,
                 probe_hash_context(self, snmp_engine),
                 pdu,
-                (None, snmp_engine),  # custom acInfo
             )
 
         except NoDataNotification:
-            self.releaseStateInformation(state_reference)
+            self.release_state_information(state_reference)
 
 
 class NextCommandResponder(cmdrsp.NextCommandResponder):
     """v3arch GETNEXT command handler"""
 
-    def handleMgmtOperation(
-        self, snmp_engine, state_reference, context_name, pdu, ac_info
+    def handle_management_operation(
+        self, snmp_engine, state_reference, context_name, pdu
     ):
         try:
-            cmdrsp.NextCommandResponder.handleMgmtOperation(
+            cmdrsp.NextCommandResponder.handle_management_operation(
                 self,
                 snmp_engine,
                 state_reference,
                 probe_hash_context(self, snmp_engine),
                 pdu,
-                (None, snmp_engine),  # custom acInfo
             )
 
         except NoDataNotification:
-            self.releaseStateInformation(state_reference)
+            self.release_state_information(state_reference)
 
 
 class BulkCommandResponder(cmdrsp.BulkCommandResponder):
     """v3arch GETBULK command handler"""
 
-    def handleMgmtOperation(
-        self, snmp_engine, state_reference, context_name, pdu, ac_info
+    def handle_management_operation(
+        self, snmp_engine, state_reference, context_name, pdu
     ):
         try:
-            cmdrsp.BulkCommandResponder.handleMgmtOperation(
-                self,
-                snmp_engine,
-                state_reference,
-                probe_hash_context(self, snmp_engine),
-                pdu,
-                (None, snmp_engine),  # custom acInfo
+            context_name = probe_hash_context(self, snmp_engine)
+
+        except NoDataNotification:
+            self.release_state_information(state_reference)
+            return
+
+        mib_instrum = self.snmpContext.get_mib_instrum(context_name)
+
+        # data files walk forward by themselves
+        if not hasattr(mib_instrum, "read_bulk_variables"):
+            return cmdrsp.BulkCommandResponder.handle_management_operation(
+                self, snmp_engine, state_reference, context_name, pdu
+            )
+
+        try:
+            var_binds = mib_instrum.read_bulk_variables(
+                v2c.apiBulkPDU.get_non_repeaters(pdu),
+                v2c.apiBulkPDU.get_max_repetitions(pdu),
+                self.max_varbinds,
+                *v2c.apiPDU.get_varbinds(pdu),
+                snmpEngine=snmp_engine,
+                acFun=self.verify_access,
+                cbCtx=self.cbCtx,
             )
 
         except NoDataNotification:
-            self.releaseStateInformation(state_reference)
+            self.release_state_information(state_reference)
+            return
+
+        if not var_binds:
+            raise smi_error.SmiError()
+
+        self.send_varbinds(snmp_engine, state_reference, 0, 0, var_binds)
+        self.release_state_information(state_reference)
 
 
 def _parse_sized_string(arg, min_length=8):
@@ -286,6 +364,16 @@ def main():
         help="Logging level.",
     )
 
+    parser.add_argument(
+        "--log-event-limit",
+        metavar="<event>:<sample>[:<rate>]",
+        action="append",
+        type=str,
+        default=[],
+        help="Log just every <sample>-th event of request processing stage, "
+        "no more than <rate> events a second.",
+    )
+
     parser.add_argument(
         "--reporting-method",
         type=lambda x: x.split(":"),
@@ -341,6 +429,88 @@ def main():
         help="Validate simulation data files on daemon start-up",
     )
 
+    parser.add_argument(
+        "--validation-workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=0,
+        help="Number of processes validating simulation data files, "
+        "0 stands for the number of CPUs",
+    )
+
+    parser.add_argument(
+        "--validation-report",
+        metavar="<FILE>",
+        type=str,
+        help="Write simulation data validation errors into this file in JSON",
+    )
+
+    parser.add_argument(
+        "--preload-data",
+        action="store_true",
+        help="Compile simulation data files into memory on daemon start-up",
+    )
+
+    parser.add_argument(
+        "--index-workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=1,
+        help="Number of processes building simulation data files indices, "
+        "0 stands for the number of CPUs",
+    )
+
+    parser.add_argument(
+        "--serve-while-indexing",
+        action="store_true",
+        help="Start answering requests right away, serve each simulation data "
+        "file as soon as its index is ready",
+    )
+
+    parser.add_argument(
+        "--workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=1,
+        help="Number of processes serving SNMP requests on the same endpoints",
+    )
+
+    parser.add_argument(
+        "--max-open-data-files",
+        metavar="<NUMBER>",
+        type=int,
+        default=0,
+        help="Number of simulation data files to keep open, least recently "
+        "used get closed first, 0 stands for open files limit permitted "
+        "number",
+    )
+
+    parser.add_argument(
+        "--data-check-interval",
+        metavar="<SECONDS>",
+        type=float,
+        default=1,
+        help="Check open simulation data files for changes at most this " "often",
+    )
+
+    parser.add_argument(
+        "--walk-cache-size",
+        metavar="<NUMBER>",
+        type=int,
+        default=datafile.WalkCache.DEFAULT_SIZE,
+        help="Number of walks per simulation data file to resume without "
+        "searching the index, 0 disables walk cache",
+    )
+
+    parser.add_argument(
+        "--value-cache-size",
+        metavar="<BYTES>",
+        type=int,
+        default=datafile.ValueCache.DEFAULT_SIZE,
+        help="Memory to take by evaluated static values of simulation data "
+        "files records, 0 disables value cache",
+    )
+
     parser.add_argument(
         "--variation-modules-dir",
         metavar="<DIR>",
@@ -551,6 +721,14 @@ configured automatically based on simulation data file paths relative to
     if args.cache_dir:
         confdir.cache = args.cache_dir
 
+    datafile.DataFile.handle_pool.configure(
+        args.max_open_data_files, args.data_check_interval
+    )
+
+    datafile.DataFile.walk_cache_size = max(0, args.walk_cache_size)
+
+    datafile.DataFile.value_cache.configure(max(0, args.value_cache_size))
+
     if args.variation_modules_dir:
         confdir.variation = args.variation_modules_dir
 
@@ -581,6 +759,9 @@ configured automatically based on simulation data file paths relative to
             if args.log_level:
                 log.set_level(args.log_level)
 
+            for event_limit in args.log_event_limit:
+                log.set_event_limit(event_limit)
+
         except SnmpsimError as exc:
             sys.stderr.write("%s\r\n" % exc)
             snmp_helper.print_usage(sys.stderr)
@@ -621,9 +802,6 @@ configured automatically based on simulation data file paths relative to
         confdir.variation, variation_modules_options
     )
 
-    with daemon.PrivilegesOf(args.process_user, args.process_group):
-        variation.initialize_variation_modules(variation_modules, mode="variating")
-
     def configure_managed_objects(
         data_dirs, data_index_instrum_controller, snmp_engine=None, snmp_context=None
     ):
@@ -631,6 +809,7 @@ configured automatically based on simulation data file paths relative to
 
         _mib_instrums = {}
         _data_files = {}
+        _new_data_files = []
 
         for dataDir in data_dirs:
             log.info(
@@ -669,10 +848,10 @@ configured automatically based on simulation data file paths relative to
                     log.info(f"Configuring *shared* {mib_instrum}")
 
                 else:
-                    data_file = datafile.DataFile(
+                    data_file = datafile.open_data_file(
                         full_path, text_parser, variation_modules
                     )
-                    data_file.index_text(args.force_index_rebuild, args.validate_data)
+                    _new_data_files.append(data_file)
 
                     MibController = controller.MIB_CONTROLLERS[data_file.layout]
                     mib_instrum = MibController(data_file)
@@ -720,16 +899,88 @@ configured automatically based on simulation data file paths relative to
 
             log.msg.dec_ident()
 
+        datafile.index_data_files(
+            _new_data_files,
+            args.index_workers,
+            args.force_index_rebuild,
+            background=args.serve_while_indexing and args.workers < 2,
+        )
+
+        if args.validate_data:
+            datafile.validate_data_files(
+                _new_data_files, args.validation_workers, args.validation_report
+            )
+
+        if args.preload_data:
+            for data_file in _new_data_files:
+                data_file.preload()
+
         del _mib_instrums
         del _data_files
+        del _new_data_files
+
+    # workers share data files indexed once, but nothing else
+    if args.workers > 1:
+        _data_files = {}
+
+        for dataDir in [opt[1] for opt in snmp_args if opt[0] == "--data-dir"] or (
+            confdir.data
+        ):
+            if not os.path.exists(dataDir):
+                continue
+
+            for full_path, text_parser, _ in datafile.get_data_files(dataDir):
+                if full_path not in _data_files:
+                    _data_files[full_path] = datafile.open_data_file(
+                        full_path, text_parser, variation_modules
+                    )
+
+        with daemon.PrivilegesOf(args.process_user, args.process_group):
+            datafile.index_data_files(
+                list(_data_files.values()),
+                args.index_workers,
+                args.force_index_rebuild,
+            )
+
+            if args.validate_data:
+                datafile.validate_data_files(
+                    list(_data_files.values()),
+                    args.validation_workers,
+                    args.validation_report,
+                )
+
+        for data_file in _data_files.values():
+            data_file.close()
+
+        del _data_files
+
+        args.force_index_rebuild = args.validate_data = False
+
+        rc = supervisor.fork_workers(args.workers)
+
+        if rc is not None:
+            return rc
+
+    with daemon.PrivilegesOf(args.process_user, args.process_group):
+        variation.initialize_variation_modules(variation_modules, mode="variating")
 
     # Bind transport endpoints
     for idx, opt in enumerate(snmp_args):
         if opt[0] == "--agent-udpv4-endpoint":
-            snmp_args[idx] = (opt[0], endpoints.IPv4TransportEndpoints().add(opt[1]))
+            snmp_args[idx] = (
+                opt[0],
+                endpoints.IPv4TransportEndpoints(reuse_port=args.workers > 1).add(
+                    opt[1]
+                ),
+            )
 
         elif opt[0] == "--agent-udpv6-endpoint":
-            snmp_args[idx] = (opt[0], endpoints.IPv6TransportEndpoints().add(opt[1]))
+            snmp_args[idx] = (
+                opt[0],
+                endpoints.IPv6TransportEndpoints(reuse_port=args.workers > 1).add(
+                    opt[1]
+                ),
+            )
 
     # Start configuring SNMP engine(s)
 
@@ -774,9 +1025,7 @@ configured automatically based on simulation data file paths relative to
                 log.info("--- Simulation data recordings configuration")
 
                 for v3_context_engine_id, ctx_data_dirs in v3_context_engine_ids:
-                    snmp_context = context.SnmpContext(
-                        snmp_engine, v3_context_engine_id
-                    )
+                    snmp_context = SnmpContext(snmp_engine, v3_context_engine_id)
                     # unregister default context
                     snmp_context.unregister_context_name(b"")
 
@@ -948,7 +1197,7 @@ configured automatically based on simulation data file paths relative to
                 NextCommandResponder(snmp_engine, snmp_context)
                 BulkCommandResponder(
                     snmp_engine, snmp_context
-                ).maxVarBinds = local_max_var_binds
+                ).max_varbinds = local_max_var_binds
 
                 log.msg.dec_ident()
 
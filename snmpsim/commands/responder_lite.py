@@ -8,6 +8,7 @@
 #
 import argparse
 import asyncio
+import functools
 import os
 import sys
 import traceback
@@ -24,14 +25,17 @@ from pysnmp.proto import api
 from pysnmp.proto import rfc1902
 from pysnmp.proto import rfc1905
 
+from snmpsim import ber
 from snmpsim import confdir
 from snmpsim import controller
 from snmpsim import daemon
 from snmpsim import datafile
 from snmpsim import endpoints
 from snmpsim import log
+from snmpsim import supervisor
 from snmpsim import utils
 from snmpsim import variation
+from snmpsim.cache import LruCache
 from snmpsim.error import NoDataNotification
 from snmpsim.error import SnmpsimError
 from snmpsim.reporting.manager import ReportingManager
@@ -49,6 +53,9 @@ DESCRIPTION = (
     "or via variation modules."
 )
 
+# communities resolved for request transport and address
+CONTEXT_CACHE_SIZE = 1024
+
 
 def main():
     # Python 3.14+ no longer auto-creates a default event loop.
@@ -99,6 +106,16 @@ def main():
         help="Logging level.",
     )
 
+    parser.add_argument(
+        "--log-event-limit",
+        metavar="<event>:<sample>[:<rate>]",
+        action="append",
+        type=str,
+        default=[],
+        help="Log just every <sample>-th event of request processing stage, "
+        "no more than <rate> events a second.",
+    )
+
     parser.add_argument(
         "--reporting-method",
         type=lambda x: x.split(":"),
@@ -154,6 +171,94 @@ def main():
         help="Validate simulation data files on daemon start-up",
     )
 
+    parser.add_argument(
+        "--validation-workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=0,
+        help="Number of processes validating simulation data files, "
+        "0 stands for the number of CPUs",
+    )
+
+    parser.add_argument(
+        "--validation-report",
+        metavar="<FILE>",
+        type=str,
+        help="Write simulation data validation errors into this file in JSON",
+    )
+
+    parser.add_argument(
+        "--preload-data",
+        action="store_true",
+        help="Compile simulation data files into memory on daemon start-up",
+    )
+
+    parser.add_argument(
+        "--index-workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=1,
+        help="Number of processes building simulation data files indices, "
+        "0 stands for the number of CPUs",
+    )
+
+    parser.add_argument(
+        "--serve-while-indexing",
+        action="store_true",
+        help="Start answering requests right away, serve each simulation data "
+        "file as soon as its index is ready",
+    )
+
+    parser.add_argument(
+        "--workers",
+        metavar="<NUMBER>",
+        type=int,
+        default=1,
+        help="Number of processes serving SNMP requests on the same endpoints",
+    )
+
+    parser.add_argument(
+        "--max-open-data-files",
+        metavar="<NUMBER>",
+        type=int,
+        default=0,
+        help="Number of simulation data files to keep open, least recently "
+        "used get closed first, 0 stands for open files limit permitted "
+        "number",
+    )
+
+    parser.add_argument(
+        "--data-check-interval",
+        metavar="<SECONDS>",
+        type=float,
+        default=1,
+        help="Check open simulation data files for changes at most this often",
+    )
+
+    parser.add_argument(
+        "--walk-cache-size",
+        metavar="<NUMBER>",
+        type=int,
+        default=datafile.WalkCache.DEFAULT_SIZE,
+        help="Number of walks per simulation data file to resume without "
+        "searching the index, 0 disables walk cache",
+    )
+
+    parser.add_argument(
+        "--value-cache-size",
+        metavar="<BYTES>",
+        type=int,
+        default=datafile.ValueCache.DEFAULT_SIZE,
+        help="Memory to take by evaluated static values of simulation data "
+        "files records, 0 disables value cache",
+    )
+
+    parser.add_argument(
+        "--cache-encoded-var-binds",
+        action="store_true",
+        help="Encode SNMPv2c responses out of var-binds encoded beforehand",
+    )
+
     parser.add_argument(
         "--variation-modules-dir",
         metavar="<DIR>",
@@ -242,6 +347,14 @@ def main():
     if args.cache_dir:
         confdir.cache = args.cache_dir
 
+    datafile.DataFile.handle_pool.configure(
+        args.max_open_data_files, args.data_check_interval
+    )
+
+    datafile.DataFile.walk_cache_size = max(0, args.walk_cache_size)
+
+    datafile.DataFile.value_cache.configure(max(0, args.value_cache_size))
+
     if args.variation_modules_dir:
         confdir.variation = args.variation_modules_dir
 
@@ -258,6 +371,9 @@ def main():
             if args.log_level:
                 log.set_level(args.log_level)
 
+            for event_limit in args.log_event_limit:
+                log.set_event_limit(event_limit)
+
         except SnmpsimError as exc:
             sys.stderr.write("%s\r\n" % exc)
             parser.print_usage(sys.stderr)
@@ -298,9 +414,6 @@ def main():
         confdir.variation, variation_modules_options
     )
 
-    with daemon.PrivilegesOf(args.process_user, args.process_group):
-        variation.initialize_variation_modules(variation_modules, mode="variating")
-
     def configure_managed_objects(
         data_dirs, data_index_instrum_controller, snmp_engine=None, snmp_context=None
     ):
@@ -308,6 +421,7 @@ def main():
 
         _mib_instrums = {}
         _data_files = {}
+        _new_data_files = []
 
         for dataDir in data_dirs:
             log.info(
@@ -346,10 +460,10 @@ def main():
                     log.info(f"Configuring *shared* {mib_instrum}")
 
                 else:
-                    data_file = datafile.DataFile(
+                    data_file = datafile.open_data_file(
                         full_path, text_parser, variation_modules
                     )
-                    data_file.index_text(args.force_index_rebuild, args.validate_data)
+                    _new_data_files.append(data_file)
 
                     MibController = controller.MIB_CONTROLLERS[data_file.layout]
                     mib_instrum = MibController(data_file)
@@ -362,13 +476,31 @@ def main():
                 log.info(f"SNMPv1/2c community name: {community_name}")
 
                 contexts[univ.OctetString(community_name)] = mib_instrum
+                context_cache.clear()
 
                 data_index_instrum_controller.add_data_file(full_path, community_name)
 
             log.msg.dec_ident()
 
+        datafile.index_data_files(
+            _new_data_files,
+            args.index_workers,
+            args.force_index_rebuild,
+            background=args.serve_while_indexing and args.workers < 2,
+        )
+
+        if args.validate_data:
+            datafile.validate_data_files(
+                _new_data_files, args.validation_workers, args.validation_report
+            )
+
+        if args.preload_data:
+            for data_file in _new_data_files:
+                data_file.preload()
+
         del _mib_instrums
         del _data_files
+        del _new_data_files
 
     def get_bulk_handler(req_var_binds, non_repeaters, max_repetitions, read_next_vars):
         """Only v2c arch GETBULK handler"""
@@ -380,7 +512,7 @@ def main():
             M = min(M, int(args.max_var_binds / R))
 
         if N:
-            rsp_var_binds = read_next_vars(req_var_binds[:N])
+            rsp_var_binds = read_next_vars(*req_var_binds[:N])
 
         else:
             rsp_var_binds = []
@@ -388,12 +520,25 @@ def main():
         var_binds = req_var_binds[-R:]
 
         while M and R:
-            rsp_var_binds.extend(read_next_vars(var_binds))
+            rsp_var_binds.extend(read_next_vars(*var_binds))
             var_binds = rsp_var_binds[-R:]
             M -= 1
 
         return rsp_var_binds
 
+    def resolve_context(transport_domain, transport_address, community_name):
+        """Return the first context name candidate known, empty if none"""
+        for candidate in datafile.probe_context(
+            transport_domain,
+            transport_address,
+            context_engine_id=datafile.SELF_LABEL,
+            context_name=community_name,
+        ):
+            if candidate in contexts:
+                return candidate
+
+        return b""
+
     def commandResponderCbFun(
         transport_dispatcher, transport_domain, transport_address, whole_msg
     ):
@@ -401,102 +546,151 @@ def main():
         while whole_msg:
             msg_ver = api.decodeMessageVersion(whole_msg)
 
-            if msg_ver in api.protoModules:
-                p_mod = api.protoModules[msg_ver]
+            if msg_ver in api.PROTOCOL_MODULES:
+                p_mod = api.PROTOCOL_MODULES[msg_ver]
 
             else:
-                log.error(f"Unsupported SNMP version {msg_ver}")
+                log.event(
+                    "failure",
+                    "Unsupported SNMP version %s",
+                    msg_ver,
+                    level=log.LOG_ERROR,
+                )
                 return
 
             req_msg, whole_msg = decoder.decode(whole_msg, asn1Spec=p_mod.Message())
 
             community_name = req_msg.getComponentByPosition(1)
 
-            for candidate in datafile.probe_context(
-                transport_domain,
-                transport_address,
-                context_engine_id=datafile.SELF_LABEL,
-                context_name=community_name,
-            ):
-                if candidate in contexts:
-                    log.info(
-                        "Using %s selected by candidate %s; transport ID %s, "
-                        "source address %s, context engine ID <empty>, "
-                        "community name "
-                        '"%s"'
-                        % (
-                            contexts[candidate],
-                            candidate,
-                            univ.ObjectIdentifier(transport_domain),
-                            transport_address[0],
-                            community_name,
-                        )
-                    )
-                    community_name = candidate
-                    break
+            # context engine ID is always ours
+            key = transport_domain, transport_address[0], community_name.asOctets()
+
+            candidate = context_cache.get(key)
+
+            if candidate is None:
+                candidate = resolve_context(
+                    transport_domain, transport_address, community_name
+                )
+
+                context_cache.add(key, candidate)
+
+            if candidate:
+                log.event(
+                    "context",
+                    "Using %s selected by candidate %s; transport ID %s, "
+                    "source address %s, context engine ID <empty>, "
+                    'community name "%s"',
+                    contexts[candidate],
+                    candidate,
+                    log.Lazy(univ.ObjectIdentifier, transport_domain),
+                    transport_address[0],
+                    community_name,
+                )
+                community_name = candidate
 
             else:
-                log.error(
+                log.event(
+                    "failure",
                     "No data file selected for transport ID %s, source "
-                    "address %s, community name "
-                    '"%s"'
-                    % (
-                        univ.ObjectIdentifier(transport_domain),
-                        transport_address[0],
-                        community_name,
-                    )
+                    'address %s, community name "%s"',
+                    log.Lazy(univ.ObjectIdentifier, transport_domain),
+                    transport_address[0],
+                    community_name,
+                    level=log.LOG_ERROR,
                 )
                 return whole_msg
 
-            rsp_msg = p_mod.apiMessage.get_response(req_msg)
-            rsp_pdu = p_mod.apiMessage.get_pdu(rsp_msg)
             req_pdu = p_mod.apiMessage.get_pdu(req_msg)
 
+            mib_instrum = contexts[community_name]
+
             if req_pdu.isSameTypeWith(p_mod.GetRequestPDU()):
-                backend_fun = contexts[community_name].readVars
+                backend_fun = mib_instrum.read_variables
 
             elif req_pdu.isSameTypeWith(p_mod.SetRequestPDU()):
-                backend_fun = contexts[community_name].writeVars
+                backend_fun = mib_instrum.write_variables
 
             elif req_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
-                backend_fun = contexts[community_name].readNextVars
+                backend_fun = mib_instrum.read_next_variables
 
             elif hasattr(p_mod, "GetBulkRequestPDU") and req_pdu.isSameTypeWith(
                 p_mod.GetBulkRequestPDU()
             ):
                 if not msg_ver:
-                    log.info(
-                        "GETBULK over SNMPv1 from %s:%s"
-                        % (transport_domain, transport_address)
+                    log.event(
+                        "failure",
+                        "GETBULK over SNMPv1 from %s:%s",
+                        transport_domain,
+                        transport_address,
                     )
                     return whole_msg
 
-                def backend_fun(var_binds):
-                    return get_bulk_handler(
-                        var_binds,
-                        p_mod.apiBulkPDU.get_non_repeaters(req_pdu),
-                        p_mod.apiBulkPDU.get_max_repetitions(req_pdu),
-                        contexts[community_name].readNextVars,
+                non_repeaters = p_mod.apiBulkPDU.get_non_repeaters(req_pdu)
+                max_repetitions = p_mod.apiBulkPDU.get_max_repetitions(req_pdu)
+
+                # data files walk forward by themselves
+                if hasattr(mib_instrum, "read_bulk_variables"):
+                    backend_fun = functools.partial(
+                        mib_instrum.read_bulk_variables,
+                        non_repeaters,
+                        max_repetitions,
+                        args.max_var_binds,
                     )
 
+                else:
+
+                    def backend_fun(*var_binds):
+                        return get_bulk_handler(
+                            var_binds,
+                            non_repeaters,
+                            max_repetitions,
+                            mib_instrum.read_next_variables,
+                        )
+
             else:
-                log.error(
-                    "Unsupported PDU type %s from "
-                    "%s:%s"
-                    % (req_pdu.__class__.__name__, transport_domain, transport_address)
+                log.event(
+                    "failure",
+                    "Unsupported PDU type %s from %s:%s",
+                    req_pdu.__class__.__name__,
+                    transport_domain,
+                    transport_address,
+                    level=log.LOG_ERROR,
                 )
                 return whole_msg
 
             try:
-                var_binds = backend_fun(p_mod.apiPDU.get_varbinds(req_pdu))
+                var_binds = backend_fun(*p_mod.apiPDU.get_varbinds(req_pdu))
 
             except NoDataNotification:
                 return whole_msg
 
             except Exception as exc:
-                log.error("Ignoring SNMP engine failure: %s" % exc)
+                log.event(
+                    "failure",
+                    "Ignoring SNMP engine failure: %s",
+                    exc,
+                    level=log.LOG_ERROR,
+                )
                 return whole_msg
 
+            if var_bind_encoder and msg_ver == api.SNMP_VERSION_2C:
+                transport_dispatcher.send_message(
+                    ber.encode_response(
+                        msg_ver,
+                        p_mod.apiMessage.get_community(req_msg).asOctets(),
+                        int(p_mod.apiPDU.get_request_id(req_pdu)),
+                        0,
+                        0,
+                        [var_bind_encoder.encode(*var_bind) for var_bind in var_binds],
+                    ),
+                    transport_domain,
+                    transport_address,
+                )
+                continue
+
+            rsp_msg = p_mod.apiMessage.get_response(req_msg)
+            rsp_pdu = p_mod.apiMessage.get_pdu(rsp_msg)
+
             if not msg_ver:
                 for idx in range(len(var_binds)):
                     oid, val = var_binds[idx]
@@ -504,10 +698,10 @@ def main():
                     if val.tagSet in SNMP_2TO1_ERROR_MAP:
                         var_binds = p_mod.apiPDU.get_varbinds(req_pdu)
 
-                        p_mod.apiPDU.setErrorStatus(
+                        p_mod.apiPDU.set_error_status(
                             rsp_pdu, SNMP_2TO1_ERROR_MAP[val.tagSet]
                         )
-                        p_mod.apiPDU.setErrorIndex(rsp_pdu, idx + 1)
+                        p_mod.apiPDU.set_error_index(rsp_pdu, idx + 1)
 
                         break
 
@@ -527,14 +721,34 @@ def main():
 
     data_index_instrum_controller = controller.DataIndexInstrumController()
 
+    if args.cache_encoded_var_binds:
+        var_bind_encoder = ber.VarBindEncoder()
+
+    else:
+        var_bind_encoder = None
+
     contexts = {univ.OctetString("index"): data_index_instrum_controller}
 
+    # contexts resolved by requests, cleared on every change to `contexts`
+    context_cache = LruCache(CONTEXT_CACHE_SIZE, "context_cache")
+
     with daemon.PrivilegesOf(args.process_user, args.process_group):
         configure_managed_objects(
             args.data_dirs or confdir.data, data_index_instrum_controller
         )
 
     contexts["index"] = data_index_instrum_controller
+    context_cache.clear()
+
+    # workers share data files indexed once, but nothing else
+    if args.workers > 1:
+        rc = supervisor.fork_workers(args.workers)
+
+        if rc is not None:
+            return rc
+
+    with daemon.PrivilegesOf(args.process_user, args.process_group):
+        variation.initialize_variation_modules(variation_modules, mode="variating")
 
     # Configure socket server
     transport_dispatcher = AsyncioDispatcher()
@@ -544,11 +758,11 @@ def main():
         transport_domain = udp.domainName + (transport_index,)
         transport_index += 1
 
-        agent_udpv4_endpoint = endpoints.IPv4TransportEndpoints().add(
-            agent_udpv4_endpoint
-        )
+        agent_udpv4_endpoint = endpoints.IPv4TransportEndpoints(
+            reuse_port=args.workers > 1
+        ).add(agent_udpv4_endpoint)
 
-        transport_dispatcher.registerTransport(
+        transport_dispatcher.register_transport(
             transport_domain, agent_udpv4_endpoint[0]
         )
 
@@ -567,11 +781,11 @@ def main():
         transport_domain = udp6.domainName + (transport_index,)
         transport_index += 1
 
-        agent_udpv6_endpoint = endpoints.IPv4TransportEndpoints().add(
-            agent_udpv6_endpoint
-        )
+        agent_udpv6_endpoint = endpoints.IPv6TransportEndpoints(
+            reuse_port=args.workers > 1
+        ).add(agent_udpv6_endpoint)
 
-        transport_dispatcher.registerTransport(
+        transport_dispatcher.register_transport(
             transport_domain, agent_udpv6_endpoint[0]
         )
 
@@ -584,13 +798,13 @@ def main():
             )
         )
 
-    transport_dispatcher.registerRecvCbFun(commandResponderCbFun)
+    transport_dispatcher.register_recv_callback(commandResponderCbFun)
 
-    transport_dispatcher.jobStarted(1)  # server job would never finish
+    transport_dispatcher.job_started(1)  # server job would never finish
 
     with daemon.PrivilegesOf(args.process_user, args.process_group, final=True):
         try:
-            transport_dispatcher.runDispatcher()
+            transport_dispatcher.run_dispatcher()
 
         except KeyboardInterrupt:
             log.info("Shutting down process...")
@@ -612,7 +826,7 @@ def main():
                     else:
                         log.info('Variation module "%s" shutdown OK' % name)
 
-            transport_dispatcher.closeDispatcher()
+            transport_dispatcher.close_dispatcher()
 
             log.info("Process terminated")
 
@@ -0,0 +1,134 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Request and var-bind contexts passed down to variation modules
+#
+from collections import abc
+
+REQUEST_FIELDS = (
+    "snmpEngine",
+    "transportDomain",
+    "transportAddress",
+    "transportProtocol",
+    "securityModel",
+    "securityName",
+    "securityLevel",
+    "contextEngineId",
+    "contextName",
+    "pduType",
+    "nextFlag",
+    "setFlag",
+)
+
+VAR_BIND_FIELDS = (
+    "origOid",
+    "origValue",
+    "dataFile",
+    "subtreeFlag",
+    "exactMatch",
+    "variationModules",
+    "errorStatus",
+    "varsTotal",
+    "varsRemaining",
+)
+
+_VAR_BIND_FIELDS = frozenset(VAR_BIND_FIELDS)
+
+
+class RequestContext(abc.Mapping):
+    """Context of SNMP request shared by all its var-binds
+
+    Built once per request and not changed afterwards. Reads like the
+    dict of keyword arguments variation modules are called with, the
+    well-known entries can also be read as attributes.
+    """
+
+    __slots__ = REQUEST_FIELDS + ("_dict",)
+
+    def __init__(self, **context):
+        context.setdefault("nextFlag", False)
+        context.setdefault("setFlag", False)
+
+        # missing entries are left unset
+        for field in REQUEST_FIELDS:
+            if field in context:
+                setattr(self, field, context[field])
+
+        self._dict = context
+
+    def as_dict(self):
+        """Return the context as a dict, not to be changed"""
+        return self._dict
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+
+class VarBindContext(abc.Mapping):
+    """Context of a var-bind overlaying the context of its request
+
+    One instance serves all var-binds of the request one by one, the
+    var-bind entries get assigned as it moves on to the next var-bind.
+    Entries common to all var-binds are merged with the request context
+    once, when first needed.
+    """
+
+    __slots__ = VAR_BIND_FIELDS + ("request", "_dict")
+
+    def __init__(self, request, dataFile, variationModules, errorStatus, varsTotal):
+        self.request = request
+        self.dataFile = dataFile
+        self.variationModules = variationModules
+        self.errorStatus = errorStatus
+        self.varsTotal = varsTotal
+        self.varsRemaining = varsTotal
+        self.origOid = self.origValue = None
+        self.subtreeFlag = self.exactMatch = False
+        self._dict = None
+
+    def as_dict(self):
+        """Return the context as a new dict"""
+        context = self._dict
+
+        if context is None:
+            context = self._dict = {
+                **self.request.as_dict(),
+                "dataFile": self.dataFile,
+                "variationModules": self.variationModules,
+                "errorStatus": self.errorStatus,
+                "varsTotal": self.varsTotal,
+            }
+
+        return {
+            **context,
+            "origOid": self.origOid,
+            "origValue": self.origValue,
+            "subtreeFlag": self.subtreeFlag,
+            "exactMatch": self.exactMatch,
+            "varsRemaining": self.varsRemaining,
+        }
+
+    def __getitem__(self, key):
+        if key in _VAR_BIND_FIELDS:
+            return getattr(self, key)
+
+        return self.request[key]
+
+    def __iter__(self):
+        yield from VAR_BIND_FIELDS
+
+        for key in self.request:
+            if key not in _VAR_BIND_FIELDS:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
@@ -6,14 +6,25 @@
 #
 # SNMP Agent Simulator
 #
+import bisect
 
 from pysnmp.proto import rfc1902
-from pysnmp.smi import exval, indices
+from pysnmp.smi import exval
 from pysnmp.carrier.asyncio.dgram import udp
 from pysnmp.carrier.asyncio.dgram import udp6
 
 from snmpsim import datafile
 from snmpsim import log
+from snmpsim.context import RequestContext
+from snmpsim.record.search.oid import decode_oid
+from snmpsim.record.search.oid import encode_oid
+
+
+def _format_engine_id(snmp_engine):
+    if hasattr(snmp_engine, "snmpEngineID"):
+        return snmp_engine.snmpEngineID.prettyPrint()
+
+    return "<unknown>"
 
 
 class MibInstrumController:
@@ -26,8 +37,8 @@ class MibInstrumController:
         return str(self._data_file)
 
     def _get_call_context(self, next_flag=False, set_flag=False, **context):
-        if context is None:
-            return {"nextFlag": next_flag, "setFlag": set_flag}
+        if not context:
+            return RequestContext(nextFlag=next_flag, setFlag=set_flag)
 
         snmp_engine = context["snmpEngine"]  # we injected snmpEngine object earlier
 
@@ -65,51 +76,58 @@ class MibInstrumController:
         else:
             transport_protocol = "unknown"
 
-        log.info(
+        log.event(
+            "transport",
             "SNMP EngineID %s, transportDomain %s, transportAddress %s, "
-            "securityModel %s, securityName %s, securityLevel "
-            "%s"
-            % (
-                hasattr(snmp_engine, "snmpEngineID")
-                and snmp_engine.snmpEngineID.prettyPrint()
-                or "<unknown>",
-                transport_domain,
-                transport_address,
-                security_model,
-                security_name,
-                security_level,
-            )
+            "securityModel %s, securityName %s, securityLevel %s",
+            log.Lazy(_format_engine_id, snmp_engine),
+            transport_domain,
+            transport_address,
+            security_model,
+            security_name,
+            security_level,
         )
 
-        return {
-            "snmpEngine": snmp_engine,
-            "transportDomain": rfc1902.ObjectIdentifier(transport_domain),
-            "transportAddress": transport_address,
-            # "transportEndpoint": transport_address.getLocalAddress(),
-            "transportProtocol": transport_protocol,
-            "securityModel": security_model,
-            "securityName": security_name,
-            "securityLevel": security_level,
-            "contextEngineId": context_engine_id,
-            "contextName": context_name,
-            "pduType": pdu_type,
-            "nextFlag": next_flag,
-            "setFlag": set_flag,
-        }
+        return RequestContext(
+            snmpEngine=snmp_engine,
+            transportDomain=rfc1902.ObjectIdentifier(transport_domain),
+            transportAddress=transport_address,
+            # transportEndpoint=transport_address.getLocalAddress(),
+            transportProtocol=transport_protocol,
+            securityModel=security_model,
+            securityName=security_name,
+            securityLevel=security_level,
+            contextEngineId=context_engine_id,
+            contextName=context_name,
+            pduType=pdu_type,
+            nextFlag=next_flag,
+            setFlag=set_flag,
+        )
 
     def read_variables(self, *var_binds, **context):
         return self._data_file.process_var_binds(
-            var_binds, **self._get_call_context(False, False, **context)
+            var_binds, self._get_call_context(False, False, **context)
         )
 
     def read_next_variables(self, *var_binds, **context):
         return self._data_file.process_var_binds(
-            var_binds, **self._get_call_context(True, False, **context)
+            var_binds, self._get_call_context(True, False, **context)
+        )
+
+    def read_bulk_variables(
+        self, non_repeaters, max_repetitions, max_var_binds, *var_binds, **context
+    ):
+        return self._data_file.process_bulk_var_binds(
+            var_binds,
+            non_repeaters,
+            max_repetitions,
+            max_var_binds,
+            self._get_call_context(True, False, **context),
         )
 
     def write_variables(self, *var_binds, **context):
         return self._data_file.process_var_binds(
-            var_binds, **self._get_call_context(False, True, **context)
+            var_binds, self._get_call_context(False, True, **context)
         )
 
 
@@ -119,38 +137,49 @@ class DataIndexInstrumController:
     index_sub_oid = (1,)
 
     def __init__(self, base_oid=(1, 3, 6, 1, 4, 1, 20408, 999)):
-        self._db = indices.OidOrderedDict()
+        self._db = {}  # encoded OID -> value
+        self._keys = []  # sorted encoded OIDs
         self._index_oid = base_oid + self.index_sub_oid
         self._idx = 1
 
     def __str__(self):
         return "<index> controller"
 
-    def read_variables(self, var_binds, **context):
-        return [(vb[0], self._db.get(vb[0], exval.noSuchInstance)) for vb in var_binds]
+    def read_variables(self, *var_binds, **context):
+        return [
+            (vb[0], self._db.get(encode_oid(vb[0]), exval.noSuchInstance))
+            for vb in var_binds
+        ]
 
-    def _get_next_val(self, key, default):
-        try:
-            key = self._db.nextKey(key)
+    def _get_next_val(self, oid, default):
+        position = bisect.bisect_right(self._keys, encode_oid(oid))
 
-        except KeyError:
-            return key, default
+        if position == len(self._keys):
+            return oid, default
 
-        else:
-            return key, self._db[key]
+        key = self._keys[position]
 
-    def read_next_variables(self, var_binds, **context):
+        return decode_oid(key), self._db[key]
+
+    def read_next_variables(self, *var_binds, **context):
         return [self._get_next_val(vb[0], exval.endOfMib) for vb in var_binds]
 
-    def write_variables(self, var_binds, **context):
+    def write_variables(self, *var_binds, **context):
         return [(vb[0], exval.noSuchInstance) for vb in var_binds]
 
     def add_data_file(self, *args):
         for idx in range(len(args)):
-            self._db[self._index_oid + (idx + 1, self._idx)] = rfc1902.OctetString(
-                args[idx]
-            )
+            key = encode_oid(self._index_oid + (idx + 1, self._idx))
+
+            if key not in self._db:
+                bisect.insort(self._keys, key)
+
+            self._db[key] = rfc1902.OctetString(args[idx])
+
         self._idx += 1
 
 
-MIB_CONTROLLERS = {datafile.DataFile.layout: MibInstrumController}
+MIB_CONTROLLERS = {
+    datafile.DataFile.layout: MibInstrumController,
+    datafile.OverlayDataFile.layout: MibInstrumController,
+}
@@ -6,74 +6,578 @@
 #
 # Simulation data file management tools
 #
+import io
+import itertools
+import json
 import os
 import stat
+import tempfile
+import time
+import weakref
+from concurrent import futures
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
 
-from pyasn1.type import univ
 from pysnmp.carrier.asyncio.dgram import udp
 from pysnmp.carrier.asyncio.dgram import udp6
 from pysnmp.proto import rfc1902
 from pysnmp.smi import exval
 from pysnmp.smi.error import MibOperationError
 
+from snmpsim import confdir
 from snmpsim import log
 from snmpsim import variation
+from snmpsim.cache import LruCache
+from snmpsim.context import RequestContext
+from snmpsim.context import VarBindContext
 from snmpsim.error import NoDataNotification
 from snmpsim.error import SnmpsimError
+from snmpsim.record.bgzf import BgzfReader
 from snmpsim.record.search.database import RecordIndex
+from snmpsim.record.search.database import cover_positions
+from snmpsim.record.search.database import parent_positions
+from snmpsim.record.search.database import search_from
+from snmpsim.record.search.file import RecordScanner
 from snmpsim.record.search.file import get_record
-from snmpsim.record.search.file import search_record_by_oid
+from snmpsim.record.search.oid import encode_oid
 from snmpsim.reporting.manager import ReportingManager
 
 SELF_LABEL = "self"
 
+# overlay data file reference to its base data file
+OVERLAY_BASE_TAG = b"#!base"
+
 
 class AbstractLayout:
     layout = "?"
 
 
+class RecordTable:
+    """In-memory, by-OID sorted table of compiled data file records
+
+    Mimics :py:class:`RecordIndex` search interface, however record
+    offsets are positions in the table.
+    """
+
+    def __init__(self, keys, subtree_flags, records):
+        self._key_width = max([len(key) for key in keys] or [0])
+        self._padded_keys = [key.ljust(self._key_width, b"\x00") for key in keys]
+        self._keys = keys
+        self._subtree_flags = subtree_flags
+        self._covers = list(cover_positions(keys, subtree_flags))
+        self._parents = list(parent_positions(keys, subtree_flags))
+        self._records = records
+
+    def __len__(self):
+        return len(self._records)
+
+    def search(self, key, lo=0):
+        if len(key) > self._key_width:
+            padded_key = key
+
+        else:
+            padded_key = key.ljust(self._key_width, b"\x00")
+
+        position = search_from(self._padded_keys, padded_key, lo)
+
+        return (
+            position,
+            position < len(self._keys) and self._padded_keys[position] == padded_key,
+        )
+
+    def entry(self, position):
+        if position >= len(self._keys):
+            return position, False, self._covers[-1]
+
+        return position, self._subtree_flags[position], self._covers[position]
+
+    def successor(self, position):
+        return self.entry(position + 1)[:2]
+
+    def resolve(self, key, next_flag=False, lo=0):
+        position, exact_match = self.search(key, lo)
+
+        _, subtree_flag, cover = self.entry(position)
+
+        if exact_match:
+            if next_flag and not subtree_flag:
+                return position + 1, True, self.successor(position)[1]
+
+        else:
+            while cover >= 0 and not key.startswith(self._keys[cover]):
+                cover = self._parents[cover]
+
+            if cover >= 0:
+                return cover, False, True
+
+        return position, exact_match, subtree_flag
+
+    def absent(self, key):
+        # in-memory table is searched about as fast as filtered
+        return False
+
+    def key(self, position):
+        return self._keys[position]
+
+    def record(self, position):
+        if position < len(self._records):
+            return self._records[position]
+
+
+class HandlePool(LruCache):
+    """Open data files, least recently used get closed first
+
+    Each open data file holds its text and index files open. Unless
+    configured, the number of open data files is derived from the
+    limit of open files of the process.
+    """
+
+    DEFAULT_SIZE = 31
+
+    # file descriptors per open data file: text file and mapped index
+    FILES_PER_DATA_FILE = 2
+
+    # file descriptors left for sockets, logs and the like
+    RESERVED_FILES = 64
+
+    def __init__(self, max_open=0, check_interval=0):
+        LruCache.__init__(self, 0, "handle")
+
+        self.configure(max_open, check_interval)
+
+    def configure(self, max_open=0, check_interval=0):
+        """Set the limit of open data files and mtime checks interval
+
+        Zero `max_open` stands for the process open files limit
+        permitted number of data files.
+        """
+        self.max_size = max_open or self._files_budget()
+        self.check_interval = check_interval
+
+    def _files_budget(self):
+        if resource is None:
+            return self.DEFAULT_SIZE
+
+        soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+        if soft_limit == resource.RLIM_INFINITY:
+            return self.DEFAULT_SIZE
+
+        return max(1, (soft_limit - self.RESERVED_FILES) // self.FILES_PER_DATA_FILE)
+
+    def hit(self, data_file):
+        self.get(data_file)
+
+    def miss(self):
+        """Return data files to close before opening one more"""
+        self.misses += 1
+
+        return [data_file for data_file, _ in self.evict(1)]
+
+    def add(self, data_file):
+        LruCache.add(self, data_file, True)
+
+    def close(self):
+        """Close all open data files"""
+        for data_file in self:
+            data_file.close()
+
+
+class WalkCache(LruCache):
+    """OIDs served last mapped to records serving them, LRU-bounded
+
+    Walking managers ask for the OID following the one served last.
+    Knowing the record which served it, the next record is found
+    without searching the index. As the walk moves on, each walk
+    takes up a single entry.
+    """
+
+    DEFAULT_SIZE = 128
+
+    def __init__(self, size=DEFAULT_SIZE):
+        LruCache.__init__(self, size, "walk_cache")
+
+    def get(self, key):
+        """Return reference to the record which served encoded OID `key`"""
+        ref = LruCache.get(self, key)
+
+        # walk moves on past this OID
+        self.discard(key)
+
+        return ref
+
+
+class ValueCache(LruCache):
+    """Evaluated static records, least recently used get dropped first
+
+    Records are keyed by data file index and record offset. Changed
+    data file gets new index, so its records cached before the change
+    are never served, they just age out. Cache size is the estimated
+    memory taken by records, in bytes.
+    """
+
+    DEFAULT_SIZE = 64 * 1024 * 1024
+
+    # estimated memory taken by evaluated record besides its text
+    ENTRY_OVERHEAD = 1280
+
+    def __init__(self, max_size=DEFAULT_SIZE):
+        LruCache.__init__(self, max_size, "value_cache")
+
+    def configure(self, max_size=DEFAULT_SIZE):
+        """Set the limit of memory taken by cached records, in bytes"""
+        self.max_size = max_size
+        self.evict()
+
+    def add(self, key, record, text_size):
+        LruCache.add(self, key, record, text_size + self.ENTRY_OVERHEAD)
+
+
 class DataFile(AbstractLayout):
     layout = "text"
-    opened_queue = []
-    max_queue_entries = 31  # max number of open text and index files
+    handle_pool = HandlePool()
+    value_cache = ValueCache()
+    walk_cache_size = WalkCache.DEFAULT_SIZE
+
+    # snmprec conversions -> data files served off them
+    _conversions = {}
 
     def __init__(self, textFile, textParser, variationModules):
-        self._record_index = RecordIndex(textFile, textParser)
-        self._text_parser = textParser
         self._text_file = textFile
         self._variation_modules = variationModules
 
-    def index_text(self, forceIndexBuild=False, validateData=False):
-        self._record_index.create(forceIndexBuild, validateData)
+        # data files of other formats are served off snmprec conversions
+        self._source_parser = self._source_time = None
+        self._next_source_check = 0
+
+        if not isinstance(textParser, variation.SnmprecRecordMixIn):
+            self._source_parser = textParser
+            self._source_time = self._stat_source()
+
+            textFile, textParser = convert_data_file(textFile, textParser)
+
+            self._conversions.setdefault(textFile, weakref.WeakSet()).add(self)
+
+        self._record_index = RecordIndex(textFile, textParser)
+        self._text_parser = textParser
+        self._record_table = None
+        self._index_future = None
+        self._preload_pending = False
+        self._walk_cache = WalkCache(self.walk_cache_size)
+
+    @property
+    def text_file(self):
+        return self._text_file
+
+    @property
+    def served_file(self):
+        """Path of data file records are served off e.g. snmprec conversion"""
+        return self._record_index.text_file
+
+    @property
+    def index_file(self):
+        return self._record_index.index_file
+
+    def digest(self):
+        return self._record_index.digest()
+
+    def index_text(self, forceIndexBuild=False):
+        self._record_index.create(forceIndexBuild)
+        return self
+
+    def index_text_later(self, future):
+        """Serve nothing till index build `future` completes"""
+        self._index_future = future
+        return self
+
+    def wait_index(self):
+        """Block till background index build completes"""
+        if self._index_future is not None:
+            future, self._index_future = self._index_future, None
+
+            # index builder has hashed data file already
+            RecordIndex.remember_digest(*future.result())
+
+            self.index_text()
+
+            if self._preload_pending:
+                self._preload_pending = False
+                self.preload()
+
+        return self
+
+    def is_ready(self):
+        """Check whether data file index is in place"""
+        if self._index_future is None:
+            return True
+
+        if not self._index_future.done():
+            return False
+
+        try:
+            self.wait_index()
+
+        except Exception as exc:
+            log.error("Index build failed for %s: %s" % (self._text_file, exc))
+
+        return True
+
+    def preload(self):
+        """Compile all data file records into memory
+
+        Once preloaded, requests are served from the in-memory table and
+        never touch data file or its index. Static values are evaluated
+        into SNMP objects right away, records referring variation modules
+        are kept parsed for the variation module to be called on request.
+        """
+        if self._index_future is not None:
+            self._preload_pending = True
+            return self
+
+        if self._record_table is not None:
+            return self
+
+        text, _ = self._record_index.get_handles()
+
+        keys = []
+        subtree_flags = []
+        records = []
+
+        position = 0
+
+        try:
+            while True:
+                offset, subtree_flag, _ = self._record_index.entry(position)
+
+                text.seek(offset)
+
+                line, _, _ = get_record(text)
+
+                if not line:
+                    break
+
+                try:
+                    records.append(self._compile_record(line))
+
+                except Exception as exc:
+                    raise SnmpsimError(
+                        "Data error at %s offset %d: %s"
+                        % (self._text_file, offset, exc)
+                    )
+
+                keys.append(self._record_index.key(position))
+                subtree_flags.append(subtree_flag)
+
+                position += 1
+
+        finally:
+            DataFile.close(self)
+
+        self._record_table = RecordTable(keys, subtree_flags, records)
+
+        log.info("%d records of %s preloaded" % (len(records), self._text_file))
+
         return self
 
+    def _compile_record(self, line):
+        """Parse data file record into `(oid, tag, value, static)` tuple
+
+        Static values are evaluated into SNMP objects, records
+        referring variation modules are just parsed.
+        """
+        oid, tag, value = self._text_parser.grammar.parse(line)
+
+        oid = self._text_parser.evaluate_oid(oid)
+
+        variated = ":" in tag and isinstance(
+            self._text_parser, variation.SnmprecRecordMixIn
+        )
+
+        if variated:
+            return oid, tag, value, False
+
+        _, tag, value = self._text_parser.evaluate_value(
+            oid,
+            tag,
+            value,
+            nextFlag=True,
+            exactMatch=True,
+            setFlag=False,
+        )
+
+        return oid, tag, value, True
+
     def close(self):
+        DataFile.handle_pool.discard(self)
+        self._walk_cache.clear()
         self._record_index.close()
 
+    def _stat_source(self):
+        try:
+            return os.stat(self._text_file).st_mtime_ns
+
+        except OSError as exc:
+            raise SnmpsimError(f"Failed to open data file {self._text_file}: {exc}")
+
+    def _check_source(self, check_interval):
+        """Convert data file anew once it changes
+
+        Data file modification time is checked at most once in
+        `check_interval` seconds. Records are served off the previous
+        conversion until the changed data file converts fine.
+        """
+        now = time.monotonic()
+
+        if now < self._next_source_check:
+            return
+
+        self._next_source_check = now + check_interval
+
+        source_time = self._stat_source()
+
+        if source_time == self._source_time:
+            return
+
+        log.info("Data file %s modified, converting" % self._text_file)
+
+        try:
+            record_index = RecordIndex(
+                *convert_data_file(self._text_file, self._source_parser)
+            )
+            record_index.create()
+
+        except SnmpsimError as exc:
+            log.error("Data file %s conversion failed: %s" % (self._text_file, exc))
+            return
+
+        self._source_time = source_time
+
+        if record_index.text_file == self.served_file:
+            return
+
+        prev_record_index, self._record_index = self._record_index, record_index
+
+        self._conversions.setdefault(self.served_file, weakref.WeakSet()).add(self)
+
+        self._walk_cache.clear()
+
+        self._release_conversion(prev_record_index)
+
+    def _release_conversion(self, record_index):
+        """Remove conversion no other data file is served off, with its index"""
+        served_file = record_index.text_file
+
+        users = self._conversions.setdefault(served_file, weakref.WeakSet())
+
+        users.discard(self)
+
+        if users:
+            record_index.close()
+            return
+
+        self._conversions.pop(served_file, None)
+
+        record_index.remove()
+
+        try:
+            os.remove(served_file)
+
+        except OSError as exc:
+            log.info("Failed to remove %s: %s" % (served_file, exc))
+            return
+
+        log.info(
+            "Previous conversion %s of %s removed" % (served_file, self._text_file)
+        )
+
     def get_handles(self):
-        if not self._record_index.is_open():
-            if len(DataFile.opened_queue) > self.max_queue_entries:
-                log.info("Closing %s" % self)
-                DataFile.opened_queue[0].close()
-                del DataFile.opened_queue[0]
+        pool = DataFile.handle_pool
+
+        if self._source_parser is not None:
+            self._check_source(pool.check_interval)
+
+        if self in pool:
+            pool.hit(self)
+
+            return self._record_index.get_handles(pool.check_interval)
+
+        for data_file in pool.miss():
+            log.event("data-file", "Closing %s", data_file)
+            data_file._record_index.close()
+
+        log.event("data-file", "Opening %s", self)
+
+        handles = self._record_index.get_handles(pool.check_interval)
 
-            DataFile.opened_queue.append(self)
+        pool.add(self)
 
-            log.info("Opening %s" % self)
+        return handles
 
-        return self._record_index.get_handles()
+    def process_var_binds(self, var_binds, request_context=None, **context):
+        """Serve var-binds of GET, GETNEXT or SET request
 
-    def process_var_binds(self, var_binds, **context):
+        Request context is passed either as `RequestContext` or as
+        keyword arguments.
+        """
+        if request_context is None:
+            request_context = RequestContext(**context)
+
+        return self._process(var_binds, len(var_binds), 0, request_context)
+
+    def process_bulk_var_binds(
+        self,
+        var_binds,
+        non_repeaters,
+        max_repetitions,
+        max_var_binds=0,
+        request_context=None,
+        **context,
+    ):
+        """Serve GETBULK request in a single pass over data file
+
+        Non-repeating var-binds are served as GETNEXT. Each repeating
+        var-bind then keeps a cursor moving forward over data file
+        records, so that the next record is just read rather than
+        looked up. Records serving subtrees are looked up anew with
+        each OID the variation module returns.
+
+        Response is limited to `max_var_binds` var-binds. Request
+        context passed as `RequestContext` is to have `nextFlag` set.
+        """
+        non_repeaters = min(max(0, int(non_repeaters)), len(var_binds))
+        max_repetitions = max(0, int(max_repetitions))
+
+        repeaters = len(var_binds) - non_repeaters
+
+        if repeaters and max_var_binds:
+            max_repetitions = min(max_repetitions, max_var_binds // repeaters)
+
+        if request_context is None:
+            context["nextFlag"] = True
+
+            request_context = RequestContext(**context)
+
+        return self._process(var_binds, non_repeaters, max_repetitions, request_context)
+
+    def _process(self, var_binds, non_repeaters, max_repetitions, context):
         rsp_var_binds = []
 
-        if context.get("nextFlag"):
+        if context.nextFlag:
             error_status = exval.endOfMib
 
         else:
             error_status = exval.noSuchInstance
 
+        if not self.is_ready():
+            log.event("request", "Index of %s is not ready yet, ignoring request", self)
+            raise NoDataNotification()
+
         try:
-            text, db = self.get_handles()
+            handles = self._open_records()
 
         except SnmpsimError as exc:
             log.error("Problem with data file or its index: %s" % exc)
@@ -82,176 +586,850 @@ class DataFile(AbstractLayout):
                 data_file=self._text_file,
                 datafile_failure_count=1,
                 transport_call_count=1,
-                **context,
+                **DataFile.handle_pool.metrics(),
+                **DataFile.value_cache.metrics(),
+                **BgzfReader.block_cache.metrics(),
+                **self._walk_cache.metrics(),
+                **context.as_dict(),
             )
 
             return [(vb[0], error_status) for vb in var_binds]
 
-        vars_remaining = vars_total = len(var_binds)
+        next_flag = context.nextFlag
+
+        repeaters = list(var_binds[non_repeaters:])
+
+        vars_remaining = vars_total = non_repeaters + max_repetitions * len(repeaters)
+
+        var_bind_context = VarBindContext(
+            context, self._text_file, self._variation_modules, error_status, vars_total
+        )
         err_total = 0
 
-        log.info(
-            "Request var-binds: %s, flags: %s, "
-            "%s"
-            % (
-                ", ".join([f"{vb[0]}=<{vb[1].prettyPrint()}>" for vb in var_binds]),
-                context.get("nextFlag") and "NEXT" or "EXACT",
-                context.get("setFlag") and "SET" or "GET",
-            )
+        log.event(
+            "request",
+            "Request var-binds: %s, flags: %s, %s",
+            log.Lazy(_format_var_binds, var_binds),
+            context.nextFlag and "NEXT" or "EXACT",
+            context.setFlag and "SET" or "GET",
         )
 
-        separator = b","
+        records = self._lookup_all(
+            handles,
+            [encode_oid(oid) for oid, _ in var_binds[:non_repeaters]],
+            next_flag,
+        )
 
-        for oid, val in var_binds:
-            text_oid = str(univ.OctetString(".".join(["%s" % x for x in oid])))
+        for (oid, val), (cursor, record) in zip(var_binds[:non_repeaters], records):
+            vars_remaining -= 1
 
-            try:
-                line = self._record_index.lookup(
-                    str(univ.OctetString(".".join(["%s" % x for x in oid])))
-                )
+            var_bind_context.origOid = oid
+            var_bind_context.origValue = val
+            var_bind_context.varsRemaining = vars_remaining
 
-            except KeyError:
-                offset = search_record_by_oid(oid, text, self._text_parser)
-                subtree_flag = exact_match = False
+            var_bind, cursor, failed = self._process_var_bind(
+                handles, cursor, var_bind_context, record
+            )
 
-            else:
-                offset, subtree_flag, prev_offset = line.split(separator, 2)
-                subtree_flag, exact_match = int(subtree_flag), True
+            err_total += failed
 
-            offset = int(offset)
+            rsp_var_binds.append(var_bind)
 
-            text.seek(offset)
+            if next_flag:
+                self._remember(handles, cursor)
 
-            vars_remaining -= 1
+        # repeaters out of records get `False` cursor
+        cursors = [None] * len(repeaters)
 
-            line, _, _ = get_record(text)  # matched line
+        # cursors of the records served last
+        served = [None] * len(repeaters)
 
-            while True:
-                if exact_match:
-                    if context.get("nextFlag") and not subtree_flag:
-                        _next_line, _, _ = get_record(text)  # next line
-
-                        if _next_line:
-                            _next_oid, _ = self._text_parser.evaluate(
-                                _next_line, oidOnly=True
-                            )
-
-                            try:
-                                _, subtree_flag, _ = self._record_index.lookup(
-                                    str(_next_oid)
-                                ).split(separator, 2)
-
-                            except KeyError:
-                                log.error(
-                                    "data error for %s at %s, index "
-                                    "broken?" % (self, _next_oid)
-                                )
-                                line = ""  # fatal error
-
-                            else:
-                                subtree_flag = int(subtree_flag)
-                                line = _next_line
-
-                        else:
-                            line = _next_line
-
-                else:  # search function above always rounds up to the next OID
-                    if line:
-                        _oid, _ = self._text_parser.evaluate(line, oidOnly=True)
-
-                    else:  # eom
-                        _oid = "last"
-
-                    try:
-                        _, _, _prev_offset = self._record_index.lookup(str(_oid)).split(
-                            separator, 2
-                        )
-
-                    except KeyError:
-                        log.error(
-                            "data error for %s at %s, index " "broken?" % (self, _oid)
-                        )
-                        line = ""  # fatal error
-
-                    else:
-                        _prev_offset = int(_prev_offset)
-
-                        # previous line serves a subtree?
-                        if _prev_offset >= 0:
-                            text.seek(_prev_offset)
-                            _prev_line, _, _ = get_record(text)
-                            _prev_oid, _ = self._text_parser.evaluate(
-                                _prev_line, oidOnly=True
-                            )
-
-                            if _prev_oid.isPrefixOf(oid):
-                                # use previous line to the matched one
-                                line = _prev_line
-                                subtree_flag = True
+        for _ in range(max_repetitions):
+            if repeaters and cursors.count(False) == len(cursors):
+                break
 
-                if not line:
-                    _oid = oid
-                    _val = error_status
-                    break
+            for idx, (oid, val) in enumerate(repeaters):
+                vars_remaining -= 1
 
-                call_context = context.copy()
-                call_context.update(
-                    (),
-                    origOid=oid,
-                    origValue=val,
-                    dataFile=self._text_file,
-                    subtreeFlag=subtree_flag,
-                    exactMatch=exact_match,
-                    errorStatus=error_status,
-                    varsTotal=vars_total,
-                    varsRemaining=vars_remaining,
-                    variationModules=self._variation_modules,
+                cursor = cursors[idx]
+
+                if cursor is False:
+                    rsp_var_binds.append((oid, error_status))
+                    continue
+
+                # subtree records yield OIDs one by one
+                if cursor is None or cursor[2]:
+                    cursor = self._lookup(handles, encode_oid(oid), next_flag)
+
+                var_bind_context.origOid = oid
+                var_bind_context.origValue = val
+                var_bind_context.varsRemaining = vars_remaining
+
+                var_bind, cursor, failed = self._process_var_bind(
+                    handles, cursor, var_bind_context
                 )
 
-                try:
-                    _oid, _val = self._text_parser.evaluate(line, **call_context)
+                err_total += failed
 
-                    if _val is exval.endOfMib:
-                        exact_match = True
-                        subtree_flag = False
-                        continue
+                rsp_var_binds.append(var_bind)
 
-                except NoDataNotification:
-                    raise
+                if cursor is None:
+                    cursor = False
 
-                except MibOperationError:
-                    raise
+                else:
+                    repeaters[idx] = var_bind
+                    served[idx] = cursor
 
-                except Exception as exc:
-                    _oid = oid
-                    _val = error_status
-                    err_total += 1
-                    log.error(f"data error at {self} for {text_oid}: {exc}")
+                    if not cursor[2]:
+                        cursor = self._lookup_past(handles, cursor[0], next_flag)
 
-                break
+                cursors[idx] = cursor
 
-            rsp_var_binds.append((_oid, _val))
+        for cursor in served:
+            self._remember(handles, cursor)
 
-        log.info(
-            "Response var-binds: %s"
-            % (", ".join([f"{vb[0]}=<{vb[1].prettyPrint()}>" for vb in rsp_var_binds]))
+        log.event(
+            "response",
+            "Response var-binds: %s",
+            log.Lazy(_format_var_binds, rsp_var_binds),
         )
 
         ReportingManager.update_metrics(
             data_file=self._text_file,
-            varbind_count=vars_total,
+            varbind_count=len(rsp_var_binds),
             datafile_call_count=1,
             datafile_failure_count=err_total,
             transport_call_count=1,
-            **context,
+            **DataFile.handle_pool.metrics(),
+            **DataFile.value_cache.metrics(),
+            **BgzfReader.block_cache.metrics(),
+            **self._walk_cache.metrics(),
+            **context.as_dict(),
         )
 
         return rsp_var_binds
 
+    def _process_var_bind(self, handles, cursor, context, record=None):
+        """Serve var-bind off the record cursor points to
+
+        Cursor is a `(position, exact_match, subtree_flag)` tuple as
+        returned by record lookup, `record` is the record at cursor if
+        already read. Returns response var-bind, cursor of the record
+        serving it or `None` if records ran out, and whether record
+        evaluation failed.
+        """
+        oid = context.origOid
+
+        if cursor is None:
+            return (oid, context.errorStatus), None, False
+
+        position, exact_match, subtree_flag = cursor
+
+        while True:
+            if record is None:
+                record = self._read_record(handles, position)
+
+            if not record:
+                return (oid, context.errorStatus), None, False
+
+            context.subtreeFlag = subtree_flag
+            context.exactMatch = exact_match
+
+            try:
+                _oid, _val = self._evaluate_record(record, context)
+
+                if _val is exval.endOfMib:
+                    position, exact_match, subtree_flag = self._lookup_past(
+                        handles, position, context.request.nextFlag, encode_oid(oid)
+                    )
+                    record = None
+                    continue
+
+            except NoDataNotification:
+                raise
+
+            except MibOperationError:
+                raise
+
+            except Exception as exc:
+                log.event(
+                    "failure",
+                    "data error at %s for %s: %s",
+                    self,
+                    oid,
+                    exc,
+                    level=log.LOG_ERROR,
+                )
+                return (oid, context.errorStatus), None, True
+
+            return (_oid, _val), (position, exact_match, subtree_flag), False
+
+    def _open_records(self):
+        """Return data file and index handles to look records up with"""
+        if self._record_table is not None:
+            return None, self._record_table
+
+        text, _ = self.get_handles()
+
+        return text, self._record_index
+
+    def _lookup(self, handles, key, next_flag, lo=0):
+        """Find position of the record serving encoded OID `key`
+
+        Returns record position along with flags telling whether record
+        OID matches `key` exactly and whether record serves a subtree,
+        or `None` if no record may serve `key`. Records before position
+        `lo` are not considered.
+        """
+        if not next_flag and self._absent(handles, key):
+            return None
+
+        if next_flag:
+            ref = self._walk_cache.get(key)
+
+            # data file might have changed since
+            if ref is not None and self._key(handles, ref) == key:
+                return self._lookup_past(handles, ref, next_flag)
+
+        return self._resolve(handles, key, next_flag, lo)
+
+    def _lookup_all(self, handles, keys, next_flag):
+        """Find and read records serving encoded OIDs `keys` in one pass
+
+        Keys are looked up in ascending order, each search resuming
+        at the record found by the previous one, and records are read
+        in the same order. Returns `(cursor, record)` pairs following
+        the order of `keys`.
+        """
+        found = {}
+
+        lo = 0
+
+        for key in sorted(set(keys)):
+            cursor = self._lookup(handles, key, next_flag, lo)
+
+            if cursor is None:
+                found[key] = None, None
+                continue
+
+            found[key] = cursor, self._read_record(handles, cursor[0])
+
+            # found record never follows the search position of greater keys
+            lo = cursor[0]
+
+        return [found[key] for key in keys]
+
+    def _resolve(self, handles, key, next_flag, lo=0):
+        return handles[1].resolve(key, next_flag, lo)
+
+    def _absent(self, handles, key):
+        return handles[1].absent(key)
+
+    def _remember(self, handles, cursor):
+        """Let the walk continue past the record cursor points to"""
+        # subtree records serve more than their own OID
+        if cursor and not cursor[2]:
+            self._walk_cache.add(self._key(handles, cursor[0]), cursor[0])
+
+    def _key(self, handles, position):
+        record_index = handles[1]
+
+        if position < len(record_index):
+            return record_index.key(position)
+
+    def _lookup_past(self, handles, position, next_flag, key=None):
+        """Move on from the record which turned out to be out of data
+
+        On GETNEXT, records not following encoded OID `key`, if given,
+        are skipped too e.g. those under a subtree record serving `key`.
+        """
+        if not next_flag:
+            return position, True, False
+
+        if key is None:
+            _, subtree_flag = handles[1].successor(position)
+
+            return position + 1, True, subtree_flag
+
+        following, exact_match = handles[1].search(key)
+
+        if exact_match:
+            following += 1
+
+        position = max(position + 1, following)
+
+        _, subtree_flag, _ = handles[1].entry(position)
+
+        return position, True, subtree_flag
+
+    def _read_record(self, handles, position):
+        text, record_index = handles
+
+        if text is None:
+            return record_index.record(position)
+
+        offset, _, _ = record_index.entry(position)
+
+        key = record_index.index_file, offset
+
+        record = DataFile.value_cache.get(key)
+
+        if record is not None:
+            return key, record
+
+        text.seek(offset)
+
+        line, _, _ = get_record(text)
+
+        if line:
+            return key, line
+
+    def _evaluate_record(self, record, context):
+        if self._record_table is None:
+            key, record = record
+
+            if not isinstance(record, tuple):
+                line, record = record, self._compile_record(record)
+
+                if record[3]:
+                    DataFile.value_cache.add(key, record, len(line))
+
+        oid, tag, value, static = record
+
+        if not static:
+            oid, tag, value = self._text_parser.evaluate_value(
+                oid, tag, value, **context.as_dict()
+            )
+
+        elif (
+            not context.request.nextFlag
+            and not context.exactMatch
+            or context.request.setFlag
+        ):
+            return context.origOid, context.errorStatus
+
+        return oid, value
+
     def __str__(self):
         return "%s controller" % self._text_file
 
 
+class OverlayDataFile(DataFile):
+    """Data file overriding records of another, base data file
+
+    Overlay data file holds just the records which differ from the
+    base one, the rest of the records are served off the base data
+    file. The first line of overlay data file refers to the base
+    data file relative to overlay data file location:
+
+        #!base ../models/ups.snmprec
+
+    Base data files are shared by all overlays referring to them.
+    """
+
+    layout = "overlay"
+
+    _base_data_files = {}
+
+    def __init__(self, textFile, textParser, variationModules, baseFile, baseParser):
+        DataFile.__init__(self, textFile, textParser, variationModules)
+
+        base_file = os.path.abspath(baseFile)
+
+        try:
+            self._base = self._base_data_files[base_file]
+
+        except KeyError:
+            self._base = self._base_data_files[base_file] = DataFile(
+                baseFile, baseParser, variationModules
+            )
+
+    @property
+    def base_data_file(self):
+        return self._base
+
+    def index_text(self, forceIndexBuild=False):
+        self._base.index_text(forceIndexBuild)
+        return DataFile.index_text(self, forceIndexBuild)
+
+    def preload(self):
+        if self._index_future is None:
+            self._base.preload()
+
+        return DataFile.preload(self)
+
+    def close(self):
+        DataFile.close(self)
+        self._base.close()
+
+    def _open_records(self):
+        return self._base._open_records(), DataFile._open_records(self)
+
+    def _absent(self, handles, key):
+        return all(record_index.absent(key) for _, record_index in handles)
+
+    def _layer_handles(self, handles, layer):
+        return handles[1] if layer is self else handles[0]
+
+    def _pick(self, handles, base, own):
+        """Choose the record coming first, overlay wins on the same OID"""
+        base_handles, own_handles = handles
+
+        base_key = own_key = None
+
+        if base[0] < len(base_handles[1]):
+            base_key = base_handles[1].key(base[0])
+
+        if own[0] < len(own_handles[1]):
+            own_key = own_handles[1].key(own[0])
+
+        if base_key is not None and (own_key is None or base_key < own_key):
+            return (self._base, base[0]), base[1], base[2]
+
+        return (self, own[0]), own[1], own[2]
+
+    def _resolve(self, handles, key, next_flag, lo=0):
+        # positions refer to either of the two indices, searching all
+        base_handles, own_handles = handles
+
+        own = own_handles[1].resolve(key, next_flag)
+
+        if not next_flag:
+            position = own[0]
+
+            # overlay record matches or serves a subtree containing the OID
+            if position < len(own_handles[1]) and key.startswith(
+                own_handles[1].key(position)
+            ):
+                return (self, position), own[1], own[2]
+
+            base = base_handles[1].resolve(key, next_flag)
+
+            return (self._base, base[0]), base[1], base[2]
+
+        base = base_handles[1].resolve(key, next_flag)
+
+        return self._pick(handles, base, own)
+
+    def _key(self, handles, ref):
+        layer, position = ref
+
+        return DataFile._key(layer, self._layer_handles(handles, layer), position)
+
+    def _lookup_past(self, handles, ref, next_flag, key=None):
+        if not next_flag:
+            return ref, True, False
+
+        # records preceding the request OID e.g. under subtree serving it
+        key = max(self._key(handles, ref), key or b"")
+
+        candidates = []
+
+        for _, record_index in handles:
+            position, exact_match = record_index.search(key)
+
+            if exact_match:
+                position += 1
+
+            _, subtree_flag, _ = record_index.entry(position)
+
+            candidates.append((position, True, subtree_flag))
+
+        return self._pick(handles, *candidates)
+
+    def _read_record(self, handles, ref):
+        layer, position = ref
+
+        record = DataFile._read_record(
+            layer, self._layer_handles(handles, layer), position
+        )
+
+        if record:
+            return layer, record
+
+    def _evaluate_record(self, record, context):
+        layer, record = record
+
+        return DataFile._evaluate_record(layer, record, context)
+
+    def __str__(self):
+        return "%s over %s controller" % (self._text_file, self._base.text_file)
+
+
+def _format_var_binds(var_binds):
+    return ", ".join([f"{vb[0]}=<{vb[1].prettyPrint()}>" for vb in var_binds])
+
+
+def _probe_base_data_file(text_file, text_parser):
+    """Return path and parser of base data file overlaid by `text_file`"""
+    try:
+        with text_parser.open(text_file) as text:
+            line = text.readline()
+
+    except Exception as exc:
+        raise SnmpsimError(f"Failed to open data file {text_file}: {exc}")
+
+    if not line.startswith(OVERLAY_BASE_TAG):
+        return
+
+    base_file = line[len(OVERLAY_BASE_TAG) :].strip().decode()
+
+    base_file = os.path.join(os.path.dirname(text_file), base_file)
+
+    for ext, base_parser in variation.RECORD_TYPES.items():
+        if base_file.endswith(os.path.extsep + ext):
+            return base_file, base_parser
+
+    raise SnmpsimError(
+        f"Unsupported type of base data file {base_file} of data file {text_file}"
+    )
+
+
+def convert_data_file(text_file, text_parser):
+    """Return path and parser of snmprec rendition of data file
+
+    Data files of formats other than snmprec (e.g. snmpwalk) are
+    converted into snmprec once and served off the converted copy.
+    Copies are kept in the cache directory named after the original
+    data file contents, so they are reused until the original changes.
+    """
+    if isinstance(text_parser, variation.SnmprecRecordMixIn):
+        return text_file, text_parser
+
+    snmprec_parser = variation.RECORD_TYPES[variation.SnmprecRecord.ext]
+
+    digest = RecordIndex(text_file, text_parser).digest()
+
+    snmprec_file = os.path.join(
+        confdir.cache,
+        os.path.extsep.join((digest, text_parser.ext, snmprec_parser.ext)),
+    )
+
+    if os.path.exists(snmprec_file):
+        return snmprec_file, snmprec_parser
+
+    try:
+        fd, tmp_file = tempfile.mkstemp(dir=confdir.cache, suffix=".tmp")
+
+    except OSError as exc:
+        raise SnmpsimError(f"Failed to convert data file {text_file}: {exc}")
+
+    count = 0
+
+    try:
+        with text_parser.open(text_file) as text, os.fdopen(fd, "wb") as fl:
+            for line_no, _, line in itertools.chain.from_iterable(RecordScanner(text)):
+                try:
+                    oid, value = text_parser.evaluate(line)
+
+                except Exception as exc:
+                    raise SnmpsimError(
+                        "Data error at %s:%d: %s" % (text_file, line_no, exc)
+                    )
+
+                fl.write(snmprec_parser.format(oid, value, variationModule=None))
+
+                count += 1
+
+        # concurrent conversions of the same data file are all alike
+        os.replace(tmp_file, snmprec_file)
+
+    except OSError as exc:
+        raise SnmpsimError(f"Failed to convert data file {text_file}: {exc}")
+
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    log.info("%d records of %s converted into %s" % (count, text_file, snmprec_file))
+
+    return snmprec_file, snmprec_parser
+
+
+def open_data_file(text_file, text_parser, variation_modules):
+    """Create data file controller of the layout data file calls for"""
+    base = _probe_base_data_file(text_file, text_parser)
+
+    if base:
+        return OverlayDataFile(text_file, text_parser, variation_modules, *base)
+
+    return DataFile(text_file, text_parser, variation_modules)
+
+
+def _build_index(
+    text_file, text_parser, cache_dir, force_index_build, digest_entry=None
+):
+    confdir.cache = cache_dir
+
+    if digest_entry:
+        RecordIndex.remember_digest(*digest_entry)
+
+    record_index = RecordIndex(text_file, text_parser)
+
+    record_index.create(force_index_build)
+
+    return record_index.digest_entry()
+
+
+def index_data_files(
+    data_files,
+    workers=1,
+    force_index_build=False,
+    background=False,
+):
+    """Build indices for a collection of data files
+
+    With more than one worker, indices are built by a pool of processes.
+    Unless `background` is set, returns once all indices are in place.
+    Otherwise returns right away leaving each data file to answer
+    requests as soon as its own index is ready.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if workers < 2 or len(data_files) < 2:
+        for data_file in data_files:
+            data_file.index_text(force_index_build)
+
+        return data_files
+
+    # data files of same contents share one index, contents are hashed
+    # by index builders unless there are data files of the same size
+    same_size = {}
+
+    for data_file in data_files:
+        try:
+            size = os.stat(data_file.served_file).st_size
+
+        except OSError as exc:
+            raise SnmpsimError(
+                f"Failed to open data file {data_file.served_file}: {exc}"
+            )
+
+        same_size.setdefault(size, []).append(data_file)
+
+    # (content hash or None, data files) pairs
+    builds = []
+
+    for same_size_data_files in same_size.values():
+        if len(same_size_data_files) == 1:
+            builds.append((None, same_size_data_files))
+            continue
+
+        same_digest = {}
+
+        for data_file in same_size_data_files:
+            same_digest.setdefault(data_file.digest(), []).append(data_file)
+
+        builds.extend(same_digest.items())
+
+    log.info(
+        "Building indices for %d distinct of %d data files using %d "
+        "workers..." % (len(builds), len(data_files), workers)
+    )
+
+    total = len(builds)
+    step = max(1, total // 20)
+    completed = []
+
+    def report_progress(future):
+        completed.append(future)
+
+        if len(completed) % step == 0 or len(completed) == total:
+            log.info(
+                "...%d of %d data files indexed (%d%%)"
+                % (len(completed), total, len(completed) * 100 // total)
+            )
+
+    executor = futures.ProcessPoolExecutor(max_workers=workers)
+
+    for digest, same_data_files in builds:
+        record_index = same_data_files[0]._record_index
+
+        future = executor.submit(
+            _build_index,
+            record_index.text_file,
+            same_data_files[0]._text_parser,
+            confdir.cache,
+            force_index_build,
+            digest and record_index.digest_entry(),
+        )
+
+        future.add_done_callback(report_progress)
+
+        for data_file in same_data_files:
+            data_file.index_text_later(future)
+
+    executor.shutdown(wait=not background)
+
+    if not background:
+        for data_file in data_files:
+            data_file.wait_index()
+
+    return data_files
+
+
+def _split_data_file(text_file, text_parser, shard_size):
+    """Return `(line_no, offset, stop_offset)` of data file shards
+
+    Shards start at line boundaries, `line_no` is the number of lines
+    preceding the shard. Compressed data files make a single shard.
+    """
+    with text_parser.open(text_file) as text:
+        if not isinstance(text, io.BufferedReader):
+            return [(0, 0, float("inf"))]
+
+        shards = []
+
+        line_no = offset = 0
+
+        while True:
+            shard = text.read(shard_size) + text.readline()
+
+            if not shard:
+                return shards
+
+            shards.append((line_no, offset, offset + len(shard)))
+
+            line_no += shard.count(b"\n")
+            offset += len(shard)
+
+
+def _validate_shard(text_file, text_parser, variation_modules, shard):
+    """Evaluate records of data file shard
+
+    Returns the number of records evaluated and the list of
+    `(line_no, oid, error)` of records failing evaluation.
+    """
+    line_no, offset, stop_offset = shard
+
+    context = {
+        "dataValidation": True,
+        "variationModules": dict.fromkeys(variation_modules),
+    }
+
+    count = 0
+    errors = []
+
+    with text_parser.open(text_file) as text:
+        text.seek(offset)
+
+        for batch in RecordScanner(text, line_no, offset):
+            for line_no, offset, line in batch:
+                if offset >= stop_offset:
+                    return count, errors
+
+                count += 1
+
+                oid = None
+
+                try:
+                    oid, tag, value = text_parser.grammar.parse(line)
+
+                    text_parser.evaluate_value(
+                        text_parser.evaluate_oid(oid), tag, value, **context
+                    )
+
+                except Exception as exc:
+                    errors.append((line_no, oid, str(exc).strip()))
+
+    return count, errors
+
+
+def validate_data_files(data_files, workers=1, report_file=None, shard_size=1 << 24):
+    """Evaluate all records of a collection of data files
+
+    Validation does not depend on indices. Large data files are split
+    into shards, with more than one worker shards are evaluated by a
+    pool of processes. Problems are logged and, if `report_file` is
+    given, written there in JSON.
+
+    Returns the list of `(text_file, line_no, oid, error)` of records
+    failing evaluation.
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    # overlays get their base data files validated along
+    text_files = {}
+
+    for data_file in data_files:
+        for member in (data_file, getattr(data_file, "base_data_file", None)):
+            if member is not None:
+                text_files.setdefault(member.text_file, member)
+
+    jobs = []
+
+    for text_file, data_file in text_files.items():
+        # records are validated as written by the user
+        text_parser = data_file._source_parser or data_file._text_parser
+
+        for shard in _split_data_file(text_file, text_parser, shard_size):
+            jobs.append(
+                (
+                    text_file,
+                    text_parser,
+                    sorted(data_file._variation_modules),
+                    shard,
+                )
+            )
+
+    log.info(
+        "Validating %d data files in %d shards using %d workers..."
+        % (len(text_files), len(jobs), min(workers, len(jobs)))
+    )
+
+    if workers < 2 or len(jobs) < 2:
+        results = [_validate_shard(*job) for job in jobs]
+
+    else:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_validate_shard, *zip(*jobs)))
+
+    count = 0
+    errors = []
+
+    for job, (shard_count, shard_errors) in zip(jobs, results):
+        count += shard_count
+
+        for line_no, oid, message in shard_errors:
+            errors.append((job[0], line_no, oid, message))
+
+            log.event(
+                "data-file",
+                "Data error at %s:%d: %s",
+                job[0],
+                line_no,
+                message,
+                level=log.LOG_ERROR,
+            )
+
+    log.info("...%d records validated, %d errors found" % (count, len(errors)))
+
+    if report_file:
+        report = {
+            "files": len(text_files),
+            "records": count,
+            "errors": [
+                {"file": text_file, "line": line_no, "oid": oid, "error": message}
+                for text_file, line_no, oid, message in errors
+            ],
+        }
+
+        try:
+            with open(report_file, "w") as fl:
+                json.dump(report, fl, indent=2)
+
+        except OSError as exc:
+            raise SnmpsimError(
+                "Failed to write validation report %s: %s" % (report_file, exc)
+            )
+
+        log.info("Validation report written into %s" % report_file)
+
+    return errors
+
+
 def get_data_files(tgt_dir, top_len=None):
     # If top_len is not provided, calculate it based on the target directory
     if top_len is None:
@@ -14,9 +14,30 @@ from pysnmp.carrier.asyncio.dgram import udp6
 from snmpsim.error import SnmpsimError
 
 
+def _open_reuse_port_socket(family, address):
+    """Return UDP socket bound to `address` other processes may bind too"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SnmpsimError("This system does not support SO_REUSEPORT")
+
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+
+    except OSError as exc:
+        sock.close()
+        raise SnmpsimError(f"Failed to bind to {address}: {exc}")
+
+    sock.setblocking(False)
+
+    return sock
+
+
 class TransportEndpointsBase:
-    def __init__(self):
+    def __init__(self, reuse_port=False):
         self.__endpoint = None
+        self._reuse_port = reuse_port
 
     def add(self, addr):
         self.__endpoint = self._addEndpoint(addr)
@@ -42,6 +63,14 @@ class IPv4TransportEndpoints(TransportEndpointsBase):
         except Exception:
             raise SnmpsimError("improper IPv4/UDP endpoint %s" % addr)
 
+        if self._reuse_port:
+            return (
+                udp.UdpTransport().open_server_mode(
+                    sock=_open_reuse_port_socket(socket.AF_INET, (h, p))
+                ),
+                addr,
+            )
+
         return udp.UdpTransport().open_server_mode((h, p)), addr
 
 
@@ -65,7 +94,15 @@ class IPv6TransportEndpoints(TransportEndpointsBase):
         else:
             h, p = addr, 161
 
-        return udp6.Udp6Transport().openServerMode((h, p)), addr
+        if self._reuse_port:
+            return (
+                udp6.Udp6Transport().open_server_mode(
+                    sock=_open_reuse_port_socket(socket.AF_INET6, (h, p))
+                ),
+                addr,
+            )
+
+        return udp6.Udp6Transport().open_server_mode((h, p)), addr
 
 
 def parse_endpoint(arg, ipv6=False):
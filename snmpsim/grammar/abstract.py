@@ -13,6 +13,12 @@ class AbstractGrammar:
             "Method not implemented at %s" % self.__class__.__name__
         )
 
+    def parse_oid_tag(self, line):
+        """Parse just OID and tag off record line"""
+        oid, tag, _ = self.parse(line)
+
+        return oid, tag
+
     def build(self, oid, tag, val):
         raise error.SnmpsimError(
             "Method not implemented at %s" % self.__class__.__name__
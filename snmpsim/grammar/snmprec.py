@@ -57,6 +57,16 @@ class SnmprecGrammar(AbstractGrammar):
 
             raise error.SnmpsimError("broken record <%s>" % line)
 
+    def parse_oid_tag(self, line):
+        oid, _, rest = line.partition(b"|")
+        tag, separator, _ = rest.partition(b"|")
+
+        if oid and tag and separator:
+            return oid, tag.decode("iso-8859-1")
+
+        # report broken record
+        return self.parse(line)[:2]
+
     # helper functions
 
     def get_tag_by_type(self, value):
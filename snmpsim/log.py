@@ -280,10 +280,18 @@ LEVELS_MAP = {
     "error": LOG_ERROR,
 }
 
-msg = lambda x: None
+
+def _discard(text):
+    """Drop message, the default until logger is set"""
+
+
+msg = _discard
 
 log_level = LOG_INFO
 
+# event kind -> EventLimit
+event_limits = {}
+
 
 def error(message, ctx=""):
     if log_level <= LOG_ERROR:
@@ -300,6 +308,113 @@ def debug(message, ctx=""):
         msg(f"DEBUG {message} {ctx}")
 
 
+class Lazy:
+    """Log message argument computed just when the message is emitted"""
+
+    __slots__ = ("_fun", "_args")
+
+    def __init__(self, fun, *args):
+        self._fun = fun
+        self._args = args
+
+    def __str__(self):
+        return str(self._fun(*self._args))
+
+    def __repr__(self):
+        return repr(self._fun(*self._args))
+
+
+class EventLimit:
+    """Let through every `sample`-th event, up to `rate` events a second"""
+
+    def __init__(self, sample=1, rate=0):
+        self.sample = sample
+        self.rate = rate
+        self.skipped = 0
+        self._count = 0
+        self._second = None
+        self._passed = 0
+
+    def admit(self):
+        self._count += 1
+
+        if self._count % self.sample:
+            self.skipped += 1
+            return False
+
+        if self.rate:
+            second = int(time.monotonic())
+
+            if second != self._second:
+                self._second = second
+                self._passed = 0
+
+            if self._passed >= self.rate:
+                self.skipped += 1
+                return False
+
+            self._passed += 1
+
+        return True
+
+
+def enabled(level=LOG_INFO):
+    """Tell whether messages of `level` get logged at all"""
+    return (
+        log_level <= level and msg is not _discard and not isinstance(msg, NullLogger)
+    )
+
+
+def event(kind, template, *args, level=LOG_INFO):
+    """Log `kind` of event, formatting `template` with `args` on emission
+
+    Nothing is formatted unless the event is logged. Arguments may be
+    :py:class:`Lazy` to put off their computation as well. Events of
+    each kind are sampled and rate limited as configured.
+    """
+    if not enabled(level):
+        return
+
+    limit = event_limits.get(kind)
+
+    if limit:
+        if not limit.admit():
+            return
+
+        if limit.skipped:
+            template += " (%d more %s events skipped)" % (limit.skipped, kind)
+            limit.skipped = 0
+
+    message = template % args if args else template
+
+    if level >= LOG_ERROR:
+        error(message)
+
+    elif level >= LOG_INFO:
+        info(message)
+
+    else:
+        debug(message)
+
+
+def set_event_limit(spec):
+    """Configure event limit out of `<event>:<sample>[:<rate>]` text"""
+    try:
+        kind, sample, *rate = spec.split(":")
+
+        limit = EventLimit(int(sample), rate and int(rate[0]) or 0)
+
+        if limit.sample < 1 or limit.rate < 0 or len(rate) > 1:
+            raise ValueError()
+
+    except ValueError:
+        raise SnmpsimError(
+            'Bad event limit "%s", need <event>:<sample>[:<rate>]' % spec
+        )
+
+    event_limits[kind] = limit
+
+
 def set_level(level):
     global log_level
 
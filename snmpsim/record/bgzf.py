@@ -0,0 +1,292 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Block-compressed (BGZF) file access
+#
+# File is a series of independent gzip members ("blocks") each holding
+# at most 64 KiB of data. Each block header carries block size, so block
+# offsets table can be built without decompressing anything. Any gzip
+# tool can still decompress the whole file.
+#
+import bisect
+import os
+import struct
+import zlib
+
+from snmpsim.cache import LruCache
+from snmpsim.error import SnmpsimError
+
+# magic (with method and flags), mtime, extra flags, OS, extra length,
+# subfield ID, subfield length, block size less one
+BLOCK_HEADER = struct.Struct("<4sIBBH2sHH")
+
+BLOCK_MAGIC = b"\x1f\x8b\x08\x04"
+
+BLOCK_SUBFIELD = b"BC"
+
+# CRC32 and size of uncompressed block data
+BLOCK_TRAILER = struct.Struct("<II")
+
+# uncompressed data per block, compressed block must fit 64 KiB
+BLOCK_DATA_SIZE = 0xFF00
+
+# empty block marking the end of file
+EOF_BLOCK = (
+    b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC"
+    b"\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+)
+
+# number of decompressed blocks to keep, all files taken together
+BLOCK_CACHE_SIZE = 64
+
+
+class BgzfReader:
+    """Seekable reader of block-compressed file
+
+    Offsets refer to uncompressed data. Reading at any offset
+    decompresses just the block holding it, recently used blocks
+    of all files are kept decompressed in `block_cache`.
+    """
+
+    block_cache = LruCache(BLOCK_CACHE_SIZE, "block_cache")
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+
+        # blocks of file contents at hand
+        inode = os.fstat(self._file.fileno())
+
+        self._cache_key = inode.st_dev, inode.st_ino, inode.st_size, inode.st_mtime_ns
+
+        self._block_offsets = []  # offsets of blocks in the file
+        self._data_offsets = []  # offsets of blocks data in uncompressed stream
+
+        try:
+            self._size = self._scan()
+
+        except Exception:
+            self._file.close()
+            raise
+
+        self._position = 0
+
+    def _scan(self):
+        block_offset = data_offset = 0
+
+        while True:
+            self._file.seek(block_offset)
+
+            header = self._file.read(BLOCK_HEADER.size)
+
+            if not header:
+                return data_offset
+
+            try:
+                magic, _, _, _, _, subfield, _, block_size = BLOCK_HEADER.unpack(header)
+
+            except struct.error:
+                magic = subfield = None
+
+            if magic != BLOCK_MAGIC or subfield != BLOCK_SUBFIELD:
+                raise SnmpsimError(
+                    "Not a block-compressed file %s at offset "
+                    "%d" % (self._file.name, block_offset)
+                )
+
+            block_size += 1
+
+            self._file.seek(block_offset + block_size - BLOCK_TRAILER.size)
+
+            _, data_size = BLOCK_TRAILER.unpack(self._file.read(BLOCK_TRAILER.size))
+
+            if data_size:
+                self._block_offsets.append(block_offset)
+                self._data_offsets.append(data_offset)
+
+            block_offset += block_size
+            data_offset += data_size
+
+    def _block(self, index):
+        key = self._cache_key, index
+
+        data = self.block_cache.get(key)
+
+        if data is not None:
+            return data
+
+        block_offset = self._block_offsets[index]
+
+        if index + 1 < len(self._block_offsets):
+            block_end = self._block_offsets[index + 1]
+
+        else:
+            self._file.seek(0, 2)
+            block_end = self._file.tell()
+
+        self._file.seek(block_offset)
+
+        block = self._file.read(block_end - block_offset)
+
+        try:
+            data = zlib.decompress(
+                block[BLOCK_HEADER.size : -BLOCK_TRAILER.size], -zlib.MAX_WBITS
+            )
+
+        except zlib.error as exc:
+            raise SnmpsimError(
+                "Broken block at offset %d of %s: "
+                "%s" % (block_offset, self._file.name, exc)
+            )
+
+        self.block_cache.add(key, data)
+
+        return data
+
+    def _locate(self, position):
+        index = bisect.bisect_right(self._data_offsets, position) - 1
+
+        return index, position - self._data_offsets[index]
+
+    @property
+    def name(self):
+        return self._file.name
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+
+        elif whence == 2:
+            offset += self._size
+
+        self._position = max(0, offset)
+
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._size - self._position
+
+        chunks = []
+
+        while size > 0 and self._position < self._size:
+            index, start = self._locate(self._position)
+
+            chunk = self._block(index)[start : start + size]
+
+            chunks.append(chunk)
+
+            self._position += len(chunk)
+            size -= len(chunk)
+
+        return b"".join(chunks)
+
+    def readline(self):
+        chunks = []
+
+        while self._position < self._size:
+            index, start = self._locate(self._position)
+
+            data = self._block(index)
+
+            end = data.find(b"\n", start)
+
+            if end < 0:
+                chunk = data[start:]
+
+            else:
+                chunk = data[start : end + 1]
+
+            chunks.append(chunk)
+
+            self._position += len(chunk)
+
+            if end >= 0:
+                break
+
+        return b"".join(chunks)
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BgzfWriter:
+    """Writer of block-compressed file
+
+    Blocks are cut at line ends whenever possible, so that each text
+    line can be read from a single block.
+    """
+
+    def __init__(self, path, block_size=BLOCK_DATA_SIZE):
+        self._file = open(path, "wb")
+        self._block_size = block_size
+        self._buffer = bytearray()
+
+    @property
+    def name(self):
+        return self._file.name
+
+    def write(self, data):
+        self._buffer += data
+
+        while len(self._buffer) >= self._block_size:
+            size = self._buffer.rfind(b"\n", 0, self._block_size) + 1
+
+            self._write_block(self._buffer[: size or self._block_size])
+
+            del self._buffer[: size or self._block_size]
+
+        return len(data)
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS
+        )
+
+        block = compressor.compress(data) + compressor.flush()
+
+        self._file.write(
+            BLOCK_HEADER.pack(
+                BLOCK_MAGIC,
+                0,
+                0,
+                0xFF,
+                6,
+                BLOCK_SUBFIELD,
+                2,
+                BLOCK_HEADER.size + len(block) + BLOCK_TRAILER.size - 1,
+            )
+        )
+        self._file.write(block)
+        self._file.write(BLOCK_TRAILER.pack(zlib.crc32(data), len(data)))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._buffer:
+            self._write_block(self._buffer)
+            self._buffer.clear()
+
+        self._file.write(EOF_BLOCK)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,80 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Blocked Bloom filter of byte strings
+#
+# Tells for sure that a string is not in the set, strings in the set
+# as well as a few others are reported as possibly present. All bits
+# of a string fall into one 64-bit word of the filter, so that a string
+# is added or probed by a single word operation.
+#
+import hashlib
+import struct
+
+# words count, hash functions count
+FILTER_HEADER = struct.Struct("<QB")
+
+FILTER_WORD = struct.Struct("<Q")
+
+# about 1% of false positives
+BITS_PER_KEY = 12
+HASHES = 7
+
+
+def _probe(key, words, hashes):
+    """Return word position and bit mask of `key`"""
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+
+    mask = 0
+
+    for byte in digest[:hashes]:
+        mask |= 1 << (byte & 63)
+
+    return int.from_bytes(digest[8:], "little") % words, mask
+
+
+def build_filter(keys, bits_per_key=BITS_PER_KEY, hashes=HASHES):
+    """Return packed Bloom filter holding `keys`"""
+    words = (len(keys) * bits_per_key + 63) // 64
+
+    array = [0] * words
+
+    for key in keys:
+        position, mask = _probe(key, words, hashes)
+
+        array[position] |= mask
+
+    return FILTER_HEADER.pack(words, hashes) + struct.pack("<%dQ" % words, *array)
+
+
+class BloomFilter:
+    """Packed Bloom filter read off a buffer e.g. memory-mapped file"""
+
+    def __init__(self, buffer, offset=0):
+        self._words, self._hashes = FILTER_HEADER.unpack_from(buffer, offset)
+
+        self._buffer = buffer
+        self._offset = offset + FILTER_HEADER.size
+
+    @property
+    def end(self):
+        """Offset in the buffer right past the filter"""
+        return self._offset + self._words * FILTER_WORD.size
+
+    def __bool__(self):
+        return self._words > 0
+
+    def __contains__(self, key):
+        if not self._words:
+            return False
+
+        position, mask = _probe(key, self._words, self._hashes)
+
+        (word,) = FILTER_WORD.unpack_from(
+            self._buffer, self._offset + position * FILTER_WORD.size
+        )
+
+        return word & mask == mask
@@ -4,239 +4,1120 @@
 # Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
 # License: https://www.pysnmp.com/snmpsim/license.html
 #
-
+# Memory-mapped, by-OID sorted index of simulation data file records
+#
+import bisect
+import hashlib
+import json
+import mmap
 import os
+import struct
 import sys
+import tempfile
+import time
+import zlib
+from concurrent import futures
 
 from snmpsim import confdir
 from snmpsim import error
 from snmpsim import log
-from snmpsim import utils
-from snmpsim.record.search.file import get_record
+from snmpsim.record.search.bloom import BloomFilter
+from snmpsim.record.search.bloom import build_filter
+from snmpsim.record.search.file import RecordScanner
+from snmpsim.record.search.oid import TextOidEncoder
+from snmpsim.record.search.oid import encode_oid
 
-dbm = utils.try_load("anydbm")
-if dbm:
-    whichdb = utils.try_load("whichdb")
+INDEX_MAGIC = b"SNMPSIMX"
+INDEX_VERSION = 6
 
-else:
-    dbm = utils.try_load("dbm")
-    whichdb = dbm
+# magic, version, key width, entries count, EOF offset, subtree record
+# covering OIDs past the last record, records count, checksummed block
+# size, blocks count
+INDEX_HEADER = struct.Struct("<8sHHIQqQII")
 
+# record offset, next record offset, subtree record covering OIDs
+# preceding the record, subtree record enclosing the record, key
+# length, flags, next record flags
+INDEX_ENTRY = struct.Struct("<QQiiHBB")
 
-class RecordIndex:
-    def __init__(self, text_file, text_parser):
-        self._text_file = text_file
-        self._text_parser = text_parser
+# CRC32 of a data file block
+INDEX_CHECKSUM = struct.Struct("<I")
+
+# block checksums are followed by Bloom filters of record OIDs and
+# of subtree records OIDs, then by the count and the list of distinct
+# subtree record OID lengths
+INDEX_LENGTH = struct.Struct("<H")
+
+# size of data file blocks to checksum for incremental index updates
+INDEX_BLOCK_SIZE = 64 * 1024
+
+FLAG_SUBTREE = 0x01
+
+INDEX_MANIFEST = "index-manifest.json"
+
+
+def cover_positions(keys, subtree_flags):
+    """Find subtree records covering OIDs in between records
+
+    Yields a position for each record and for the end of records:
+    position of the innermost subtree record which OID is a prefix
+    of the preceding record OID, or -1. OIDs falling in between the
+    preceding record and this one may only be served by that subtree
+    record or the subtree records enclosing it.
+    """
+    enclosing = []
+
+    yield -1
+
+    for position, key in enumerate(keys):
+        while enclosing and not key.startswith(keys[enclosing[-1]]):
+            enclosing.pop()
+
+        if subtree_flags[position]:
+            enclosing.append(position)
+
+        yield enclosing[-1] if enclosing else -1
+
+
+def parent_positions(keys, subtree_flags):
+    """Find subtree records enclosing records
+
+    Yields a position for each record: position of the innermost
+    subtree record, other than the record itself, which OID is a
+    prefix of the record OID, or -1. Following these positions from
+    a subtree record leads through all subtree records enclosing it.
+    """
+    enclosing = []
+
+    for position, key in enumerate(keys):
+        while enclosing and not key.startswith(keys[enclosing[-1]]):
+            enclosing.pop()
+
+        yield enclosing[-1] if enclosing else -1
+
+        if subtree_flags[position]:
+            enclosing.append(position)
+
+
+def search_from(keys, key, lo=0):
+    """Find the first of sorted `keys` not preceding `key`, starting at `lo`
+
+    Steps forward from `lo` by doubling strides before bisecting, so
+    that keys close to `lo` are found in a few comparisons.
+    """
+    count = len(keys)
+    step = 1
+
+    hi = lo + step
+
+    while hi < count and keys[hi] < key:
+        lo = hi + 1
+        step *= 2
+        hi = lo + step
+
+    return bisect.bisect_left(keys, key, lo, min(hi, count))
+
+
+def checksum_blocks(text, block_size=INDEX_BLOCK_SIZE):
+    """Compute CRC32 and count line ends of each data file block"""
+    checksums = []
+    line_ends = []
+
+    while True:
+        block = text.read(block_size)
+
+        if not block:
+            break
+
+        checksums.append(zlib.crc32(block))
+        line_ends.append(block.count(b"\n"))
+
+    return checksums, line_ends
+
+
+class _IndexKeys:
+    """Sequence of zero-padded OID keys held in a memory-mapped index"""
+
+    def __init__(self, mm, count, key_width):
+        self._mm = mm
+        self._count = count
+        self._key_width = key_width
+        self._stride = key_width + INDEX_ENTRY.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        start = INDEX_HEADER.size + position * self._stride
+        return self._mm[start : start + self._key_width]
+
+
+class _MappedIndex:
+    """Memory-mapped index file"""
+
+    def __init__(self, index_file):
+        with open(index_file, "rb") as fl:
+            self.mm = mmap.mmap(fl.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.key_width,
+            self.count,
+            self.eof_offset,
+            self.eof_cover,
+            _,
+            _,
+            block_count,
+        ) = INDEX_HEADER.unpack_from(self.mm)
+
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.mm.close()
+            raise error.SnmpsimError("Unsupported index format %s" % index_file)
 
+        self.stride = self.key_width + INDEX_ENTRY.size
+        self.keys = _IndexKeys(self.mm, self.count, self.key_width)
+
+        offset = (
+            INDEX_HEADER.size
+            + self.count * self.stride
+            + block_count * INDEX_CHECKSUM.size
+        )
+
+        self.records_filter = BloomFilter(self.mm, offset)
+        self.subtrees_filter = BloomFilter(self.mm, self.records_filter.end)
+
+        offset = self.subtrees_filter.end
+
+        (count,) = INDEX_LENGTH.unpack_from(self.mm, offset)
+
+        self.subtree_lengths = frozenset(
+            INDEX_LENGTH.unpack_from(self.mm, offset + (idx + 1) * INDEX_LENGTH.size)[0]
+            for idx in range(count)
+        )
+
+    def close(self):
+        self.mm.close()
+
+
+# open handles shared by data files within the process:
+# key -> [handle, references count]
+_shared_handles = {}
+
+
+def _acquire(key, opener):
+    try:
+        entry = _shared_handles[key]
+
+    except KeyError:
+        entry = _shared_handles[key] = [opener(), 0]
+
+    entry[1] += 1
+
+    return entry[0]
+
+
+def _release(key):
+    entry = _shared_handles[key]
+
+    entry[1] -= 1
+
+    if not entry[1]:
+        del _shared_handles[key]
+        entry[0].close()
+
+
+_index_updater = None
+
+
+def _update_in_background(func):
+    """Run `func` in the thread indices of changed data files are updated in"""
+    global _index_updater
+
+    if _index_updater is None:
+        _index_updater = futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="snmpsim-index"
+        )
+
+    return _index_updater.submit(func)
+
+
+def hash_file(path):
+    """Compute SHA-256 digest of file contents"""
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as fl:
+        for chunk in iter(lambda: fl.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Catalogue of prebuilt indices kept in a cache directory
+
+    Each data file is recorded along with its size, modification time
+    and content hash, so unchanged data files need not be hashed on
+    start up. Index file locations are relative to the cache directory
+    so that the whole directory can be moved elsewhere (e.g. baked into
+    a container image).
+    """
+
+    _manifests = {}
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._manifest_file = os.path.join(cache_dir, INDEX_MANIFEST)
+        self._entries = {}
+
+    @classmethod
+    def get(cls, cache_dir):
+        """Return manifest of `cache_dir` loading it once per process"""
         try:
-            self._db_file = text_file[: text_file.rindex(os.path.extsep)]
+            return cls._manifests[cache_dir]
+
+        except KeyError:
+            manifest = cls._manifests[cache_dir] = cls(cache_dir).load()
+            return manifest
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        try:
+            with open(self._manifest_file) as fl:
+                manifest = json.load(fl)
+
+            version, entries = manifest["version"], manifest["files"]
+
+        except FileNotFoundError:
+            return self
+
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            log.error(
+                "Ignoring broken index manifest %s: %s" % (self._manifest_file, exc)
+            )
+            return self
 
-        except ValueError:
-            self._db_file = text_file
+        if version != INDEX_VERSION:
+            log.info(
+                "Ignoring index manifest %s of index version "
+                "%s" % (self._manifest_file, version)
+            )
+            return self
 
-        self._db_file += os.path.extsep + "dbm"
+        self._entries.update(entries)
 
-        self._db_file = os.path.join(
-            confdir.cache,
-            os.path.splitdrive(self._db_file)[1].replace(os.path.sep, "_"),
+        log.info(
+            "Index manifest %s loaded, %d data files "
+            "listed" % (self._manifest_file, len(self._entries))
         )
 
-        self._db = self._text = None
-        self._db_type = "?"
+        return self
+
+    def add(self, text_file, index_file, digest):
+        inode = os.stat(text_file)
+
+        self._entries[os.path.abspath(text_file)] = {
+            "index": os.path.relpath(index_file, self._cache_dir),
+            "size": inode.st_size,
+            "mtime": inode.st_mtime,
+            "sha256": digest,
+        }
+
+    def save(self):
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+
+            with os.fdopen(fd, "w") as fl:
+                json.dump(
+                    {"version": INDEX_VERSION, "files": self._entries},
+                    fl,
+                    indent=2,
+                    sort_keys=True,
+                )
+
+            os.replace(tmp_file, self._manifest_file)
+
+        except OSError as exc:
+            raise error.SnmpsimError(
+                "Failed to write index manifest %s: %s" % (self._manifest_file, exc)
+            )
+
+    def lists(self, index_file):
+        """Check whether index belongs to any of the listed data files"""
+        index_file = os.path.relpath(index_file, self._cache_dir)
+
+        return any(entry["index"] == index_file for entry in self._entries.values())
+
+    def digest(self, text_file, inode):
+        """Return recorded content hash of unchanged data file"""
+        entry = self._entries.get(os.path.abspath(text_file))
+
+        if (
+            entry
+            and entry["size"] == inode.st_size
+            and entry["mtime"] == inode.st_mtime
+        ):
+            return entry["sha256"]
+
+
+class RecordIndex:
+    # data file content hashes: (device, inode, size, mtime) -> (hash, listed)
+    _digests = {}
+
+    # indices (re)built by this process
+    _built_indices = set()
+
+    def __init__(self, text_file, text_parser):
+        self._text_file = text_file
+        self._text_parser = text_parser
+        self._cache_dir = confdir.cache
+
+        # indices are named after data file contents, located on create()
+        self._index_file = None
+
+        self._index_key = self._text_key = None
+
+        self._mm = self._text = None
+        self._keys = None
+        self._count = self._key_width = self._stride = 0
+        self._eof_offset = 0
+        self._eof_cover = -1
+        self._records_filter = self._subtrees_filter = None
+        self._subtree_lengths = frozenset()
 
         self._text_file_time = 0
+        self._next_check_time = 0
+        self._update_future = None
 
     def __str__(self):
         return "Data file {}, {}-indexed, {}".format(
             self._text_file,
-            self._db_type,
-            self._db and "opened" or "closed",
+            "mmap",
+            self._mm is not None and "opened" or "closed",
         )
 
+    @property
+    def text_file(self):
+        return self._text_file
+
+    @property
+    def index_file(self):
+        return self._index_file
+
+    def digest(self):
+        """Return content hash of data file
+
+        Hashes are remembered per data file inode and modification time,
+        hashes of data files listed in the index manifest are taken from
+        there.
+        """
+        return self._resolve_digest()[0]
+
+    @classmethod
+    def remember_digest(cls, key, entry):
+        """Remember content hash taken by another process"""
+        cls._digests.setdefault(key, entry)
+
+    def digest_entry(self):
+        """Return `(key, (hash, listed))` content hash entry of data file
+
+        Entries can be passed over to other processes to be remembered
+        there by `remember_digest()` rather than hashing data file again.
+        """
+        inode = os.stat(self._text_file)
+
+        key = inode.st_dev, inode.st_ino, inode.st_size, inode.st_mtime_ns
+
+        try:
+            return key, self._digests[key]
+
+        except KeyError:
+            pass
+
+        digest = IndexManifest.get(self._cache_dir).digest(self._text_file, inode)
+
+        if digest:
+            self._digests[key] = digest, True
+
+        else:
+            try:
+                digest = hash_file(self._text_file)
+
+            except OSError as exc:
+                raise error.SnmpsimError(
+                    f"Failed to read data file {self._text_file}: {exc}"
+                )
+
+            self._digests[key] = digest, False
+
+        return key, self._digests[key]
+
+    def _resolve_digest(self):
+        return self.digest_entry()[1]
+
+    def __len__(self):
+        return self._count
+
     def is_open(self):
-        return self._db is not None
+        return self._mm is not None
+
+    def get_handles(self, check_interval=0):
+        """Return data file and index handles, open them if needed
 
-    def get_handles(self):
+        Data file modification time is checked at most once in
+        `check_interval` seconds. Index of changed data file is updated
+        in background, records are served off the old index till the
+        new one is in place.
+        """
         if self.is_open():
-            if self._text_file_time != os.stat(self._text_file)[8]:
-                log.info("Text file %s modified, closing" % self._text_file)
-                self.close()
+            if self._update_future is None:
+                now = time.monotonic()
 
-        if not self.is_open():
+                if now < self._next_check_time:
+                    return self._text, self._mm
+
+                self._next_check_time = now + check_interval
+
+                if self._text_file_time != os.stat(self._text_file)[8]:
+                    log.info("Text file %s modified, re-indexing" % self._text_file)
+
+                    self._update_future = _update_in_background(self._updated)
+
+            if self._update_future is not None and self._update_future.done():
+                self.wait_update()
+
+        else:
             self.create()
             self.open()
 
-        return self._text, self._db
+            self._next_check_time = time.monotonic() + check_interval
 
-    @property
-    def _db_files(self):
-        return (
-            self._db_file + os.path.extsep + "db",
-            self._db_file + os.path.extsep + "dat",
-            self._db_file,
-        )
+        return self._text, self._mm
 
-    def create(self, force_index_build=False, validate_data=False):
-        text_file_time = os.stat(self._text_file)[8]
+    def _updated(self):
+        """Return index of data file as is, derived from the current one"""
+        record_index = RecordIndex(self._text_file, self._text_parser)
 
-        # gdbm on OS X seems to voluntarily append .db, trying to catch that
+        record_index._cache_dir = self._cache_dir
+        record_index._index_file = self._index_file
 
-        index_needed = force_index_build
+        return record_index.create()
 
-        for db_file in self._db_files:
-            if os.path.exists(db_file):
-                if text_file_time < os.stat(db_file)[8]:
-                    if index_needed:
-                        log.info("Forced index rebuild %s" % db_file)
+    def wait_update(self):
+        """Block till background index update completes, switch over to it"""
+        if self._update_future is None:
+            return self
 
-                    elif not whichdb.whichdb(self._db_file):
-                        index_needed = True
-                        log.info(
-                            "Unsupported index format, rebuilding " "index %s" % db_file
-                        )
+        future, self._update_future = self._update_future, None
 
-                else:
-                    index_needed = True
-                    log.info("Index %s out of date" % db_file)
+        try:
+            updated = future.result()
 
-                break
+        except Exception as exc:
+            log.error("Index update failed for %s: %s" % (self._text_file, exc))
+            return self
 
-        else:
+        prev_index_file = self._index_file
+
+        self.close()
+
+        self._index_file = updated.index_file
+        self._text_file_time = updated._text_file_time
+
+        self.open()
+
+        self._remove_index(prev_index_file)
+
+        return self
+
+    @staticmethod
+    def _probe_index(index_file):
+        try:
+            with open(index_file, "rb") as fl:
+                header = fl.read(INDEX_HEADER.size)
+
+            magic, version = INDEX_HEADER.unpack(header)[:2]
+
+        except (OSError, struct.error):
+            return False
+
+        return magic == INDEX_MAGIC and version == INDEX_VERSION
+
+    def create(self, force_index_build=False):
+        text_file_time = os.stat(self._text_file)[8]
+
+        prev_index_file = self._index_file
+
+        digest, listed = self._resolve_digest()
+
+        # data files of same contents share the same index
+        self._index_file = os.path.join(
+            self._cache_dir,
+            os.path.extsep.join((digest, self._text_parser.ext, "idx")),
+        )
+
+        index_needed = False
+
+        if force_index_build and self._index_file not in self._built_indices:
+            index_needed = True
+            log.info("Forced index rebuild %s" % self._index_file)
+
+        elif not os.path.exists(self._index_file):
             index_needed = True
             log.info(
                 "Index %s does not exist for data file "
-                "%s" % (self._db_file, self._text_file)
+                "%s" % (self._index_file, self._text_file)
             )
 
+        elif not listed and not self._probe_index(self._index_file):
+            index_needed = True
+            log.info("Unsupported index format, rebuilding index %s" % self._index_file)
+
         if index_needed:
-            # these might speed-up indexing
-            open_flags = "nfu"
+            incremental = (
+                prev_index_file
+                and prev_index_file != self._index_file
+                and not force_index_build
+            )
 
-            errors = []
+            if not (incremental and self._update(prev_index_file)):
+                self._build()
+
+            self._built_indices.add(self._index_file)
+
+        self._remove_index(prev_index_file)
+
+        self._text_file_time = text_file_time
+
+        return self
+
+    def remove(self):
+        """Close and remove index unless still used"""
+        self.close()
+
+        index_file, self._index_file = self._index_file, None
+
+        self._remove_index(index_file)
+
+    def _remove_index(self, index_file):
+        """Remove index of previous data file contents unless still used
+
+        Index stays while it is open in this process or listed in the
+        index manifest.
+        """
+        if not index_file or index_file == self._index_file:
+            return
+
+        if ("index", index_file) in _shared_handles:
+            return
+
+        if IndexManifest.get(self._cache_dir).lists(index_file):
+            return
+
+        try:
+            os.remove(index_file)
+
+        except FileNotFoundError:
+            return
+
+        except OSError as exc:
+            log.info("Failed to remove index %s: %s" % (index_file, exc))
+            return
+
+        self._built_indices.discard(index_file)
+
+        log.info("Index %s of previous data file contents removed" % index_file)
+
+    def _open_text(self):
+        try:
+            return self._text_parser.open(self._text_file)
+
+        except Exception as exc:
+            raise error.SnmpsimError(
+                f"Failed to open data file {self._text_file}: {exc}"
+            )
+
+    def _parse(self, text, records, line_no, offset, stop_offset):
+        """Index data file records up to `stop_offset` or EOF
+
+        Returns the number of records seen, line number and offset
+        where parsing stopped.
+        """
+        grammar = self._text_parser.grammar
+
+        encode = TextOidEncoder().encode
+
+        count = 0
+
+        scanner = RecordScanner(text, line_no, offset)
+
+        for batch in scanner:
+            for line_no, offset, line in batch:
+                if offset >= stop_offset:
+                    return count, line_no, offset
 
-            while open_flags:
                 try:
-                    db = dbm.open(self._db_file, open_flags)
+                    oid, tag = grammar.parse_oid_tag(line)
 
                 except Exception as exc:
-                    log.debug(
-                        'DBM open with flags "%s" failed on file '
-                        "%s: %s" % (open_flags, self._db_file, exc)
+                    raise error.SnmpsimError(
+                        "Data error at %s:%d: %s" % (self._text_file, line_no, exc)
+                    )
+
+                try:
+                    key = encode(oid)
+
+                except (ValueError, OverflowError) as exc:
+                    raise error.SnmpsimError(
+                        "OID error at %s:%d: %s" % (self._text_file, line_no, exc)
                     )
-                    errors.append(str(exc))
-                    open_flags = open_flags[:-1]
-                    continue
 
-                else:
+                # for lines serving subtrees, type is empty in tag field
+                records[key] = offset, tag[0] == ":"
+
+                count += 1
+
+        return count, scanner.line_no, scanner.offset
+
+    def _build(self):
+        text = self._open_text()
+
+        log.info(
+            "Building index %s for data file %s..."
+            % (self._index_file, self._text_file)
+        )
+
+        sys.stdout.flush()
+
+        records = {}
+
+        try:
+            count, line_no, offset = self._parse(text, records, 0, 0, float("inf"))
+
+            text.seek(0)
+
+            checksums = checksum_blocks(text)[0]
+
+        finally:
+            text.close()
+
+        self._write(sorted(records.items()), offset, count, checksums)
+
+        log.info("...%d entries indexed" % line_no)
+
+    @staticmethod
+    def _read_index(index_file):
+        """Load header, entries and block checksums of existing index"""
+        with open(index_file, "rb") as fl:
+            index = fl.read()
+
+        header = INDEX_HEADER.unpack_from(index)
+
+        key_width, count = header[2:4]
+        block_size, block_count = header[7:9]
+
+        stride = key_width + INDEX_ENTRY.size
+
+        entries = []
+
+        for position in range(count):
+            start = INDEX_HEADER.size + position * stride
+
+            offset, _, _, _, key_len, flags, _ = INDEX_ENTRY.unpack_from(
+                index, start + key_width
+            )
+
+            entries.append(
+                (offset, index[start : start + key_len], bool(flags & FLAG_SUBTREE))
+            )
+
+        start = INDEX_HEADER.size + count * stride
+
+        checksums = [
+            INDEX_CHECKSUM.unpack_from(index, start + idx * INDEX_CHECKSUM.size)[0]
+            for idx in range(block_count)
+        ]
+
+        return header, entries, checksums
+
+    def _update(self, prev_index_file):
+        """Re-index just the changed part of data file
+
+        New index is derived from `prev_index_file` built for the
+        previous contents of data file. Assumes data file has been
+        changed in one contiguous region, which includes appending
+        records to it. Data file blocks preceding the change are found
+        by their checksums, blocks following the change are found by
+        checksums shifted by the change in file size. Only the records
+        in between are parsed, the rest are taken from the previous
+        index.
+
+        Returns `False` if previous index can not be reused.
+        """
+        if not self._probe_index(prev_index_file):
+            return False
+
+        try:
+            header, entries, checksums = self._read_index(prev_index_file)
+
+        except (OSError, struct.error) as exc:
+            log.info("Failed to read index %s: %s" % (prev_index_file, exc))
+            return False
+
+        old_eof, _, old_total, block_size = header[4:8]
+
+        # duplicate records are not in the index, yet may resurface
+        if old_total != len(entries) or block_size != INDEX_BLOCK_SIZE:
+            return False
+
+        text = self._open_text()
+
+        try:
+            new_checksums, line_ends = checksum_blocks(text, block_size)
+
+            new_eof = text.tell()
+
+            # unchanged head of data file
+            block = 0
+
+            for old_crc, new_crc in zip(checksums, new_checksums):
+                if old_crc != new_crc:
                     break
-            else:
-                raise error.SnmpsimError(
-                    "Failed to create %s for data file "
-                    "%s: %s" % (self._db_file, self._text_file, "; ".join(errors))
-                )
 
-            try:
-                text = self._text_parser.open(self._text_file)
+                block += 1
 
-            except Exception as exc:
-                raise error.SnmpsimError(
-                    f"Failed to open data file {self._db_file}: {exc}"
-                )
+            start = min(block * block_size, old_eof, new_eof)
+
+            entries.sort()
+
+            position = bisect.bisect_right(entries, (start, b"\xff"))
+
+            head = entries[:position]
+
+            # re-parse from the last record starting in the unchanged head
+            head_offset = head and head.pop()[0] or 0
+
+            # unchanged tail of data file moved by the change in size
+            delta = new_eof - old_eof
+
+            tail_offset = old_eof
+
+            for block in range(len(checksums) - 1, -1, -1):
+                offset = block * block_size
+
+                if offset < start or offset + delta < start:
+                    break
+
+                size = min(block_size, old_eof - offset)
+
+                text.seek(offset + delta)
+
+                if zlib.crc32(text.read(size)) != checksums[block]:
+                    break
+
+                tail_offset = offset
+
+            position = bisect.bisect_right(entries, (tail_offset, b"\xff"))
+
+            tail = entries[position:]
+
+            stop_offset = tail and tail[0][0] + delta or new_eof
+
+            # line number of the first record to parse
+            block = head_offset // block_size
+
+            text.seek(block * block_size)
+
+            line_no = sum(line_ends[:block]) + text.read(
+                head_offset - block * block_size
+            ).count(b"\n")
 
             log.info(
-                "Building index %s for data file %s (open flags "
-                '"%s")...' % (self._db_file, self._text_file, open_flags)
+                "Updating index %s for data file %s, re-indexing "
+                "bytes %d-%d..."
+                % (self._index_file, self._text_file, head_offset, stop_offset)
             )
 
-            sys.stdout.flush()
+            records = {}
 
-            line_no = 0
-            offset = 0
-            prev_offset = -1
+            for offset, key, subtree_flag in head:
+                records[key] = offset, subtree_flag
 
-            while True:
-                line, line_no, offset = get_record(text, line_no, offset)
+            text.seek(head_offset)
 
-                if not line:
-                    # reference to last OID in data file
-                    db["last"] = "%d,%d,%d" % (offset, 0, prev_offset)
-                    break
+            count, line_no, offset = self._parse(
+                text, records, line_no, head_offset, stop_offset
+            )
 
-                try:
-                    oid, tag, val = self._text_parser.grammar.parse(line)
+        finally:
+            text.close()
 
-                except Exception as exc:
-                    db.close()
+        if offset != stop_offset:
+            log.info("Changed records misaligned at offset %d" % offset)
+            return False
 
-                    for db_file in self._db_files:
-                        try:
-                            os.remove(db_file)
+        for offset, key, subtree_flag in tail:
+            records[key] = offset + delta, subtree_flag
 
-                        except OSError:
-                            pass
+        count += len(head) + len(tail)
 
-                    raise error.SnmpsimError(
-                        "Data error at %s:%d:" " %s" % (self._text_file, line_no, exc)
-                    )
+        self._write(sorted(records.items()), new_eof, count, new_checksums)
 
-                if validate_data:
-                    try:
-                        self._text_parser.evaluate_oid(oid)
+        log.info(
+            "...%d entries re-indexed, %d entries "
+            "reused" % (count - len(head) - len(tail), len(head) + len(tail))
+        )
 
-                    except Exception as exc:
-                        db.close()
+        return True
 
-                        for db_file in self._db_files:
-                            try:
-                                os.remove(db_file)
+    def _write(self, records, eof_offset, total, checksums):
+        key_width = max([len(key) for key, _ in records] or [0])
 
-                            except OSError:
-                                pass
+        keys = [key for key, _ in records]
 
-                        raise error.SnmpsimError(
-                            "OID error at %s:%d: %s" % (self._text_file, line_no, exc)
-                        )
+        subtree_flags = [subtree_flag for _, (_, subtree_flag) in records]
 
-                    try:
-                        self._text_parser.evaluate_value(
-                            oid, tag, val, dataValidation=True
-                        )
+        covers = list(cover_positions(keys, subtree_flags))
+        parents = list(parent_positions(keys, subtree_flags))
+
+        subtree_keys = [key for key, flag in zip(keys, subtree_flags) if flag]
 
-                    except Exception as exc:
-                        log.info(
-                            "ERROR at line %s, value %r: " "%s" % (line_no, val, exc)
+        subtree_lengths = sorted(set(len(key) for key in subtree_keys))
+
+        # successor of the last record is the end of data file
+        successors = [entry for _, entry in records[1:]] + [(eof_offset, False)]
+
+        index_dir = os.path.dirname(self._index_file)
+
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+
+        except OSError as exc:
+            raise error.SnmpsimError(
+                "Failed to create %s for data file "
+                "%s: %s" % (self._index_file, self._text_file, exc)
+            )
+
+        try:
+            with os.fdopen(fd, "wb") as fl:
+                fl.write(
+                    INDEX_HEADER.pack(
+                        INDEX_MAGIC,
+                        INDEX_VERSION,
+                        key_width,
+                        len(records),
+                        eof_offset,
+                        covers[-1],
+                        total,
+                        INDEX_BLOCK_SIZE,
+                        len(checksums),
+                    )
+                )
+
+                for position, (key, (offset, subtree_flag)) in enumerate(records):
+                    next_offset, next_subtree_flag = successors[position]
+
+                    fl.write(key.ljust(key_width, b"\x00"))
+                    fl.write(
+                        INDEX_ENTRY.pack(
+                            offset,
+                            next_offset,
+                            covers[position],
+                            parents[position],
+                            len(key),
+                            subtree_flag and FLAG_SUBTREE or 0,
+                            next_subtree_flag and FLAG_SUBTREE or 0,
                         )
+                    )
 
-                # for lines serving subtrees, type is empty in tag field
-                db[oid] = "%d,%d,%d" % (offset, tag[0] == ":", prev_offset)
+                for checksum in checksums:
+                    fl.write(INDEX_CHECKSUM.pack(checksum))
 
-                if tag[0] == ":":
-                    prev_offset = offset
+                fl.write(build_filter(keys))
+                fl.write(build_filter(subtree_keys))
 
-                else:
-                    prev_offset = -1  # not a subtree - no back reference
+                fl.write(INDEX_LENGTH.pack(len(subtree_lengths)))
 
-                offset += len(line)
+                for length in subtree_lengths:
+                    fl.write(INDEX_LENGTH.pack(length))
 
-            text.close()
-            db.close()
+            # readers having the old index mapped are not affected
+            os.replace(tmp_file, self._index_file)
 
-            log.info("...%d entries indexed" % line_no)
+        except OSError as exc:
+            try:
+                os.remove(tmp_file)
 
-        self._text_file_time = os.stat(self._text_file)[8]
+            except OSError:
+                pass
 
-        self._db_type = whichdb.whichdb(self._db_file)
+            raise error.SnmpsimError(
+                "Failed to write %s for data file "
+                "%s: %s" % (self._index_file, self._text_file, exc)
+            )
 
-        return self
+    def search(self, key, lo=0):
+        """Find the first record not preceding encoded OID `key`
+
+        Returns record position in the index and a flag indicating
+        whether record's OID is exactly the one searched for. Records
+        before position `lo` are not considered.
+        """
+        if len(key) > self._key_width:
+            padded_key = key
+
+        else:
+            padded_key = key.ljust(self._key_width, b"\x00")
+
+        position = search_from(self._keys, padded_key, lo)
+
+        return position, position < self._count and self._keys[position] == padded_key
+
+    def _unpack_entry(self, position):
+        return INDEX_ENTRY.unpack_from(
+            self._mm, INDEX_HEADER.size + position * self._stride + self._key_width
+        )
+
+    def entry(self, position):
+        """Return `(offset, subtree_flag, cover)` of a record
+
+        Cover is the position of the subtree record which may serve
+        OIDs preceding the record, or -1. Position right past the last
+        record refers to the end of data file.
+        """
+        if position >= self._count:
+            return self._eof_offset, False, self._eof_cover
+
+        offset, _, cover, _, _, flags, _ = self._unpack_entry(position)
+
+        return offset, bool(flags & FLAG_SUBTREE), cover
+
+    def successor(self, position):
+        """Return `(offset, subtree_flag)` of the record following one"""
+        if position >= self._count:
+            return self._eof_offset, False
+
+        _, next_offset, _, _, _, _, next_flags = self._unpack_entry(position)
+
+        return next_offset, bool(next_flags & FLAG_SUBTREE)
+
+    def resolve(self, key, next_flag=False, lo=0):
+        """Find position of the record serving encoded OID `key`
+
+        Returns record position along with flags telling whether record
+        OID matches `key` exactly and whether record serves a subtree.
+        On GETNEXT, exactly matched record gives way to the next one
+        unless it serves a subtree. OIDs not matching any record are
+        served by the innermost subtree record enclosing them.
+        """
+        position, exact_match = self.search(key, lo)
+
+        if position >= self._count:
+            subtree_flag, cover = False, self._eof_cover
+
+        else:
+            _, _, cover, _, _, flags, next_flags = self._unpack_entry(position)
+
+            subtree_flag = bool(flags & FLAG_SUBTREE)
+
+        if exact_match:
+            if next_flag and not subtree_flag:
+                return position + 1, True, bool(next_flags & FLAG_SUBTREE)
+
+        else:
+            # nested subtrees may not serve the OID, enclosing ones may
+            while cover >= 0 and not key.startswith(self.key(cover)):
+                cover = self._unpack_entry(cover)[3]
+
+            if cover >= 0:
+                return cover, False, True
+
+        return position, exact_match, subtree_flag
+
+    def absent(self, key):
+        """Tell whether no record matches or serves encoded OID `key`
+
+        Answers off Bloom filters without searching the index, so a few
+        absent OIDs are not recognized as such.
+        """
+        if key in self._records_filter:
+            return False
+
+        if self._subtrees_filter:
+            position = 0
+
+            # prefixes of the OID which may be subtree records OIDs
+            while position < len(key):
+                position += key[position] + 1
+
+                if (
+                    position in self._subtree_lengths
+                    and key[:position] in self._subtrees_filter
+                ):
+                    return False
+
+        return True
+
+    def key(self, position):
+        """Return encoded OID of a record"""
+        start = INDEX_HEADER.size + position * self._stride
+
+        key_len = INDEX_ENTRY.unpack_from(self._mm, start + self._key_width)[4]
+
+        return self._mm[start : start + key_len]
 
     def lookup(self, oid):
-        return self._db[oid]
+        position, exact_match = self.search(encode_oid(oid))
+
+        if not exact_match:
+            raise KeyError(oid)
+
+        return self.entry(position)
 
     def open(self):
-        self._text = self._text_parser.open(self._text_file)
-        self._db = dbm.open(self._db_file)
+        index_key = "index", self._index_file
+
+        index = _acquire(index_key, lambda: _MappedIndex(self._index_file))
+
+        inode = os.stat(self._text_file)
+
+        text_key = "text", inode.st_dev, inode.st_ino
+
+        try:
+            self._text = _acquire(
+                text_key, lambda: self._text_parser.open(self._text_file)
+            )
+
+        except Exception:
+            _release(index_key)
+            raise
+
+        self._index_key = index_key
+        self._text_key = text_key
+
+        self._key_width = index.key_width
+        self._count = index.count
+        self._eof_offset = index.eof_offset
+        self._eof_cover = index.eof_cover
+        self._stride = index.stride
+        self._keys = index.keys
+        self._records_filter = index.records_filter
+        self._subtrees_filter = index.subtrees_filter
+        self._subtree_lengths = index.subtree_lengths
+        self._mm = index.mm
 
     def close(self):
-        self._text.close()
-        self._db.close()
-        self._db = self._text = None
+        if not self.is_open():
+            return
+
+        _release(self._text_key)
+        _release(self._index_key)
+
+        self._mm = self._text = self._keys = None
+        self._records_filter = self._subtrees_filter = None
+        self._index_key = self._text_key = None
+
+        # data file is checked anew once reopened
+        self._update_future = None
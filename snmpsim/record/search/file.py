@@ -4,6 +4,11 @@
 # Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
 # License: https://www.pysnmp.com/snmpsim/license.html
 #
+
+# first bytes of OIDs, lines starting otherwise may be comments
+_OID_LEADS = frozenset(bytes((byte,)) for byte in b"0123456789.")
+
+
 # read lines from text file ignoring #comments and blank lines
 def get_record(fileObj, line_no=None, offset=0):
     line = fileObj.readline()
@@ -27,68 +32,81 @@ def get_record(fileObj, line_no=None, offset=0):
     return line, line_no, offset
 
 
-def find_eol(file_obj, offset, block_size=256, eol=b"\n"):
-    while True:
-        if offset < block_size:
-            offset, block_size = 0, offset
+class RecordScanner:
+    """Read data file records in bulk
 
-        else:
-            offset -= block_size
+    Iterating over the scanner yields lists of `(line_no, offset, line)`
+    of data file records, one list per chunk of data file read. Lines
+    come without line endings, comments and blank lines are skipped.
 
-        file_obj.seek(offset)
+    Scanning starts at the current position of `file_obj`, which is at
+    `line_no` and `offset` of data file. These attributes then follow
+    the scanned lines, ending up at the end of data file.
+    """
 
-        chunk = file_obj.read(block_size)
+    CHUNK_SIZE = 1 << 20
 
-        try:
-            return offset + chunk.rindex(eol) + 1
+    def __init__(self, file_obj, line_no=0, offset=0, chunk_size=CHUNK_SIZE):
+        self.line_no = line_no
+        self.offset = offset
+        self._file_obj = file_obj
+        self._chunk_size = chunk_size
 
-        except ValueError:
-            if offset == 0:
-                return offset
+    def __iter__(self):
+        tail = b""
 
-            continue
+        while True:
+            chunk = self._file_obj.read(self._chunk_size)
 
+            if chunk:
+                end = chunk.rfind(b"\n") + 1
 
-# In-place, by-OID binary search
-def search_record_by_oid(oid, file_obj, text_parser):
-    lo = mid = 0
-    prev_mid = -1
+                if not end:
+                    tail += chunk
+                    continue
 
-    file_obj.seek(0, 2)
+                lines = (tail + chunk[:end]).split(b"\n")
 
-    hi = sz = file_obj.tell()
+                # nothing follows the last line ending
+                lines.pop()
 
-    while lo < hi:
-        mid = (lo + hi) // 2
-        file_obj.seek(mid)
-        mid = find_eol(file_obj, mid)
-        file_obj.seek(mid)
-        if mid == prev_mid:  # loop condition due to stepping back pivot
-            break
+                tail = chunk[end:]
 
-        if mid >= sz:
-            return sz
+                yield self._scan(lines)
 
-        line, _, skipped_offset = get_record(file_obj)
+            elif tail:
+                # the last line lacks line ending
+                yield self._scan([tail])
 
-        if not line:
-            return hi
+                self.offset -= 1
 
-        midval, _ = text_parser.evaluate(line, oidOnly=True)
+                return
 
-        if midval < oid:
-            lo = mid + skipped_offset + len(line)
+            else:
+                return
 
-        elif midval > oid:
-            hi = mid
+    def _scan(self, lines):
+        records = []
 
-        else:
-            return mid
+        line_no = self.line_no
+        offset = self.offset
+
+        for line in lines:
+            line_no += 1
+
+            if line[:1] not in _OID_LEADS:
+                stripped = line.strip()
+
+                # skip comment or blank line
+                if not stripped or stripped.startswith(b"#"):
+                    offset += len(line) + 1
+                    continue
+
+            records.append((line_no, offset, line))
 
-        prev_mid = mid
+            offset += len(line) + 1
 
-    if lo == mid:
-        return lo
+        self.line_no = line_no
+        self.offset = offset
 
-    else:
-        return hi
+        return records
@@ -0,0 +1,97 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Canonical byte encoding of OIDs
+#
+# Each sub-OID is serialized as its big-endian, minimal length
+# representation prefixed by a single byte holding that length. Encoded
+# OIDs compare byte-wise just like OIDs do. Sub-OID prefixes are never
+# zero, so zero-padded keys of different length compare in OID order
+# as well.
+#
+from pyasn1.type import univ
+
+# encodings of the most common, single-octet sub-OIDs
+_SHORT_ARCS = [bytes((1, arc)) for arc in range(256)]
+
+# same by sub-OID text, both `str` and `bytes`
+_TEXT_ARCS = {}
+
+for _arc in range(256):
+    _TEXT_ARCS[str(_arc)] = _TEXT_ARCS[b"%d" % _arc] = _SHORT_ARCS[_arc]
+
+
+def _encode_arc(arc):
+    if 0 <= arc < 256:
+        return _SHORT_ARCS[arc]
+
+    size = (arc.bit_length() + 7) // 8
+
+    return bytes((size,)) + arc.to_bytes(size, "big")
+
+
+def encode_oid(oid):
+    """Encode OID into a byte string which sorts just like the OID does
+
+    OID is a sequence of sub-OIDs e.g. a tuple of integers or
+    :py:class:`ObjectIdentifier`.
+    """
+    return b"".join([_encode_arc(arc) for arc in oid])
+
+
+def encode_text_oid(text):
+    """Encode dotted OID text, `str` or `bytes`, leading dot is allowed"""
+    dot = "." if isinstance(text, str) else b"."
+
+    return b"".join(
+        [_TEXT_ARCS.get(arc) or _encode_arc(int(arc)) for arc in text.split(dot) if arc]
+    )
+
+
+class TextOidEncoder:
+    """Encode dotted OIDs text one after another
+
+    Consecutive OIDs of data files mostly differ in the last sub-OID
+    only, so encoding of the rest is carried over from the OID before.
+    """
+
+    def __init__(self):
+        self._prefix = None
+        self._prefix_key = b""
+
+    def encode(self, text):
+        prefix, _, arc = text.rpartition("." if isinstance(text, str) else b".")
+
+        if not arc:
+            return encode_text_oid(text)
+
+        if prefix != self._prefix:
+            self._prefix_key = encode_text_oid(prefix)
+            self._prefix = prefix
+
+        return self._prefix_key + (_TEXT_ARCS.get(arc) or _encode_arc(int(arc)))
+
+
+def decode_arcs(key):
+    """Decode encoded OID into a tuple of sub-OIDs"""
+    arcs = []
+
+    position = 0
+
+    while position < len(key):
+        size = key[position]
+        position += 1
+
+        arcs.append(int.from_bytes(key[position : position + size], "big"))
+
+        position += size
+
+    return tuple(arcs)
+
+
+def decode_oid(key):
+    """Decode encoded OID into :py:class:`ObjectIdentifier`"""
+    return univ.ObjectIdentifier(decode_arcs(key))
@@ -8,6 +8,7 @@ import bz2
 
 from snmpsim import error
 from snmpsim.grammar import snmprec
+from snmpsim.record import bgzf
 from snmpsim.record import dump
 
 
@@ -135,3 +136,14 @@ class CompressedSnmprecRecord(SnmprecRecord):
     @staticmethod
     def open(path, flags="rb"):
         return bz2.BZ2File(path, flags)
+
+
+class BlockCompressedSnmprecRecord(SnmprecRecord):
+    ext = "snmprec.bgz"
+
+    @staticmethod
+    def open(path, flags="rb"):
+        if "w" in flags:
+            return bgzf.BgzfWriter(path)
+
+        return bgzf.BgzfReader(path)
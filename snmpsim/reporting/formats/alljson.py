@@ -76,6 +76,18 @@ def ensure_base_types(f):
     return decorated_function
 
 
+# cache counters by activity update parameters they are updated by
+CACHE_COUNTERS = {
+    "%s_%s_count" % (cache, event): "%s_%s" % (cache, counter)
+    for cache in ("handle", "walk_cache", "value_cache", "block_cache")
+    for event, counter in (
+        ("hit", "hits"),
+        ("miss", "misses"),
+        ("eviction", "evictions"),
+    )
+}
+
+
 class NestingDict(dict):
     """Dict with sub-dict as a defaulted value"""
 
@@ -88,6 +100,32 @@ class NestingDict(dict):
             return value
 
 
+def merge_metrics(metrics, other):
+    """Add up `other` metrics tree into `metrics`
+
+    Counters are summed up, time spans are widened, other values
+    are taken from `other`.
+    """
+    for key, value in other.items():
+        if isinstance(value, dict):
+            merge_metrics(metrics[key], value)
+
+        elif key not in metrics:
+            metrics[key] = value
+
+        elif key == "first_update":
+            metrics[key] = min(metrics[key], value)
+
+        elif key == "last_update":
+            metrics[key] = max(metrics[key], value)
+
+        elif isinstance(value, int) and not isinstance(value, bool):
+            metrics[key] += value
+
+        else:
+            metrics[key] = value
+
+
 class BaseJsonReporter(base.BaseReporter):
     """Common base for JSON-backed family of reporters."""
 
@@ -126,6 +164,7 @@ class BaseJsonReporter(base.BaseReporter):
 
         self._metrics = NestingDict()
         self._next_dump = time.time() + self.REPORTING_PERIOD
+        self._send = None
 
         log.debug(
             "Initialized %s metrics reporter for instance %s, metrics "
@@ -153,6 +192,16 @@ class BaseJsonReporter(base.BaseReporter):
 
         self._next_dump = now + self.REPORTING_PERIOD
 
+        if self._send:
+            try:
+                self._send(dict(self._metrics))
+
+            except Exception as exc:
+                log.error("Failure while forwarding metrics: %s" % exc)
+
+            self._metrics.clear()
+            return
+
         self._metrics["format"] = self.REPORTING_FORMAT
         self._metrics["version"] = self.REPORTING_VERSION
         self._metrics["producer"] = self.PRODUCER_UUID
@@ -174,6 +223,16 @@ class BaseJsonReporter(base.BaseReporter):
 
         self._metrics.clear()
 
+    def forward(self, send):
+        """Hand accumulated metrics over to `send` instead of dumping them"""
+        self._send = send
+
+    def merge_metrics(self, metrics):
+        """Add up metrics accumulated elsewhere e.g. by worker process"""
+        merge_metrics(self._metrics, metrics)
+
+        self.flush()
+
 
 class MinimalJsonReporter(BaseJsonReporter):
     """Collect activity metrics and dump brief report.
@@ -208,7 +267,19 @@ class MinimalJsonReporter(BaseJsonReporter):
         },
         'data_files': {
             'total': 0,
-            'failures': 0
+            'failures': 0,
+            'handle_hits': 0,
+            'handle_misses': 0,
+            'handle_evictions': 0,
+            'walk_cache_hits': 0,
+            'walk_cache_misses': 0,
+            'walk_cache_evictions': 0,
+            'value_cache_hits': 0,
+            'value_cache_misses': 0,
+            'value_cache_evictions': 0,
+            'block_cache_hits': 0,
+            'block_cache_misses': 0,
+            'block_cache_evictions': 0
         }
     }
     """
@@ -265,6 +336,9 @@ class MinimalJsonReporter(BaseJsonReporter):
                 "datafile_failure_count", 0
             )
 
+            for param, counter in CACHE_COUNTERS.items():
+                metrics[counter] = metrics.get(counter, 0) + kwargs.get(param, 0)
+
             # TODO: some data is still not coming from snmpsim v2carch core
 
         except KeyError:
@@ -312,6 +386,18 @@ class FullJsonReporter(BaseJsonReporter):
                                                     'pdus': 0,
                                                     'varbinds': 0,
                                                     'failures': 0,
+                                                    'handle_hits': 0,
+                                                    'handle_misses': 0,
+                                                    'handle_evictions': 0,
+                                                    'walk_cache_hits': 0,
+                                                    'walk_cache_misses': 0,
+                                                    'walk_cache_evictions': 0,
+                                                    'value_cache_hits': 0,
+                                                    'value_cache_misses': 0,
+                                                    'value_cache_evictions': 0,
+                                                    'block_cache_hits': 0,
+                                                    'block_cache_misses': 0,
+                                                    'block_cache_evictions': 0,
                                                     '{variation_module}': {
                                                         'calls': 0,
                                                         'failures': 0
@@ -387,6 +473,8 @@ class FullJsonReporter(BaseJsonReporter):
             metrics["varbinds"] = metrics.get("varbinds", 0) + kwargs.get(
                 "varbind_count", 0
             )
+            for param, counter in CACHE_COUNTERS.items():
+                metrics[counter] = metrics.get(counter, 0) + kwargs.get(param, 0)
 
             metrics = metrics["variations"]
             metrics = metrics[kwargs["variation"]]
@@ -20,5 +20,11 @@ class BaseReporter:
         Reset all counters upon success.
         """
 
+    def forward(self, send):
+        """Hand accumulated metrics over to `send` instead of dumping them"""
+
+    def merge_metrics(self, metrics):
+        """Add up metrics accumulated elsewhere e.g. by worker process"""
+
     def __str__(self):
         return self.__class__.__name__
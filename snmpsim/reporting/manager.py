@@ -50,3 +50,13 @@ class ReportingManager:
     def update_metrics(cls, **kwargs):
         cls._reporter.update_metrics(**kwargs)
         cls._reporter.flush()
+
+    @classmethod
+    def forward(cls, send):
+        """Hand metrics over to `send` callable rather than dumping them"""
+        cls._reporter.forward(send)
+
+    @classmethod
+    def merge_metrics(cls, metrics):
+        """Add up metrics forwarded by another process"""
+        cls._reporter.merge_metrics(metrics)
@@ -0,0 +1,146 @@
+#
+# This file is part of snmpsim software.
+#
+# Copyright (c) 2010-2019, Ilya Etingof <etingof@gmail.com>
+# License: https://www.pysnmp.com/snmpsim/license.html
+#
+# Worker processes sharing SNMP endpoints
+#
+import asyncio
+import multiprocessing
+import os
+import signal
+from multiprocessing import connection
+
+from snmpsim import datafile
+from snmpsim import log
+from snmpsim.error import SnmpsimError
+from snmpsim.reporting.manager import ReportingManager
+
+# how often supervisor checks on workers, seconds
+POLL_INTERVAL = 1
+
+
+def fork_workers(count):
+    """Fork `count` worker processes and supervise them till they exit
+
+    Workers inherit all the state built up to the fork e.g. indexed data
+    files. In workers, returns `None` so that each of them goes on to
+    configure and run its own SNMP engine. Workers hand their activity
+    metrics over to the supervisor, which reports them as a whole.
+
+    In the supervisor, returns the exit code once all workers are gone.
+    """
+    if not hasattr(os, "fork"):
+        raise SnmpsimError("Worker processes are not supported on this system")
+
+    # positions of open files would be shared by workers
+    datafile.DataFile.handle_pool.close()
+
+    workers = {}
+
+    for worker_id in range(count):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+
+        pid = os.fork()
+
+        if not pid:
+            reader.close()
+
+            for other_reader in workers.values():
+                other_reader.close()
+
+            _start_worker(worker_id, writer)
+
+            return None
+
+        writer.close()
+
+        workers[pid] = reader
+
+        log.info("Worker #%d started, PID %d" % (worker_id, pid))
+
+    return _supervise(workers)
+
+
+def _start_worker(worker_id, writer):
+    # event loop of the supervisor must not be shared
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    ReportingManager.forward(writer.send)
+
+    log.info("Worker #%d is running, PID %d" % (worker_id, os.getpid()))
+
+
+def _drain(reader):
+    """Take in metrics left over by exited worker"""
+    try:
+        while reader.poll():
+            ReportingManager.merge_metrics(reader.recv())
+
+    except (EOFError, OSError):
+        pass
+
+
+def _supervise(workers):
+    stop_signals = []
+
+    def stop(signum, frame):
+        log.info("Stopping %d workers..." % len(workers))
+
+        stop_signals.append(signum)
+
+        for pid in workers:
+            try:
+                os.kill(pid, signum)
+
+            except OSError:
+                pass
+
+    handlers = {
+        signal.SIGTERM: signal.signal(signal.SIGTERM, stop),
+        # terminal delivers Ctrl-C to workers by itself
+        signal.SIGINT: signal.signal(signal.SIGINT, signal.SIG_IGN),
+    }
+
+    readers = list(workers.values())
+
+    rc = 0
+
+    while workers:
+        for reader in connection.wait(readers, POLL_INTERVAL):
+            try:
+                ReportingManager.merge_metrics(reader.recv())
+
+            except (EOFError, OSError):
+                readers.remove(reader)
+
+        while workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+
+            if not pid:
+                break
+
+            reader = workers.pop(pid)
+
+            if reader in readers:
+                readers.remove(reader)
+
+                _drain(reader)
+
+            reader.close()
+
+            exit_code = os.waitstatus_to_exitcode(status)
+
+            # killed by the signal supervisor was told to stop with
+            if exit_code and -exit_code not in stop_signals:
+                log.error("Worker PID %d exited with code %d" % (pid, exit_code))
+                rc = 1
+
+            else:
+                log.info("Worker PID %d exited" % pid)
+
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+    return rc
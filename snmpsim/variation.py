@@ -100,7 +100,9 @@ class SnmprecRecordMixIn:
 
         if not mod_name:
             if "dataValidation" in context:
-                snmprec.SnmprecRecord.evaluate_value(self, oid, tag, value, **context)
+                return snmprec.SnmprecRecord.evaluate_value(
+                    self, oid, tag, value, **context
+                )
 
             if (
                 not context["nextFlag"]
@@ -184,6 +186,15 @@ class CompressedSnmprecRecord(SnmprecRecordMixIn, snmprec.CompressedSnmprecRecor
 RECORD_TYPES[CompressedSnmprecRecord.ext] = CompressedSnmprecRecord()
 
 
+class BlockCompressedSnmprecRecord(
+    SnmprecRecordMixIn, snmprec.BlockCompressedSnmprecRecord
+):
+    pass
+
+
+RECORD_TYPES[BlockCompressedSnmprecRecord.ext] = BlockCompressedSnmprecRecord()
+
+
 def load_variation_modules(search_path, modules_options):
     variation_modules = {}
     modules_options = modules_options.copy()
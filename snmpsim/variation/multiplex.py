@@ -23,7 +23,7 @@ from snmpsim.record import snmprec
 from snmpsim.record import walk
 from snmpsim.record.search.database import RecordIndex
 from snmpsim.record.search.file import get_record
-from snmpsim.record.search.file import search_record_by_oid
+from snmpsim.record.search.oid import encode_oid
 from snmpsim.utils import split
 
 # data file types and parsers
@@ -240,20 +240,13 @@ def variate(oid, tag, value, **context):
 
     text, db = moduleContext[oid]["datafileobj"].get_handles()
 
-    textOid = str(rfc1902.OctetString(".".join(["%s" % x for x in context["origOid"]])))
+    position, exactMatch = moduleContext[oid]["datafileobj"].search(
+        encode_oid(context["origOid"])
+    )
 
-    try:
-        line = moduleContext[oid]["datafileobj"].lookup(textOid)
-
-    except KeyError:
-        offset = search_record_by_oid(context["origOid"], text, parser)
-        exactMatch = False
-
-    else:
-        offset, subtreeFlag, prevOffset = line.split(b",")
-        exactMatch = True
+    offset, subtreeFlag, _ = moduleContext[oid]["datafileobj"].entry(position)
 
-    text.seek(int(offset))
+    text.seek(offset)
 
     line, _, _ = get_record(text)  # matched line
 
@@ -0,0 +1,77 @@
+import gc
+
+import pytest
+from pyasn1.codec.ber import decoder
+from pyasn1.codec.ber import encoder
+from pyasn1.type import univ
+from pysnmp.proto import api
+from pysnmp.proto import rfc1902
+from pysnmp.smi import exval
+
+from snmpsim import ber
+
+VAR_BINDS = [
+    (univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0"), rfc1902.OctetString("Linux box")),
+    (univ.ObjectIdentifier("1.3.6.1.2.1.1.3.0"), rfc1902.TimeTicks(123999)),
+    (univ.ObjectIdentifier("1.3.6.1.2.1.2.2.1.10.1"), rfc1902.Counter64(2**64 - 1)),
+    (univ.ObjectIdentifier("1.3.6.1.4.1.1.0"), rfc1902.Integer32(-129)),
+    (univ.ObjectIdentifier("1.3.6.1.4.1.2.0"), exval.endOfMib),
+    (univ.ObjectIdentifier("1.3.6.1.4.1.3.0"), rfc1902.OctetString("x" * 300)),
+]
+
+
+@pytest.mark.parametrize("value", [0, 127, 128, -1, -128, -129, 2**31 - 1, -(2**31)])
+def test_encode_integer(value):
+    assert decoder.decode(ber.encode_integer(value))[0] == value
+
+
+@pytest.mark.parametrize("request_id", [0, 127, 128, -1, 2**31 - 1, -(2**31) + 1])
+@pytest.mark.parametrize("count", [0, 1, len(VAR_BINDS), 300])
+def test_encode_response_like_pyasn1(request_id, count):
+    p_mod = api.PROTOCOL_MODULES[api.SNMP_VERSION_2C]
+
+    var_binds = (VAR_BINDS * 50)[:count]
+
+    rsp_msg = p_mod.Message()
+    p_mod.apiMessage.set_defaults(rsp_msg)
+    p_mod.apiMessage.set_community(rsp_msg, "public")
+
+    rsp_pdu = p_mod.GetResponsePDU()
+    p_mod.apiPDU.set_defaults(rsp_pdu)
+    p_mod.apiPDU.set_request_id(rsp_pdu, request_id)
+    p_mod.apiPDU.set_varbinds(rsp_pdu, var_binds)
+
+    p_mod.apiMessage.set_pdu(rsp_msg, rsp_pdu)
+
+    var_bind_encoder = ber.VarBindEncoder()
+
+    assert ber.encode_response(
+        api.SNMP_VERSION_2C,
+        b"public",
+        request_id,
+        0,
+        0,
+        [var_bind_encoder.encode(*var_bind) for var_bind in var_binds],
+    ) == encoder.encode(rsp_msg)
+
+
+def test_var_bind_encoder_reuses_encodings():
+    var_bind_encoder = ber.VarBindEncoder()
+
+    for var_bind in VAR_BINDS * 2:
+        var_bind_encoder.encode(*var_bind)
+
+    assert var_bind_encoder.hits == var_bind_encoder.misses == len(VAR_BINDS)
+
+    # equal but distinct objects are encoded anew
+    oid = univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0")
+    value = rfc1902.OctetString("Linux box")
+
+    assert var_bind_encoder.encode(oid, value) == var_bind_encoder.encode(*VAR_BINDS[0])
+    assert var_bind_encoder.misses == len(VAR_BINDS) + 1
+
+    # encodings go away along with their values
+    del oid, value
+    gc.collect()
+
+    assert len(var_bind_encoder) == len(VAR_BINDS)
@@ -0,0 +1,124 @@
+import gzip
+
+import pytest
+from pyasn1.type import univ
+from pysnmp.proto import rfc1902
+from pysnmp.smi import exval
+
+from snmpsim import confdir
+from snmpsim import datafile
+from snmpsim import variation
+from snmpsim.cache import LruCache
+from snmpsim.error import SnmpsimError
+from snmpsim.record import bgzf
+
+RECORDS = b"".join(
+    b"1.3.6.1.4.1.20408.%d.0|4|value #%d\n" % (idx, idx) for idx in range(1, 1000)
+)
+
+
+@pytest.fixture
+def bgz_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(confdir, "cache", str(tmp_path))
+
+    path = str(tmp_path / "public.snmprec.bgz")
+
+    with bgzf.BgzfWriter(path, block_size=1024) as fl:
+        for start in range(0, len(RECORDS), 100):
+            fl.write(RECORDS[start : start + 100])
+
+    return path
+
+
+def test_bgzf_is_gzip_compatible(bgz_file):
+    with gzip.open(bgz_file) as fl:
+        assert fl.read() == RECORDS
+
+
+def test_bgzf_random_access(bgz_file, monkeypatch):
+    block_cache = LruCache(2, "block_cache")
+
+    monkeypatch.setattr(bgzf.BgzfReader, "block_cache", block_cache)
+
+    with bgzf.BgzfReader(bgz_file) as fl:
+        assert len(fl._block_offsets) > 1
+        assert fl.seek(0, 2) == len(RECORDS)
+
+        for offset in (0, 1023, 1024, 5000, len(RECORDS) - 5):
+            fl.seek(offset)
+            assert fl.read(3000) == RECORDS[offset : offset + 3000]
+
+            fl.seek(offset)
+            assert fl.readline() == RECORDS[offset : RECORDS.index(b"\n", offset) + 1]
+
+        fl.seek(0)
+        assert list(fl) == RECORDS.splitlines(True)
+
+    assert block_cache.hits and block_cache.misses and block_cache.evictions
+    assert len(block_cache) <= 2
+
+    metrics = block_cache.metrics()
+
+    assert metrics["block_cache_hit_count"] == block_cache.hits
+    assert metrics["block_cache_eviction_count"] == block_cache.evictions
+
+
+def test_bgzf_blocks_end_at_lines(bgz_file):
+    with bgzf.BgzfReader(bgz_file) as fl:
+        for index in range(len(fl._block_offsets)):
+            assert fl._block(index).endswith(b"\n")
+
+
+def test_bgzf_rejects_plain_file(tmp_path):
+    path = tmp_path / "public.snmprec.bgz"
+    path.write_bytes(RECORDS)
+
+    with pytest.raises(SnmpsimError):
+        bgzf.BgzfReader(str(path))
+
+
+def test_data_file_over_bgzf(bgz_file, monkeypatch):
+    metrics = []
+
+    monkeypatch.setattr(
+        datafile.ReportingManager,
+        "update_metrics",
+        lambda **kwargs: metrics.append(kwargs),
+    )
+
+    data = datafile.DataFile(bgz_file, variation.RECORD_TYPES["snmprec.bgz"], {})
+    data.index_text()
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.4.1.20408.500.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.4.1.20408.1000.0"), univ.Null("")),
+        ],
+        nextFlag=False,
+        setFlag=False,
+    )
+
+    assert var_binds[0][1] == rfc1902.OctetString("value #500")
+    assert var_binds[1][1] is exval.noSuchInstance
+
+    # blocks read are reported along with other caches activity
+    reported = metrics[-1]
+
+    assert reported["block_cache_hit_count"] + reported["block_cache_miss_count"]
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.4.1.20408.998.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.4.1.20408.999.0"), univ.Null("")),
+        ],
+        nextFlag=True,
+        setFlag=False,
+    )
+
+    assert var_binds[0] == (
+        univ.ObjectIdentifier("1.3.6.1.4.1.20408.999.0"),
+        rfc1902.OctetString("value #999"),
+    )
+    assert var_binds[1][1] is exval.endOfMib
+
+    data.close()
@@ -0,0 +1,58 @@
+from snmpsim.cache import LruCache
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LruCache(2)
+
+    cache.add("a", 1)
+    cache.add("b", 2)
+
+    assert cache.get("a") == 1
+
+    cache.add("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert list(cache) == ["c", "a"]
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 1, 1)
+
+    cache.clear()
+
+    assert not len(cache)
+    assert not cache.size
+
+
+def test_lru_cache_weighs_entries():
+    cache = LruCache(10, "test")
+
+    # too heavy to cache at all
+    cache.add("a", 1, weight=11)
+
+    assert "a" not in cache
+
+    cache.add("a", 1, weight=4)
+    cache.add("b", 2, weight=4)
+    cache.add("a", 3, weight=5)
+
+    assert cache.size == 9
+    assert cache.evict(2) == [("b", 2)]
+    assert cache.size == 5
+
+    cache.discard("a")
+
+    assert not cache.size
+
+    assert cache.metrics() == {
+        "test_hit_count": 0,
+        "test_miss_count": 0,
+        "test_eviction_count": 1,
+    }
+
+    cache.get("a")
+
+    assert cache.metrics() == {
+        "test_hit_count": 0,
+        "test_miss_count": 1,
+        "test_eviction_count": 0,
+    }
@@ -0,0 +1,203 @@
+import timeit
+
+from pyasn1.type import univ
+from pysnmp.entity import engine
+from pysnmp.entity.rfc3413 import cmdrsp
+from pysnmp.proto import rfc1902
+from pysnmp.smi import exval
+
+from snmpsim import confdir
+from snmpsim import controller
+from snmpsim import datafile
+from snmpsim import variation
+from snmpsim.commands import responder
+from snmpsim.context import RequestContext
+from snmpsim.context import VarBindContext
+
+
+def test_request_context_reads_like_dict():
+    context = RequestContext(securityName="public", nextFlag=True, dataValidation=1)
+
+    assert context["securityName"] == "public"
+    assert context.get("contextName") is None
+    assert "contextName" not in context
+
+    assert dict(context) == {
+        "securityName": "public",
+        "nextFlag": True,
+        "setFlag": False,
+        "dataValidation": 1,
+    }
+    assert context.as_dict() == dict(context)
+
+    var_bind_context = VarBindContext(context, "f", {}, exval.noSuchInstance, 2)
+
+    for oid in ("1.3.6", "1.3.7"):
+        var_bind_context.origOid = univ.ObjectIdentifier(oid)
+        var_bind_context.exactMatch = True
+
+        assert var_bind_context["origOid"] == univ.ObjectIdentifier(oid)
+        assert var_bind_context["exactMatch"] is True
+        assert var_bind_context["nextFlag"] is True
+        assert var_bind_context.as_dict() == dict(var_bind_context)
+        assert len(var_bind_context) == 13
+
+    # var-bind contexts are handed out as copies
+    var_bind_context.as_dict()["securityName"] = "private"
+
+    assert var_bind_context["securityName"] == "public"
+    assert context["securityName"] == "public"
+
+
+def test_var_bind_context_built_faster_than_dict_copy():
+    request = {
+        "snmpEngine": None,
+        "transportDomain": (1, 3, 6, 1, 6, 1, 1),
+        "transportAddress": ("127.0.0.1", 161),
+        "transportProtocol": "udpv4",
+        "securityModel": 2,
+        "securityName": "public",
+        "securityLevel": 1,
+        "contextEngineId": b"engine",
+        "contextName": b"public",
+        "pduType": "GetRequestPDU",
+        "nextFlag": False,
+        "setFlag": False,
+    }
+
+    oid, value = univ.ObjectIdentifier("1.3.6"), univ.Null("")
+
+    # var-binds used to get a copy of the request context each
+    def copy_context():
+        for _ in range(100):
+            context = request.copy()
+            context.update(
+                origOid=oid,
+                origValue=value,
+                dataFile="f",
+                subtreeFlag=False,
+                exactMatch=True,
+                variationModules={},
+                errorStatus=exval.noSuchInstance,
+                varsTotal=100,
+                varsRemaining=0,
+            )
+
+    def share_context():
+        var_bind_context = VarBindContext(
+            RequestContext(**request), "f", {}, exval.noSuchInstance, 100
+        )
+
+        for _ in range(100):
+            var_bind_context.origOid = oid
+            var_bind_context.origValue = value
+            var_bind_context.varsRemaining = 0
+            var_bind_context.subtreeFlag = False
+            var_bind_context.exactMatch = True
+            var_bind_context.as_dict()
+
+    # keyword arguments passed to variation modules cost the same
+    assert min(timeit.repeat(share_context, number=200, repeat=5)) <= min(
+        timeit.repeat(copy_context, number=200, repeat=5)
+    )
+
+
+def test_variation_module_gets_request_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(confdir, "cache", str(tmp_path))
+
+    path = tmp_path / "public.snmprec"
+    path.write_bytes(b"1.3.6.1.2.1.1.1.0|4:probe|\n1.3.6.1.2.1.1.3.0|67|1\n")
+
+    contexts = []
+
+    def variate(oid, tag, value, **context):
+        contexts.append(context)
+        return oid, tag, rfc1902.OctetString("probed")
+
+    variation_modules = {"probe": ({"variate": variate}, {}, {})}
+
+    data = datafile.DataFile(
+        str(path), variation.RECORD_TYPES["snmprec"], variation_modules
+    )
+    data.index_text()
+
+    try:
+        var_binds = data.process_var_binds(
+            [
+                (univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0"), univ.Null("")),
+                (univ.ObjectIdentifier("1.3.6.1.2.1.1.3.0"), univ.Null("")),
+            ],
+            nextFlag=False,
+            setFlag=False,
+            securityName="public",
+        )
+
+    finally:
+        data.close()
+
+    assert var_binds[0][1] == rfc1902.OctetString("probed")
+    assert var_binds[1][1] == rfc1902.TimeTicks(1)
+
+    (context,) = contexts
+
+    assert context["securityName"] == "public"
+    assert context["origOid"] == univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0")
+    assert context["exactMatch"] is True
+    assert context["dataFile"] == str(path)
+    assert (context["varsTotal"], context["varsRemaining"]) == (2, 1)
+
+
+def test_snmp_context_drops_resolved_contexts_on_change():
+    snmp_engine = engine.SnmpEngine()
+
+    snmp_context = responder.SnmpContext(snmp_engine)
+    snmp_context.context_cache.add("a", (None, "a", None))
+
+    snmp_context.register_context_name("public")
+
+    assert snmp_context.context_cache.get("a") is None
+
+    snmp_context.context_cache.add("a", (None, "a", None))
+
+    snmp_context.unregister_context_name("public")
+
+    assert snmp_context.context_cache.get("a") is None
+
+
+def test_command_responder_resolves_context_once(monkeypatch):
+    snmp_engine = engine.SnmpEngine()
+
+    snmp_context = responder.SnmpContext(snmp_engine)
+    snmp_context.register_context_name(
+        "public", controller.DataIndexInstrumController()
+    )
+
+    command_responder = responder.GetCommandResponder(snmp_engine, snmp_context)
+
+    monkeypatch.setattr(
+        snmp_engine.observer,
+        "get_execution_context",
+        lambda name: {
+            "transportDomain": (1, 3, 6, 1, 6, 1, 1, 0),
+            "transportAddress": ("127.0.0.1", 16100),
+            "contextEngineId": snmp_engine.snmpEngineID,
+            "contextName": univ.OctetString("public"),
+        },
+    )
+
+    operations = []
+
+    monkeypatch.setattr(
+        cmdrsp.GetCommandResponder,
+        "handle_management_operation",
+        lambda self, *args: operations.append(args[2]),
+    )
+
+    for _ in range(2):
+        command_responder.handle_management_operation(
+            snmp_engine, 1, univ.OctetString("public"), None
+        )
+
+    assert operations == [b"public", b"public"]
+    assert snmp_context.context_cache.misses == 1
+    assert snmp_context.context_cache.hits == 1
@@ -0,0 +1,82 @@
+import pytest
+
+from snmpsim import log
+from snmpsim.error import SnmpsimError
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = []
+
+    monkeypatch.setattr(log, "msg", messages.append)
+    monkeypatch.setattr(log, "log_level", log.LOG_INFO)
+    monkeypatch.setattr(log, "event_limits", {})
+
+    return messages
+
+
+def test_event_formats_on_emission(messages):
+    calls = []
+
+    def format_value(value):
+        calls.append(value)
+        return value * 2
+
+    log.event("request", "value %s, %d%%", log.Lazy(format_value, 21), 100)
+    log.event("request", "hidden %s", log.Lazy(format_value, 1), level=log.LOG_DEBUG)
+    log.event("failure", "failed", level=log.LOG_ERROR)
+
+    assert messages == ["value 42, 100% ", "ERROR failed "]
+    assert calls == [21]
+
+
+def test_event_not_formatted_unless_logger_set(monkeypatch):
+    calls = []
+
+    monkeypatch.setattr(log, "msg", log._discard)
+
+    log.event("request", "value %s", log.Lazy(calls.append, 1))
+
+    assert not log.enabled(log.LOG_ERROR)
+    assert not calls
+
+
+def test_event_limit(messages, monkeypatch):
+    log.set_event_limit("request:3")
+
+    for idx in range(7):
+        log.event("request", "request %d", idx)
+        log.event("response", "response %d", idx)
+
+    assert [m for m in messages if m.startswith("request")] == [
+        "request 2 (2 more request events skipped) ",
+        "request 5 (2 more request events skipped) ",
+    ]
+    assert len(messages) == 9
+
+    now = [100.0]
+
+    monkeypatch.setattr(log.time, "monotonic", lambda: now[0])
+
+    del messages[:]
+
+    log.set_event_limit("response:1:2")
+
+    for _ in range(5):
+        log.event("response", "response")
+
+    now[0] += 1
+
+    log.event("response", "response")
+
+    assert messages == [
+        "response ",
+        "response ",
+        "response (3 more response events skipped) ",
+    ]
+
+
+@pytest.mark.parametrize("spec", ["request", "request:0", "request:x", "a:1:-1:2"])
+def test_bad_event_limit(spec):
+    with pytest.raises(SnmpsimError):
+        log.set_event_limit(spec)
@@ -0,0 +1,1239 @@
+import bisect
+import io
+import json
+import os
+import random
+import threading
+
+import pytest
+from pyasn1.type import univ
+from pysnmp.proto import rfc1902
+from pysnmp.smi import exval
+
+from snmpsim import confdir
+from snmpsim import controller
+from snmpsim import datafile
+from snmpsim import variation
+from snmpsim.record.search.bloom import BloomFilter
+from snmpsim.record.search import database
+from snmpsim.record.search.bloom import build_filter
+from snmpsim.record.search.database import IndexManifest
+from snmpsim.record.search.database import RecordIndex
+from snmpsim.record.search.database import search_from
+from snmpsim.record.search.file import RecordScanner
+from snmpsim.record.search.file import get_record
+from snmpsim.record.search.oid import TextOidEncoder
+from snmpsim.record.search.oid import decode_oid
+from snmpsim.record.search.oid import encode_oid
+from snmpsim.record.search.oid import encode_text_oid
+
+RECORDS = b"""\
+1.3.6.1.2.1.1.1.0|4|Linux box
+1.3.6.1.2.1.1.3.0|67|123999
+# comment lines are not indexed
+1.3.6.1.2.1.1.5.0|4|test
+1.3.6.1.2.1.1.10.0|2|10
+1.3.6.1.2.1.2.1.0|2|2
+"""
+
+
+@pytest.fixture
+def data_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(confdir, "cache", str(tmp_path))
+
+    path = tmp_path / "public.snmprec"
+    path.write_bytes(RECORDS)
+
+    return str(path)
+
+
+def test_encode_oid_sorts_like_oid():
+    oids = [
+        (1, 3, 6),
+        (1, 3, 6, 0),
+        (1, 3, 6, 1),
+        (1, 3, 6, 255),
+        (1, 3, 6, 256),
+        (1, 3, 6, 4294967295),
+        (1, 3, 7),
+    ]
+
+    keys = [encode_oid(oid).ljust(32, b"\x00") for oid in oids]
+
+    assert keys == sorted(keys)
+
+    for oid in oids:
+        key = encode_oid(univ.ObjectIdentifier(oid))
+
+        assert decode_oid(key) == univ.ObjectIdentifier(oid)
+        assert encode_text_oid("." + ".".join(map(str, oid))) == key
+        assert encode_text_oid(".".join(map(str, oid)).encode()) == key
+
+    text_oid_encoder = TextOidEncoder()
+
+    for oid in oids + oids:
+        assert text_oid_encoder.encode(".".join(map(str, oid))) == encode_oid(oid)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, RecordScanner.CHUNK_SIZE])
+@pytest.mark.parametrize("ending", [b"", b"\n", b"\r\n"])
+def test_record_scanner(chunk_size, ending):
+    text = RECORDS.replace(b"\n", b"\r\n")[:-2] + b"\n\n  # trailing\n" + RECORDS
+
+    text = text.rstrip(b"\n") + ending
+
+    expected = []
+
+    with io.BytesIO(text) as fl:
+        line_no = offset = 0
+
+        while True:
+            line, line_no, offset = get_record(fl, line_no, offset)
+
+            if not line:
+                break
+
+            expected.append((line_no, offset, line.rstrip(b"\n")))
+
+            offset += len(line)
+
+    with io.BytesIO(text) as fl:
+        scanner = RecordScanner(fl, chunk_size=chunk_size)
+
+        assert [record for batch in scanner for record in batch] == expected
+
+    assert scanner.offset == len(text)
+    assert scanner.line_no == text.count(b"\n") + (ending == b"")
+
+
+def test_search_from_finds_like_bisect():
+    keys = list(range(0, 300, 3))
+
+    for lo in (0, 1, 10, 50, 99, 100):
+        for key in range(lo * 3, 305):
+            assert search_from(keys, key, lo) == bisect.bisect_left(keys, key)
+
+
+def test_record_index_search(data_file):
+    parser = variation.RECORD_TYPES["snmprec"]
+
+    index = RecordIndex(data_file, parser).create()
+    index.open()
+
+    try:
+        position, exact_match = index.search(encode_oid((1, 3, 6, 1, 2, 1, 1, 5, 0)))
+
+        assert exact_match
+        assert index.key(position) == encode_oid((1, 3, 6, 1, 2, 1, 1, 5, 0))
+
+        offset, subtree_flag, cover = index.entry(position)
+
+        assert RECORDS[offset:].startswith(b"1.3.6.1.2.1.1.5.0|")
+        assert not subtree_flag
+        assert cover == -1
+
+        next_offset, next_subtree_flag = index.successor(position)
+
+        assert RECORDS[next_offset:].startswith(b"1.3.6.1.2.1.1.10.0|")
+        assert not next_subtree_flag
+
+        position, exact_match = index.search(encode_oid((1, 3, 6, 1, 2, 1, 1, 6)))
+
+        assert not exact_match
+        assert index.key(position) == encode_oid((1, 3, 6, 1, 2, 1, 1, 10, 0))
+
+        position, exact_match = index.search(encode_oid((1, 3, 6, 1, 2, 1, 3)))
+
+        assert not exact_match
+        assert index.entry(position)[0] == len(RECORDS)
+
+        with pytest.raises(KeyError):
+            index.lookup((1, 3, 6, 1, 2, 1, 1, 2, 0))
+
+    finally:
+        index.close()
+
+
+SUBTREE_RECORDS = b"""\
+1.3.6.1.2.1.1.1.0|4|Linux box
+1.3.6.1.2.1.2|:sql|snmprec
+1.3.6.1.2.1.2.2.1.1.1|2|1
+1.3.6.1.2.1.2.2.1.2.1|4|eth0
+1.3.6.1.2.1.3.1.0|2|3
+"""
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_record_index_resolve(tmp_path, data_file, preload):
+    path = tmp_path / "subtree.snmprec"
+    path.write_bytes(SUBTREE_RECORDS)
+
+    data = datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    _, index = data._open_records()
+
+    def resolve(oid, next_flag):
+        return index.resolve(encode_oid(oid), next_flag)
+
+    try:
+        # exact match moves on to the next record unless serving subtree
+        assert resolve((1, 3, 6, 1, 2, 1, 1, 1, 0), False) == (0, True, False)
+        assert resolve((1, 3, 6, 1, 2, 1, 1, 1, 0), True) == (1, True, True)
+        assert resolve((1, 3, 6, 1, 2, 1, 2), True) == (1, True, True)
+        assert resolve((1, 3, 6, 1, 2, 1, 2, 2, 1, 2, 1), True) == (4, True, False)
+
+        # subtree record covers OIDs past the records nested in it
+        assert resolve((1, 3, 6, 1, 2, 1, 2, 1), False) == (1, False, True)
+        assert resolve((1, 3, 6, 1, 2, 1, 2, 2, 1, 1, 2), False) == (1, False, True)
+        assert resolve((1, 3, 6, 1, 2, 1, 2, 9), True) == (1, False, True)
+
+        # yet not OIDs past the subtree
+        assert resolve((1, 3, 6, 1, 2, 1, 3), True) == (4, False, False)
+        assert resolve((1, 3, 6, 1, 2, 1, 4), True) == (5, False, False)
+
+    finally:
+        data.close()
+
+
+NESTED_SUBTREE_RECORDS = b"""\
+1.3.6.1.2.1.1.1.0|4|Linux box
+1.3.6.1.2.1.2|:sql|snmprec
+1.3.6.1.2.1.2.2.1.1.1|2|1
+1.3.6.1.2.1.2.2.1.5|:multiplex|dir=ifSpeed
+1.3.6.1.2.1.2.2.1.5.1|66|100000000
+1.3.6.1.2.1.2.2.1.7.1|2|1
+1.3.6.1.2.1.3.1.0|2|3
+"""
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_record_index_resolve_nested_subtrees(tmp_path, data_file, preload):
+    path = tmp_path / "nested.snmprec"
+    path.write_bytes(NESTED_SUBTREE_RECORDS)
+
+    data = datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    _, index = data._open_records()
+
+    def resolve(oid):
+        return index.resolve(encode_oid(univ.ObjectIdentifier(oid)))
+
+    try:
+        assert resolve("1.3.6.1.2.1.2.2.1.5.1") == (4, True, False)
+
+        # the innermost subtree serves OIDs within it
+        assert resolve("1.3.6.1.2.1.2.2.1.5.9") == (3, False, True)
+
+        # enclosing subtree serves OIDs past the nested one
+        assert resolve("1.3.6.1.2.1.2.2.1.6") == (1, False, True)
+        assert resolve("1.3.6.1.2.1.2.2.1.9") == (1, False, True)
+
+        assert resolve("1.3.6.1.2.1.4") == (7, False, False)
+
+    finally:
+        data.close()
+
+
+def test_bloom_filter():
+    keys = [encode_text_oid("1.3.6.1.4.1.%d" % idx) for idx in range(1000)]
+
+    bloom_filter = BloomFilter(b"xx" + build_filter(keys[::2]), 2)
+
+    assert all(key in bloom_filter for key in keys[::2])
+
+    false_positives = sum(key in bloom_filter for key in keys[1::2])
+
+    assert false_positives < len(keys) // 2 * 0.03
+
+    assert not BloomFilter(build_filter([]))
+    assert keys[0] not in BloomFilter(build_filter([]))
+
+
+def test_record_index_absent(tmp_path, data_file):
+    path = tmp_path / "nested.snmprec"
+    path.write_bytes(NESTED_SUBTREE_RECORDS)
+
+    data = datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    _, index = data._open_records()
+
+    def absent(oid):
+        return index.absent(encode_text_oid(oid))
+
+    try:
+        assert not absent("1.3.6.1.2.1.1.1.0")
+        assert not absent("1.3.6.1.2.1.3.1.0")
+
+        # subtree records serve OIDs within them
+        assert not absent("1.3.6.1.2.1.2.2.1.5.9")
+        assert not absent("1.3.6.1.2.1.2.300.1")
+
+        assert absent("1.3.6.1.2.1.1.2.0")
+        assert absent("1.3.6.1.2.1.3.1.1")
+        assert absent("1.3.6.1.2.1")
+
+    finally:
+        data.close()
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_data_file_get_and_getnext(data_file, preload):
+    data = datafile.DataFile(data_file, variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.6.0"), univ.Null("")),
+        ],
+        nextFlag=False,
+        setFlag=False,
+    )
+
+    assert var_binds[0] == (
+        univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"),
+        rfc1902.OctetString("test"),
+    )
+    assert var_binds[1][1] is exval.noSuchInstance
+
+    if not preload:
+        # absent OIDs are not looked up in the data file
+        data._read_record = None
+
+        var_binds = data.process_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.2.1.1.6.0"), univ.Null(""))],
+            nextFlag=False,
+            setFlag=False,
+        )
+
+        assert var_binds[0][1] is exval.noSuchInstance
+
+        del data._read_record
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.6"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.2.1.0"), univ.Null("")),
+        ],
+        nextFlag=True,
+        setFlag=False,
+    )
+
+    assert var_binds[0] == (
+        univ.ObjectIdentifier("1.3.6.1.2.1.1.10.0"),
+        rfc1902.Integer32(10),
+    )
+    assert var_binds[1][0] == univ.ObjectIdentifier("1.3.6.1.2.1.1.10.0")
+    assert var_binds[2][1] is exval.endOfMib
+
+    data.close()
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_getnext_past_subtree_out_of_data(tmp_path, monkeypatch, preload):
+    monkeypatch.setattr(confdir, "cache", str(tmp_path))
+
+    path = tmp_path / "public.snmprec"
+    path.write_bytes(
+        b"1.3.6.1.1|2|1\n1.3.6.1.2|:m|0\n1.3.6.1.2.1|2|5\n1.3.6.1.2.2|2|6\n"
+    )
+
+    def variate(oid, tag, value, **context):
+        return oid, tag, exval.endOfMib
+
+    variation_modules = {"m": ({"variate": variate}, {}, {})}
+
+    data = datafile.DataFile(
+        str(path), variation.RECORD_TYPES["snmprec"], variation_modules
+    )
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    try:
+        # static record under the subtree does not follow the request
+        var_binds = data.process_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.2.1.5"), univ.Null(""))],
+            nextFlag=True,
+            setFlag=False,
+        )
+
+        assert var_binds[0] == (
+            univ.ObjectIdentifier("1.3.6.1.2.2"),
+            rfc1902.Integer32(6),
+        )
+
+        var_binds = data.process_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.2.0"), univ.Null(""))],
+            nextFlag=True,
+            setFlag=False,
+        )
+
+        assert var_binds[0] == (
+            univ.ObjectIdentifier("1.3.6.1.2.1"),
+            rfc1902.Integer32(5),
+        )
+
+        assert [str(oid) for oid, _ in _walk(data)] == [
+            "1.3.6.1.1",
+            "1.3.6.1.2.1",
+            "1.3.6.1.2.2",
+        ]
+
+    finally:
+        data.close()
+
+
+def _walk(data, oid="1.3.6"):
+    var_binds = [(univ.ObjectIdentifier(oid), univ.Null(""))]
+
+    while True:
+        var_binds = data.process_var_binds(var_binds, nextFlag=True, setFlag=False)
+
+        if var_binds[0][1] is exval.endOfMib:
+            return
+
+        yield var_binds[0]
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_walk_cache_resumes_walks(monkeypatch, data_file, preload):
+    monkeypatch.setattr(datafile.DataFile, "walk_cache_size", 2)
+
+    data = datafile.DataFile(data_file, variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    walk_cache = data._walk_cache
+
+    try:
+        oids = [vb[0] for vb in _walk(data)]
+
+        assert oids == [
+            univ.ObjectIdentifier(line.split(b"|")[0].decode())
+            for line in RECORDS.splitlines()
+            if not line.startswith(b"#")
+        ]
+
+        # all but the first request resume the walk
+        assert walk_cache.hits == len(oids)
+        assert walk_cache.misses == 1
+        assert not walk_cache.evictions
+        assert not len(walk_cache)
+
+        # interleaved walks share the cache
+        walks = _walk(data), _walk(data, "1.3.6.1.2.1.1.5")
+
+        assert next(walks[0])[0] == oids[0]
+        assert next(walks[1])[0] == oids[2]
+        assert next(walks[0])[0] == oids[1]
+        assert next(walks[1])[0] == oids[3]
+
+        assert walk_cache.hits == len(oids) + 2
+        assert not walk_cache.evictions
+
+        # one walk too many pushes out the least recently moved one
+        next(_walk(data))
+
+        assert walk_cache.evictions == 1
+        # evicted walk goes on searching the index
+        assert next(walks[0])[0] == oids[2]
+        assert walk_cache.misses == 5
+
+        # counters changes are reported along with each request
+        assert set(walk_cache.metrics().values()) == {0}
+
+    finally:
+        data.close()
+
+    assert not len(walk_cache)
+
+
+def _reindex(data):
+    """Have data file change noticed, wait for its index to get updated"""
+    data._record_index._next_check_time = 0
+    data._record_index.get_handles()
+    data._record_index.wait_update()
+
+
+def test_walk_cache_survives_data_file_change(tmp_path, data_file):
+    data = datafile.DataFile(data_file, variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    walk = _walk(data)
+
+    try:
+        assert next(walk)[0] == univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0")
+
+        # record the walk is about to resume at moves
+        with open(data_file, "wb") as fl:
+            fl.write(b"1.3.6.1.2.1.1.0.0|4|new\n" + RECORDS)
+
+        os.utime(data_file, (0, 0))
+
+        _reindex(data)
+
+        assert next(walk)[0] == univ.ObjectIdentifier("1.3.6.1.2.1.1.3.0")
+
+    finally:
+        data.close()
+
+
+def test_value_cache_serves_static_records(monkeypatch, data_file):
+    value_cache = datafile.ValueCache(max_size=2 * datafile.ValueCache.ENTRY_OVERHEAD)
+
+    monkeypatch.setattr(datafile.DataFile, "value_cache", value_cache)
+
+    metrics = []
+
+    monkeypatch.setattr(
+        datafile.ReportingManager,
+        "update_metrics",
+        lambda **kwargs: metrics.append(kwargs),
+    )
+
+    data = datafile.DataFile(data_file, variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    def get(*oids):
+        return [
+            vb[1]
+            for vb in data.process_var_binds(
+                [(univ.ObjectIdentifier(oid), univ.Null("")) for oid in oids],
+                nextFlag=False,
+                setFlag=False,
+            )
+        ]
+
+    try:
+        assert get("1.3.6.1.2.1.1.5.0") == [rfc1902.OctetString("test")]
+        assert (value_cache.hits, value_cache.misses) == (0, 1)
+
+        assert get("1.3.6.1.2.1.1.5.0") == [rfc1902.OctetString("test")]
+        assert (value_cache.hits, value_cache.misses) == (1, 1)
+
+        # counters changes are reported along with each request
+        assert metrics[-1]["value_cache_hit_count"] == 1
+        assert metrics[-1]["value_cache_miss_count"] == 0
+
+        # absent OIDs are rejected without reading records
+        assert get("1.3.6.1.2.1.1.4.0") == [exval.noSuchInstance]
+        assert value_cache.hits == 1
+
+        # memory budget holds just one record with its text
+        assert get("1.3.6.1.2.1.1.1.0", "1.3.6.1.2.1.1.5.0") == [
+            rfc1902.OctetString("Linux box"),
+            rfc1902.OctetString("test"),
+        ]
+        assert len(value_cache) == 1
+        assert value_cache.evictions == 1
+        assert value_cache.size <= value_cache.max_size
+
+        # records of changed data file are evaluated anew
+        with open(data_file, "wb") as fl:
+            fl.write(RECORDS.replace(b"|test", b"|TEST"))
+
+        os.utime(data_file, (0, 0))
+
+        _reindex(data)
+
+        assert get("1.3.6.1.2.1.1.5.0") == [rfc1902.OctetString("TEST")]
+
+    finally:
+        data.close()
+
+
+@pytest.mark.parametrize("preload", [False, True])
+@pytest.mark.parametrize("next_flag", [False, True])
+def test_data_file_serves_var_binds_in_one_pass(
+    monkeypatch, tmp_path, data_file, preload, next_flag
+):
+    path = tmp_path / "many.snmprec"
+    path.write_bytes(RECORDS + _make_records(300))
+
+    data = datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    oids = [
+        "1.3.6.1.2.1.1.5.0",
+        "1.3.6.1.2.1.1.4.0",
+        "1.3.6.1.4.1.1.250",
+        "1.3.6.1.4.1.2.95.0",
+        "1.3.6.1.9",
+    ] + ["1.3.6.1.4.1.%d.%d.0" % (idx // 100, idx % 100) for idx in range(0, 300, 7)]
+
+    oids += oids[:3]
+
+    random.Random(7).shuffle(oids)
+
+    var_binds = [(univ.ObjectIdentifier(oid), univ.Null("")) for oid in oids]
+
+    expected = []
+
+    for var_bind in var_binds:
+        expected.extend(
+            data.process_var_binds([var_bind], nextFlag=next_flag, setFlag=False)
+        )
+
+    evaluate_record = data._evaluate_record
+
+    calls = []
+
+    def _evaluate_record(record, context):
+        calls.append((context["origOid"], context["varsRemaining"]))
+        return evaluate_record(record, context)
+
+    monkeypatch.setattr(data, "_evaluate_record", _evaluate_record)
+
+    try:
+        assert (
+            data.process_var_binds(var_binds, nextFlag=next_flag, setFlag=False)
+            == expected
+        )
+
+        # variation modules see var-binds in request order
+        remaining = [call[1] for call in calls]
+
+        assert remaining == sorted(set(remaining), reverse=True)
+
+        for oid, vars_remaining in calls:
+            assert var_binds[len(var_binds) - vars_remaining - 1][0] == oid
+
+    finally:
+        data.close()
+
+
+def _get_bulk_by_getnext(data, var_binds, non_repeaters, max_repetitions):
+    rsp_var_binds = data.process_var_binds(
+        var_binds[:non_repeaters], nextFlag=True, setFlag=False
+    )
+
+    var_binds = var_binds[non_repeaters:]
+
+    for _ in range(max_repetitions):
+        var_binds = data.process_var_binds(var_binds, nextFlag=True, setFlag=False)
+        rsp_var_binds.extend(var_binds)
+
+    return rsp_var_binds
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_data_file_get_bulk(tmp_path, data_file, preload):
+    path = tmp_path / "bulk.snmprec"
+    path.write_bytes(RECORDS + _make_records(300))
+
+    data = datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    var_binds = [
+        (univ.ObjectIdentifier("1.3.6.1.2.1.1.3.0"), univ.Null("")),
+        (univ.ObjectIdentifier("1.3.6.1.2.1.1.5"), univ.Null("")),
+        (univ.ObjectIdentifier("1.3.6.1.4.1.1.98"), univ.Null("")),
+        (univ.ObjectIdentifier("1.3.6.1.4.1.2.95.0"), univ.Null("")),
+    ]
+
+    try:
+        for non_repeaters, max_repetitions in ((0, 10), (1, 3), (2, 20), (4, 5)):
+            expected = _get_bulk_by_getnext(
+                data, var_binds, non_repeaters, max_repetitions
+            )
+
+            assert (
+                data.process_bulk_var_binds(
+                    var_binds, non_repeaters, max_repetitions, setFlag=False
+                )
+                == expected
+            )
+
+        # response size is capped
+        var_binds = data.process_bulk_var_binds(
+            var_binds, 1, 100, max_var_binds=31, setFlag=False
+        )
+
+        assert len(var_binds) == 1 + 3 * 10
+
+        # walk stops once all repeaters run out of records
+        var_binds = data.process_bulk_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.4.1.2.98.0"), univ.Null(""))],
+            0,
+            10,
+            setFlag=False,
+        )
+
+        assert [vb[1] for vb in var_binds[1:]] == [exval.endOfMib]
+
+    finally:
+        data.close()
+
+
+def test_index_data_files_in_parallel(tmp_path, data_file):
+    data_files = []
+
+    for name in ("one", "two", "three"):
+        path = tmp_path / (name + ".snmprec")
+        path.write_bytes(RECORDS)
+
+        data_files.append(
+            datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+        )
+
+    datafile.index_data_files(data_files, workers=2)
+
+    for data in data_files:
+        assert data.is_ready()
+
+        var_binds = data.process_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"), univ.Null(""))],
+            nextFlag=False,
+            setFlag=False,
+        )
+
+        assert var_binds[0][1] == rfc1902.OctetString("test")
+
+        data.close()
+
+
+def test_index_data_files_hashes_same_size_only(tmp_path, data_file, monkeypatch):
+    hashed = []
+
+    def hash_file(text_file):
+        hashed.append(os.path.basename(text_file))
+        return digest(text_file)
+
+    digest = database.hash_file
+
+    monkeypatch.setattr(database, "hash_file", hash_file)
+    monkeypatch.setattr(RecordIndex, "_digests", {})
+
+    data_files = []
+
+    for name, records in (
+        ("one", RECORDS),
+        ("two", RECORDS),
+        ("three", RECORDS + RECORDS),
+    ):
+        path = tmp_path / (name + ".snmprec")
+        path.write_bytes(records)
+
+        data_files.append(
+            datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+        )
+
+    datafile.index_data_files(data_files, workers=2)
+
+    # data file of unique size gets hashed by index builder process
+    assert sorted(hashed) == ["one.snmprec", "two.snmprec"]
+
+    assert data_files[0].index_file == data_files[1].index_file
+    assert data_files[2].index_file != data_files[0].index_file
+    assert data_files[2].digest() == digest(str(tmp_path / "three.snmprec"))
+
+    assert len(hashed) == 2
+
+
+def test_index_manifest_lists_data_file_digest(tmp_path, data_file):
+    parser = variation.RECORD_TYPES["snmprec"]
+
+    index = RecordIndex(data_file, parser).create()
+
+    manifest = IndexManifest(str(tmp_path))
+    manifest.add(data_file, index.index_file, index.digest())
+    manifest.save()
+
+    manifest = IndexManifest(str(tmp_path)).load()
+
+    assert len(manifest) == 1
+    assert manifest.digest(data_file, os.stat(data_file)) == index.digest()
+
+    # data file copied elsewhere gets a new modification time
+    inode = os.stat(data_file)
+    os.utime(data_file, (inode.st_atime + 60, inode.st_mtime + 60))
+
+    assert manifest.digest(data_file, os.stat(data_file)) is None
+
+    # yet its index is still found by contents
+    assert RecordIndex(data_file, parser).create().index_file == index.index_file
+
+
+def test_record_index_shared_by_same_data_files(tmp_path, data_file):
+    parser = variation.RECORD_TYPES["snmprec"]
+
+    copy = tmp_path / "copy.snmprec"
+    copy.write_bytes(RECORDS)
+
+    link = tmp_path / "link.snmprec"
+    link.symlink_to(data_file)
+
+    indices = [
+        RecordIndex(path, parser).create() for path in (data_file, str(copy), str(link))
+    ]
+
+    assert len(set(index.index_file for index in indices)) == 1
+    assert len(list(tmp_path.glob("*.idx"))) == 1
+
+    for index in indices:
+        index.get_handles()
+
+    try:
+        assert indices[0].get_handles()[1] is indices[1].get_handles()[1]
+
+        # text files are shared by the same inode only
+        assert indices[0].get_handles()[0] is not indices[1].get_handles()[0]
+        assert indices[0].get_handles()[0] is indices[2].get_handles()[0]
+
+    finally:
+        for index in indices:
+            index.close()
+
+
+def test_handle_pool_closes_least_recently_used(tmp_path, monkeypatch, data_file):
+    pool = datafile.HandlePool(max_open=2, check_interval=60)
+
+    monkeypatch.setattr(datafile.DataFile, "handle_pool", pool)
+
+    data_files = []
+
+    for name in ("one", "two", "three"):
+        path = tmp_path / (name + ".snmprec")
+        path.write_bytes(RECORDS.replace(b"test", name.encode()))
+
+        data_files.append(
+            datafile.DataFile(str(path), variation.RECORD_TYPES["snmprec"], {})
+        )
+
+    one, two, three = data_files
+
+    def get(data):
+        return data.process_var_binds(
+            [(univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"), univ.Null(""))],
+            nextFlag=False,
+            setFlag=False,
+        )[0][1]
+
+    try:
+        get(one)
+        get(two)
+        get(one)
+        get(three)
+
+        # the hottest data file survives
+        assert one in pool and three in pool and two not in pool
+        assert (pool.hits, pool.misses, pool.evictions) == (1, 3, 1)
+
+        # data file changes are noticed once check interval passes
+        path = tmp_path / "one.snmprec"
+        path.write_bytes(RECORDS.replace(b"test", b"changed"))
+        os.utime(path, (0, 0))
+
+        assert get(one) == rfc1902.OctetString("one")
+
+        monkeypatch.setattr(pool, "check_interval", 0)
+
+        _reindex(one)
+
+        assert get(one) == rfc1902.OctetString("changed")
+
+        assert (pool.hits, pool.misses, pool.evictions) == (3, 3, 1)
+
+        # counters changes are reported along with each request
+        assert set(pool.metrics().values()) == {0}
+
+    finally:
+        for data in data_files:
+            data.close()
+
+    assert not len(pool)
+
+
+def _make_records(count, value=b"x" * 40):
+    return b"".join(
+        b"1.3.6.1.4.1.%d.%d.0|4|%s\n" % (idx // 100, idx % 100, value)
+        for idx in range(count)
+    )
+
+
+def _insert_line(data, line):
+    middle = data.index(b"\n", len(data) // 2) + 1
+
+    return data[:middle] + line + data[middle:]
+
+
+def _index_entries(index):
+    index.open()
+
+    try:
+        return [
+            (index.key(position), index.entry(position))
+            for position in range(len(index._keys))
+        ]
+
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        lambda data: _make_records(5000),
+        lambda data: data.replace(
+            b"1.3.6.1.4.1.20.5.0|4|x", b"1.3.6.1.4.1.20.5.0|4|yy"
+        ),
+        lambda data: data.replace(b"1.3.6.1.4.1.0.1.0|4|" + b"x" * 40 + b"\n", b""),
+        lambda data: _insert_line(data, b"# comment\n"),
+        lambda data: _insert_line(data, b"1.3.6.1.4.1.20.5.1|4|new\n"),
+    ],
+)
+def test_record_index_incremental_update(tmp_path, monkeypatch, data_file, edit):
+    parser = variation.RECORD_TYPES["snmprec"]
+
+    data = _make_records(4000)
+
+    with open(data_file, "wb") as fl:
+        fl.write(data)
+
+    index = RecordIndex(data_file, parser).create()
+
+    with open(data_file, "wb") as fl:
+        fl.write(edit(data))
+
+    index._update = update = _Spy(index._update)
+    index.create()
+
+    assert update.result
+
+    updated_entries = _index_entries(index)
+
+    monkeypatch.setattr(confdir, "cache", str(tmp_path / "fresh"))
+
+    os.mkdir(confdir.cache)
+
+    assert updated_entries == _index_entries(RecordIndex(data_file, parser).create())
+
+
+def test_record_index_updated_in_background(monkeypatch, data_file):
+    index = RecordIndex(data_file, variation.RECORD_TYPES["snmprec"])
+
+    text, mm = index.get_handles()
+
+    old_index_file = index.index_file
+
+    updating = threading.Event()
+
+    def updated(func=index._updated):
+        updating.wait(10)
+        return func()
+
+    monkeypatch.setattr(index, "_updated", updated)
+
+    try:
+        with open(data_file, "wb") as fl:
+            fl.write(RECORDS.replace(b"|test", b"|TEST"))
+
+        os.utime(data_file, (0, 0))
+
+        # old index keeps serving while the new one is being built
+        assert index.get_handles() == (text, mm)
+        assert index.get_handles() == (text, mm)
+        assert index.index_file == old_index_file
+
+        updating.set()
+        index._update_future.result()
+
+        assert index.get_handles()[1] is not mm
+        assert index.index_file != old_index_file
+        assert not os.path.exists(old_index_file)
+
+    finally:
+        updating.set()
+        index.close()
+
+
+def test_record_index_removes_previous_index(tmp_path, data_file):
+    parser = variation.RECORD_TYPES["snmprec"]
+
+    index = RecordIndex(data_file, parser).create()
+
+    for idx in range(5):
+        with open(data_file, "ab") as fl:
+            fl.write(b"1.3.6.1.2.1.3.%d.0|2|%d\n" % (idx, idx))
+
+        index.create()
+
+    assert list(tmp_path.glob("*.idx")) == [tmp_path / index.index_file]
+
+    # index open for a copy of data file stays
+    copy = tmp_path / "copy.snmprec"
+    copy.write_bytes(open(data_file, "rb").read())
+
+    copy_index = RecordIndex(str(copy), parser)
+    copy_index.get_handles()
+
+    shared_index_file = index.index_file
+
+    with open(data_file, "ab") as fl:
+        fl.write(b"1.3.6.1.2.1.4.1.0|2|1\n")
+
+    index.create()
+    copy_index.close()
+
+    assert os.path.exists(shared_index_file)
+
+    # index listed in manifest stays
+    listed_index_file = index.index_file
+
+    IndexManifest.get(str(tmp_path)).add(data_file, listed_index_file, index.digest())
+
+    with open(data_file, "ab") as fl:
+        fl.write(b"1.3.6.1.2.1.4.2.0|2|2\n")
+
+    index.create()
+
+    assert os.path.exists(listed_index_file)
+    assert len(list(tmp_path.glob("*.idx"))) == 3
+
+
+class _Spy:
+    def __init__(self, func):
+        self.func = func
+        self.result = None
+
+    def __call__(self, *args, **kwargs):
+        self.result = self.func(*args, **kwargs)
+        return self.result
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_overlay_data_file(tmp_path, data_file, preload):
+    overlay_file = tmp_path / "device.snmprec"
+    overlay_file.write_bytes(
+        b"#!base public.snmprec\n1.3.6.1.2.1.1.5.0|4|device\n1.3.6.1.2.1.1.6.0|4|lab\n"
+    )
+
+    data = datafile.open_data_file(
+        str(overlay_file), variation.RECORD_TYPES["snmprec"], {}
+    )
+
+    assert data.layout == "overlay"
+
+    data.index_text()
+
+    if preload:
+        data.preload()
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.5.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.7.0"), univ.Null("")),
+        ],
+        nextFlag=False,
+        setFlag=False,
+    )
+
+    assert var_binds[0][1] == rfc1902.OctetString("device")
+    assert var_binds[1][1] == rfc1902.OctetString("Linux box")
+    assert var_binds[2][1] is exval.noSuchInstance
+
+    oid = univ.ObjectIdentifier("1.3.6")
+    walk = []
+
+    while True:
+        ((oid, value),) = data.process_var_binds(
+            [(oid, univ.Null(""))], nextFlag=True, setFlag=False
+        )
+
+        if value is exval.endOfMib:
+            break
+
+        walk.append((str(oid), str(value)))
+
+    assert walk == [
+        ("1.3.6.1.2.1.1.1.0", "Linux box"),
+        ("1.3.6.1.2.1.1.3.0", "123999"),
+        ("1.3.6.1.2.1.1.5.0", "device"),
+        ("1.3.6.1.2.1.1.6.0", "lab"),
+        ("1.3.6.1.2.1.1.10.0", "10"),
+        ("1.3.6.1.2.1.2.1.0", "2"),
+    ]
+
+    var_binds = data.process_bulk_var_binds(
+        [(univ.ObjectIdentifier("1.3.6"), univ.Null(""))], 0, 10, setFlag=False
+    )
+
+    assert [(str(oid), str(value)) for oid, value in var_binds[:-1]] == walk
+    assert var_binds[-1][1] is exval.endOfMib
+
+    data.close()
+
+
+def test_walk_data_file_served_off_snmprec_copy(tmp_path, data_file, monkeypatch):
+    monkeypatch.setattr(datafile.DataFile.handle_pool, "check_interval", 0)
+
+    walk_file = tmp_path / "device.snmpwalk"
+    walk_file.write_bytes(
+        b".1.3.6.1.2.1.1.1.0 = STRING: Linux box\n"
+        b".1.3.6.1.2.1.1.3.0 = Timeticks: (123999) 0:20:39.99\n"
+        b".1.3.6.1.2.1.2.2.1.3.1 = INTEGER: ethernetCsmacd(6)\n"
+    )
+
+    data = datafile.open_data_file(
+        str(walk_file), variation.RECORD_TYPES["snmpwalk"], {}
+    )
+
+    snmprec_file = data.served_file
+
+    assert data.text_file == str(walk_file)
+    assert os.path.dirname(snmprec_file) == str(tmp_path)
+    assert snmprec_file.endswith(".snmpwalk.snmprec")
+    assert data.index_text().index_file.endswith(".snmprec.idx")
+
+    var_binds = data.process_var_binds(
+        [
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.1.3.0"), univ.Null("")),
+            (univ.ObjectIdentifier("1.3.6.1.2.1.2.2.1.3"), univ.Null("")),
+        ],
+        nextFlag=False,
+        setFlag=False,
+    )
+
+    data.close()
+
+    assert var_binds[0][1] == rfc1902.OctetString("Linux box")
+    assert var_binds[1][1] == rfc1902.TimeTicks(123999)
+    assert var_binds[2][1] is exval.noSuchInstance
+
+    # converted copy is reused till the original changes
+    os.utime(snmprec_file, (0, 0))
+
+    data = datafile.open_data_file(
+        str(walk_file), variation.RECORD_TYPES["snmpwalk"], {}
+    )
+
+    assert data.served_file == snmprec_file
+    assert os.stat(snmprec_file).st_mtime == 0
+
+    get_var_binds = [(univ.ObjectIdentifier("1.3.6.1.2.1.1.1.0"), univ.Null(""))]
+
+    var_binds = data.index_text().process_var_binds(
+        get_var_binds, nextFlag=False, setFlag=False
+    )
+
+    assert var_binds[0][1] == rfc1902.OctetString("Linux box")
+
+    # original edited while open gets converted anew
+    walk_file.write_bytes(b".1.3.6.1.2.1.1.1.0 = STRING: Linux\n")
+    os.utime(walk_file, ns=(0, 10**9))
+
+    var_binds = data.process_var_binds(get_var_binds, nextFlag=False, setFlag=False)
+
+    assert var_binds[0][1] == rfc1902.OctetString("Linux")
+    assert data.text_file == str(walk_file)
+    assert data.served_file != snmprec_file
+
+    # previous conversion is gone along with its index
+    assert not os.path.exists(snmprec_file)
+    assert list(tmp_path.glob("*.snmpwalk.snmprec")) == [tmp_path / data.served_file]
+    assert list(tmp_path.glob("*.idx")) == [tmp_path / data.index_file]
+
+    with open(data.served_file, "rb") as fl:
+        assert fl.read() == b"1.3.6.1.2.1.1.1.0|4|Linux\n"
+
+    data.close()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("shard_size", [1 << 24, 40])
+def test_validate_data_files(tmp_path, data_file, workers, shard_size):
+    overlay_file = tmp_path / "device.snmprec"
+    overlay_file.write_bytes(
+        b"#!base public.snmprec\n"
+        b"1.3.6.1.2.1.1.5.0|4|device\n"
+        b"1.3.6.1.2.1.1.6.0|2|lab\n"
+        b"\n"
+        b"1.3.6.1.2.1.1.7.0|2:numeric|value=1\n"
+        b"1.3.6.1.2.1.1.8.0|2:counter|value=1\n"
+        b"1.3.6.1.2.1.1.9.0\n"
+    )
+
+    data = datafile.OverlayDataFile(
+        str(overlay_file),
+        variation.RECORD_TYPES["snmprec"],
+        {"numeric": None},
+        data_file,
+        variation.RECORD_TYPES["snmprec"],
+    )
+
+    report_file = tmp_path / "report.json"
+
+    errors = datafile.validate_data_files(
+        [data], workers, str(report_file), shard_size=shard_size
+    )
+
+    assert [(line_no, oid) for _, line_no, oid, _ in errors] == [
+        (3, "1.3.6.1.2.1.1.6.0"),
+        (6, "1.3.6.1.2.1.1.8.0"),
+        (7, None),
+    ]
+
+    with open(report_file) as fl:
+        report = json.load(fl)
+
+    assert report["files"] == 2
+    assert report["records"] == 10
+    assert [error["file"] for error in report["errors"]] == [str(overlay_file)] * 3
+    assert "counter" in report["errors"][1]["error"]
+
+
+def test_data_index_controller():
+    index = controller.DataIndexInstrumController()
+
+    index.add_data_file("/data/public.snmprec", "public")
+    index.add_data_file("/data/private.snmprec", "private")
+
+    oid = univ.ObjectIdentifier("1.3.6.1.4.1.20408.999.1.1.2")
+
+    assert index.read_variables((oid, univ.Null(""))) == [
+        (oid, rfc1902.OctetString("/data/private.snmprec"))
+    ]
+
+    var_binds = [(univ.ObjectIdentifier("1.3.6.1.4.1.20408.999"), univ.Null(""))]
+
+    walk = []
+
+    while True:
+        var_binds = index.read_next_variables(*var_binds)
+
+        if var_binds[0][1] is exval.endOfMib:
+            break
+
+        walk.append((str(var_binds[0][0]), str(var_binds[0][1])))
+
+    assert walk == [
+        ("1.3.6.1.4.1.20408.999.1.1.1", "/data/public.snmprec"),
+        ("1.3.6.1.4.1.20408.999.1.1.2", "/data/private.snmprec"),
+        ("1.3.6.1.4.1.20408.999.1.2.1", "public"),
+        ("1.3.6.1.4.1.20408.999.1.2.2", "private"),
+    ]
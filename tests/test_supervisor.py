@@ -0,0 +1,104 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from snmpsim import endpoints
+from snmpsim import supervisor
+from snmpsim.reporting.formats import alljson
+from snmpsim.reporting.manager import ReportingManager
+
+
+def test_merge_metrics():
+    metrics = alljson.NestingDict(
+        first_update=20,
+        last_update=30,
+        data_files={"total": 2, "failures": 1},
+        transport_domain="1.3.6",
+    )
+
+    alljson.merge_metrics(
+        metrics,
+        {
+            "first_update": 10,
+            "last_update": 25,
+            "data_files": {"total": 3, "handle_hits": 4},
+            "transport_domain": "1.3.6.1",
+            "agents": {"total": 1},
+        },
+    )
+
+    assert metrics == {
+        "first_update": 10,
+        "last_update": 30,
+        "data_files": {"total": 5, "failures": 1, "handle_hits": 4},
+        "transport_domain": "1.3.6.1",
+        "agents": {"total": 1},
+    }
+
+
+@pytest.mark.skipif(
+    not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT is not supported"
+)
+@pytest.mark.parametrize(
+    "family, endpoints_class, host, address",
+    [
+        (socket.AF_INET, endpoints.IPv4TransportEndpoints, "127.0.0.1", "%s:%d"),
+        (socket.AF_INET6, endpoints.IPv6TransportEndpoints, "::1", "[%s]:%d"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_endpoints_share_port(family, endpoints_class, host, address):
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.bind((host, 0))
+
+        except OSError:
+            pytest.skip("%s is not available" % host)
+
+        address %= host, sock.getsockname()[1]
+
+    first = endpoints_class(reuse_port=True).add(address)
+    second = endpoints_class(reuse_port=True).add(address)
+
+    try:
+        # sockets get wired up by event loop
+        await asyncio.sleep(0.1)
+
+        for transport, _ in (first, second):
+            assert transport.transport.get_extra_info("socket").family == family
+        assert first[1] == second[1] == address
+
+    finally:
+        first[0].close_transport()
+        second[0].close_transport()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork() is not supported")
+def test_fork_workers_aggregates_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        ReportingManager,
+        "_reporter",
+        alljson.MinimalJsonReporter(str(tmp_path), "3600"),
+    )
+
+    rc = supervisor.fork_workers(2)
+
+    if rc is None:
+        try:
+            # report right away
+            ReportingManager._reporter._next_dump = 0
+            ReportingManager.update_metrics(
+                datafile_call_count=1, transport_call_count=1
+            )
+
+        finally:
+            os._exit(0)
+
+    assert rc == 0
+
+    metrics = ReportingManager._reporter._metrics
+
+    assert metrics["data_files"]["total"] == 2
+    assert metrics["transports"]["total"] == 2